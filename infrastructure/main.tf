@@ -19,6 +19,37 @@ resource "aws_s3_bucket" "document-input-bucket" {
   }
 }
 
+# Browser uploads PUT parts straight to S3 with presigned URLs and need to read
+# each part's ETag to complete a multipart upload.
+resource "aws_s3_bucket_cors_configuration" "document-input-bucket-cors" {
+  bucket = aws_s3_bucket.document-input-bucket.id
+
+  cors_rule {
+    allowed_headers = ["*"]
+    allowed_methods = ["PUT"]
+    allowed_origins = ["*"]
+    expose_headers  = ["ETag"]
+    max_age_seconds = 3000
+  }
+}
+
+# Multipart uploads that are never completed or aborted keep their parts (and
+# their storage cost) until this rule removes them.
+resource "aws_s3_bucket_lifecycle_configuration" "document-input-bucket-lifecycle" {
+  bucket = aws_s3_bucket.document-input-bucket.id
+
+  rule {
+    id     = "abort-incomplete-multipart-uploads"
+    status = "Enabled"
+
+    filter {}
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 resource "aws_s3_bucket" "textract-output-bucket" {
   bucket        = "docuinsight-textract-output-bucket"
   force_destroy = true
@@ -27,6 +58,25 @@ resource "aws_s3_bucket" "textract-output-bucket" {
   }
 }
 
+# Part PDFs of fanned-out documents are only needed until their Textract jobs
+# have run; the orchestrator writes them under this prefix.
+resource "aws_s3_bucket_lifecycle_configuration" "textract-output-bucket-lifecycle" {
+  bucket = aws_s3_bucket.textract-output-bucket.id
+
+  rule {
+    id     = "expire-fanout-parts"
+    status = "Enabled"
+
+    filter {
+      prefix = "fanout_parts/"
+    }
+
+    expiration {
+      days = 7
+    }
+  }
+}
+
 resource "aws_s3_bucket_cors_configuration" "textract-output-bucket-cors" {
   bucket = aws_s3_bucket.textract-output-bucket.id
 
@@ -49,11 +99,75 @@ resource "aws_dynamodb_table" "document-metadata-table" {
     type = "S"
   }
 
+  attribute {
+    name = "content_hash"
+    type = "S"
+  }
+
+  # Lets the orchestrator find an already-processed upload with identical content.
+  global_secondary_index {
+    name               = "content_hash-index"
+    hash_key           = "content_hash"
+    projection_type    = "INCLUDE"
+    non_key_attributes = ["status", "s3_path"]
+  }
+
   tags = {
     Name = "DocuInsight-Document-Metadata"
   }
 }
 
+resource "aws_dynamodb_table" "query-embedding-cache-table" {
+  name         = "DocuInsight-Query-Embedding-Cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Name = "DocuInsight-Query-Embedding-Cache"
+  }
+}
+
+resource "aws_dynamodb_table" "chunk-embedding-cache-table" {
+  name         = "DocuInsight-Chunk-Embedding-Cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  tags = {
+    Name = "DocuInsight-Chunk-Embedding-Cache"
+  }
+}
+
+# Checkpoints of the reindex backfill job (one item per run).
+resource "aws_dynamodb_table" "reindex-runs-table" {
+  name         = "DocuInsight-Reindex-Runs"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "run_id"
+
+  attribute {
+    name = "run_id"
+    type = "S"
+  }
+
+  tags = {
+    Name = "DocuInsight-Reindex-Runs"
+  }
+}
+
 resource "aws_sns_topic" "textract-notification-topic" {
   name = "DocuInsight-Textract-Notification-Topic"
   tags = {
@@ -157,6 +271,20 @@ resource "aws_iam_role_policy" "orchestrator-lambda-policy" {
         ]
         Resource = "*"
       },
+      {
+        Effect = "Allow"
+        Action = [
+          "dynamodb:Query",
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:DeleteItem" # Content hash claims
+        ]
+        Resource = [
+          aws_dynamodb_table.document-metadata-table.arn,
+          "${aws_dynamodb_table.document-metadata-table.arn}/index/*"
+        ]
+      },
       {
         Effect = "Allow"
         Action = [
@@ -229,16 +357,36 @@ resource "aws_lambda_function" "orchestrator-lambda" {
   handler       = "lambda_function.handler"
   runtime       = "python3.12"
   timeout       = 900
+  memory_size   = 1024
+
+  # Large PDFs are downloaded to /tmp and split into page ranges there (TEXTRACT_FANOUT_*).
+  ephemeral_storage {
+    size = 4096
+  }
 
   environment {
     variables = {
-      TEXTRACT_OUTPUT_S3_BUCKET   = aws_s3_bucket.textract-output-bucket.bucket
-      TEXTRACT_SNS_TOPIC_ARN      = aws_sns_topic.textract-notification-topic.arn
-      TEXTRACT_SNS_TOPIC_ROLE_ARN = aws_iam_role.textract-service-publish-role.arn
+      TEXTRACT_OUTPUT_S3_BUCKET      = aws_s3_bucket.textract-output-bucket.bucket
+      TEXTRACT_SNS_TOPIC_ARN         = aws_sns_topic.textract-notification-topic.arn
+      TEXTRACT_SNS_TOPIC_ROLE_ARN    = aws_iam_role.textract-service-publish-role.arn
+      TEXTRACT_OUTPUT_S3_PREFIX      = "textract_output"
+      TEXTRACT_FANOUT_PAGE_THRESHOLD = "100"
+      TEXTRACT_FANOUT_PAGES_PER_PART = "50"
+      TEXTRACT_FANOUT_CONCURRENCY    = "5"
+      TEXTRACT_FANOUT_PARTS_PREFIX   = "fanout_parts"
+      DYNAMODB_TABLE_NAME            = aws_dynamodb_table.document-metadata-table.name
+      CONTENT_HASH_INDEX_NAME        = "content_hash-index"
+      DEDUP_HASH_MODE                = "etag"
+      LOG_LEVEL                      = "INFO"
+      METRICS_NAMESPACE              = "DocuInsight"
+      EVENT_LOG_SAMPLE_RATE          = "0.01"
     }
   }
   filename         = "../src/orchestrator_lambda/lambda_function.zip"
   source_code_hash = filebase64sha256("../src/orchestrator_lambda/lambda_function.zip")
+  layers = [
+    aws_lambda_layer_version.shared-layer.arn
+  ]
 }
 
 resource "aws_lambda_permission" "allow-s3-to-trigger-orchestrator-lambda" {
@@ -301,13 +449,17 @@ resource "aws_s3_bucket_policy" "textract-output-bucket-policy" {
 resource "aws_sqs_queue" "lambda_dlq" {
   name = "lambda-dead-letter-queue"
 }
+# Records the processor has no time left for are returned as batch item failures
+# and count as a receive, so the queue allows several receives before the DLQ.
+# The visibility timeout is 6x the processor's timeout, as AWS recommends for
+# SQS event sources.
 resource "aws_sqs_queue" "textract-notification-queue" {
   name                       = "DocuInsight-Textract-Notification-Queue"
-  visibility_timeout_seconds = 200
+  visibility_timeout_seconds = 6 * aws_lambda_function.processor-lambda.timeout
 
   redrive_policy = jsonencode({
     deadLetterTargetArn = aws_sqs_queue.lambda_dlq.arn
-    maxReceiveCount     = 2
+    maxReceiveCount     = 5
   })
   tags = {
     Name = "DocuInsight-Textract-Notification-Queue"
@@ -396,7 +548,12 @@ resource "aws_sagemaker_model" "embeddings-model" {
 
   primary_container {
     image = "${aws_ecr_repository.sagemaker-embeddings-repo.repository_url}:latest"
-
+    environment = {
+      EMBEDDING_BACKEND = "onnx" # int8 ONNX Runtime; "torch" for the fp32 SentenceTransformer
+      BATCHING_ENABLED  = "true"
+      BATCH_MAX_SIZE    = "64"
+      BATCH_MAX_WAIT_MS = "5"
+    }
   }
 
   tags = {
@@ -493,6 +650,20 @@ resource "aws_iam_role_policy" "processor-lambda-policy" {
         Effect   = "Allow",
         Resource = "${aws_s3_bucket.textract-output-bucket.arn}/*" # Allow reading from Textract output bucket
       },
+      {
+        Action = [
+          "s3:ListBucket"
+        ],
+        Effect   = "Allow",
+        Resource = aws_s3_bucket.textract-output-bucket.arn # Allow listing a job's Textract output objects
+      },
+      {
+        Action = [
+          "s3:PutObject"
+        ],
+        Effect   = "Allow",
+        Resource = "${aws_s3_bucket.textract-output-bucket.arn}/vector-store/*" # Vector store segments
+      },
       {
         Action = [
           "sagemaker:InvokeEndpoint"
@@ -509,6 +680,14 @@ resource "aws_iam_role_policy" "processor-lambda-policy" {
         Effect   = "Allow",
         Resource = aws_dynamodb_table.document-metadata-table.arn
       },
+      {
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem"
+        ],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.chunk-embedding-cache-table.arn
+      },
       {
         Effect = "Allow",
         Action = [
@@ -530,6 +709,16 @@ resource "aws_lambda_layer_version" "numpy-layer" {
 
   source_code_hash = filebase64sha256("../src/numpy-layer/lambda-layer.zip")
 }
+
+# Code shared by all Lambdas (metrics, ...). Zip the contents of src/shared_layer
+# so that the package ends up under python/docuinsight/ in the archive.
+resource "aws_lambda_layer_version" "shared-layer" {
+  filename            = "../src/shared_layer/shared-layer.zip"
+  layer_name          = "docuinsight-shared"
+  compatible_runtimes = ["python3.12"]
+
+  source_code_hash = filebase64sha256("../src/shared_layer/shared-layer.zip")
+}
 resource "aws_lambda_function" "processor-lambda" {
   function_name = "docuinsight-processor-lambda"
   handler       = "lambda_function.lambda_handler"
@@ -542,14 +731,33 @@ resource "aws_lambda_function" "processor-lambda" {
   source_code_hash = filebase64sha256("../src/processor_lambda/lambda_function.zip")
   layers = [
     aws_lambda_layer_version.numpy-layer.arn, # Include the numpy layer
+    aws_lambda_layer_version.shared-layer.arn,
   ]
 
   environment {
     variables = {
-      SAGEMAKER_ENDPOINT_NAME    = aws_sagemaker_endpoint.embeddings-endpoint.name
-      DYNAMODB_TABLE_NAME        = aws_dynamodb_table.document-metadata-table.name
-      OPENSEARCH_DOMAIN_ENDPOINT = replace(aws_opensearch_domain.document-search-domain.endpoint, "https://", "")
-      LOG_LEVEL                  = "INFO"
+      SAGEMAKER_ENDPOINT_NAME      = aws_sagemaker_endpoint.embeddings-endpoint.name
+      DYNAMODB_TABLE_NAME          = aws_dynamodb_table.document-metadata-table.name
+      OPENSEARCH_DOMAIN_ENDPOINT   = replace(aws_opensearch_domain.document-search-domain.endpoint, "https://", "")
+      OPENSEARCH_INDEX_NAME        = "index"
+      OPENSEARCH_VECTOR_DATA_TYPE  = "float"
+      OPENSEARCH_FIELDS_INDEX_NAME = "fields"
+      LOG_LEVEL                    = "INFO"
+      METRICS_NAMESPACE            = "DocuInsight"
+      EVENT_LOG_SAMPLE_RATE        = "0.01"
+      CHUNK_MAX_TOKENS             = "200"
+      CHUNK_OVERLAP_TOKENS         = "40"
+      EMBEDDING_BATCH_SIZE         = "64"
+      TEXTRACT_OUTPUT_S3_BUCKET    = aws_s3_bucket.textract-output-bucket.bucket
+      TEXTRACT_OUTPUT_S3_PREFIX    = "textract_output"
+      MAX_WORKERS                  = "4"
+      EMBEDDING_MODEL_ID           = "all-MiniLM-L6-v2"
+      EMBEDDING_CACHE_BACKEND      = "dynamodb"
+      EMBEDDING_CACHE_TABLE        = aws_dynamodb_table.chunk-embedding-cache-table.name
+      EMBEDDING_WIRE_FORMAT        = "application/x-embeddings-f32"
+      VECTOR_STORE_BUCKET          = aws_s3_bucket.textract-output-bucket.bucket
+      VECTOR_STORE_PREFIX          = "vector-store"
+      VECTOR_STORE_DTYPE           = "float16"
     }
   }
 
@@ -560,8 +768,12 @@ resource "aws_lambda_function" "processor-lambda" {
 resource "aws_lambda_event_source_mapping" "processor-lambda-sqs-trigger" {
   event_source_arn = aws_sqs_queue.textract-notification-queue.arn
   function_name    = aws_lambda_function.processor-lambda.arn
-  batch_size       = 1 # Process one SQS message at a time for now
+  batch_size       = 10 # Records of a batch are processed concurrently by the processor
   enabled          = true
+
+  maximum_batching_window_in_seconds = 5
+  function_response_types            = ["ReportBatchItemFailures"] # Only failed messages are redelivered
+
   depends_on = [
     aws_lambda_function.processor-lambda,
     aws_sqs_queue.textract-notification-queue,
@@ -578,6 +790,279 @@ resource "aws_lambda_permission" "allow-sqs-to-invoke-processor-lambda" {
   source_arn    = aws_sqs_queue.textract-notification-queue.arn
 }
 
+# Reindex backfill job: rebuilds the chunk index from the stored Textract output
+# with the processor's code (same package, handler backfill.lambda_handler).
+# Start it with {"action": "start"}; it checkpoints and re-invokes itself.
+resource "aws_iam_role" "backfill-lambda-role" {
+  name = "docuinsight-backfill-lambda-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action = "sts:AssumeRole",
+        Effect = "Allow",
+        Principal = {
+          Service = "lambda.amazonaws.com"
+        }
+      }
+    ]
+  })
+
+  tags = {
+    Name = "docuinsight-backfill-lambda-role"
+  }
+}
+
+resource "aws_iam_role_policy" "backfill-lambda-policy" {
+  name = "docuinsight-backfill-lambda-policy"
+  role = aws_iam_role.backfill-lambda-role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "*"
+      },
+      {
+        Action = [
+          "textract:GetDocumentAnalysis"
+        ],
+        Effect   = "Allow",
+        Resource = "*"
+      },
+      {
+        Action = [
+          "s3:GetObject"
+        ],
+        Effect   = "Allow",
+        Resource = "${aws_s3_bucket.textract-output-bucket.arn}/*"
+      },
+      {
+        Action = [
+          "s3:ListBucket"
+        ],
+        Effect   = "Allow",
+        Resource = aws_s3_bucket.textract-output-bucket.arn
+      },
+      {
+        Action = [
+          "sagemaker:InvokeEndpoint"
+        ],
+        Effect   = "Allow",
+        Resource = aws_sagemaker_endpoint.embeddings-endpoint.arn
+      },
+      {
+        Action = [
+          "dynamodb:Scan",
+          "dynamodb:UpdateItem"
+        ],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.document-metadata-table.arn
+      },
+      {
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
+        ],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.reindex-runs-table.arn
+      },
+      {
+        Action = [
+          "dynamodb:BatchGetItem",
+          "dynamodb:BatchWriteItem"
+        ],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.chunk-embedding-cache-table.arn
+      },
+      {
+        Action = [
+          "lambda:InvokeFunction"
+        ],
+        Effect   = "Allow",
+        Resource = "arn:aws:lambda:${data.aws_region.current.name}:${data.aws_caller_identity.current.account_id}:function:docuinsight-backfill-lambda"
+      },
+      {
+        Effect = "Allow",
+        Action = [
+          "es:*"
+        ],
+        Resource = [
+          aws_opensearch_domain.document-search-domain.arn,
+          "${aws_opensearch_domain.document-search-domain.arn}/*"
+        ]
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_function" "backfill-lambda" {
+  function_name = "docuinsight-backfill-lambda"
+  handler       = "backfill.lambda_handler"
+  runtime       = "python3.12"
+  role          = aws_iam_role.backfill-lambda-role.arn
+  timeout       = 900
+  memory_size   = 1024
+  # Never more than one invocation: a run is advanced by a single chain of invocations.
+  reserved_concurrent_executions = 1
+  filename                       = "../src/processor_lambda/lambda_function.zip"
+  source_code_hash               = filebase64sha256("../src/processor_lambda/lambda_function.zip")
+  layers = [
+    aws_lambda_layer_version.numpy-layer.arn,
+    aws_lambda_layer_version.shared-layer.arn,
+  ]
+
+  environment {
+    variables = {
+      SAGEMAKER_ENDPOINT_NAME        = aws_sagemaker_endpoint.embeddings-endpoint.name
+      DYNAMODB_TABLE_NAME            = aws_dynamodb_table.document-metadata-table.name
+      OPENSEARCH_DOMAIN_ENDPOINT     = replace(aws_opensearch_domain.document-search-domain.endpoint, "https://", "")
+      OPENSEARCH_INDEX_NAME          = "index"
+      OPENSEARCH_VECTOR_DATA_TYPE    = "float"
+      LOG_LEVEL                      = "INFO"
+      METRICS_NAMESPACE              = "DocuInsight"
+      CHUNK_MAX_TOKENS               = "200"
+      CHUNK_OVERLAP_TOKENS           = "40"
+      EMBEDDING_BATCH_SIZE           = "64"
+      TEXTRACT_OUTPUT_S3_BUCKET      = aws_s3_bucket.textract-output-bucket.bucket
+      TEXTRACT_OUTPUT_S3_PREFIX      = "textract_output"
+      EMBEDDING_MODEL_ID             = "all-MiniLM-L6-v2"
+      EMBEDDING_CACHE_BACKEND        = "dynamodb"
+      EMBEDDING_CACHE_TABLE          = aws_dynamodb_table.chunk-embedding-cache-table.name
+      EMBEDDING_WIRE_FORMAT          = "application/x-embeddings-f32"
+      REINDEX_TABLE_NAME             = aws_dynamodb_table.reindex-runs-table.name
+      BACKFILL_INDEX_PREFIX          = "docuinsight-chunks"
+      BACKFILL_WORKERS               = "2"
+      BACKFILL_PAGE_SIZE             = "20"
+      BACKFILL_EMBEDDINGS_PER_SECOND = "50"
+    }
+  }
+
+  tags = {
+    Name = "docuinsight-backfill-lambda"
+  }
+}
+
+# Vector store compaction: folds the processor's per-document segments into a
+# new base generation (same package, handler compaction.lambda_handler). Runs on
+# a schedule and compacts once VECTOR_STORE_COMPACT_MIN_SEGMENTS have accumulated.
+resource "aws_iam_role" "compaction-lambda-role" {
+  name = "docuinsight-compaction-lambda-role"
+
+  assume_role_policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Action = "sts:AssumeRole",
+        Effect = "Allow",
+        Principal = {
+          Service = "lambda.amazonaws.com"
+        }
+      }
+    ]
+  })
+
+  tags = {
+    Name = "docuinsight-compaction-lambda-role"
+  }
+}
+
+resource "aws_iam_role_policy" "compaction-lambda-policy" {
+  name = "docuinsight-compaction-lambda-policy"
+  role = aws_iam_role.compaction-lambda-role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17",
+    Statement = [
+      {
+        Effect = "Allow"
+        Action = [
+          "logs:CreateLogGroup",
+          "logs:CreateLogStream",
+          "logs:PutLogEvents"
+        ]
+        Resource = "*"
+      },
+      {
+        Action = [
+          "s3:GetObject",
+          "s3:PutObject",
+          "s3:DeleteObject"
+        ],
+        Effect   = "Allow",
+        Resource = "${aws_s3_bucket.textract-output-bucket.arn}/vector-store/*"
+      },
+      {
+        Action = [
+          "s3:ListBucket"
+        ],
+        Effect    = "Allow",
+        Resource  = aws_s3_bucket.textract-output-bucket.arn
+        Condition = {
+          StringLike = { "s3:prefix" = ["vector-store/*"] }
+        }
+      }
+    ]
+  })
+}
+
+resource "aws_lambda_function" "compaction-lambda" {
+  function_name = "docuinsight-compaction-lambda"
+  handler       = "compaction.lambda_handler"
+  runtime       = "python3.12"
+  role          = aws_iam_role.compaction-lambda-role.arn
+  timeout       = 900
+  memory_size   = 2048
+  # compact() must not run concurrently with itself.
+  reserved_concurrent_executions = 1
+  filename                       = "../src/processor_lambda/lambda_function.zip"
+  source_code_hash               = filebase64sha256("../src/processor_lambda/lambda_function.zip")
+  layers = [
+    aws_lambda_layer_version.numpy-layer.arn,
+    aws_lambda_layer_version.shared-layer.arn,
+  ]
+
+  environment {
+    variables = {
+      LOG_LEVEL                         = "INFO"
+      METRICS_NAMESPACE                 = "DocuInsight"
+      VECTOR_STORE_BUCKET               = aws_s3_bucket.textract-output-bucket.bucket
+      VECTOR_STORE_PREFIX               = "vector-store"
+      VECTOR_STORE_DTYPE                = "float16"
+      VECTOR_STORE_COMPACT_MIN_SEGMENTS = "50"
+    }
+  }
+
+  tags = {
+    Name = "docuinsight-compaction-lambda"
+  }
+}
+
+resource "aws_cloudwatch_event_rule" "compaction-schedule" {
+  name                = "docuinsight-vector-store-compaction"
+  schedule_expression = "rate(15 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "compaction-target" {
+  rule = aws_cloudwatch_event_rule.compaction-schedule.name
+  arn  = aws_lambda_function.compaction-lambda.arn
+}
+
+resource "aws_lambda_permission" "allow-eventbridge-to-invoke-compaction-lambda" {
+  statement_id  = "AllowEventBridgeToInvokeCompactionLambda"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.compaction-lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compaction-schedule.arn
+}
+
 data "aws_region" "current" {}
 
 resource "aws_cloudwatch_log_resource_policy" "opensearch_log_policy" {
@@ -749,6 +1234,50 @@ resource "aws_api_gateway_integration" "search-lambda-integration" {
   uri                     = aws_lambda_function.api-handler-lambda.invoke_arn 
 }
 
+resource "aws_api_gateway_resource" "search-batch-resource" {
+  rest_api_id = aws_api_gateway_rest_api.main-api.id
+  parent_id   = aws_api_gateway_resource.search-resource.id
+  path_part   = "batch"
+}
+
+resource "aws_api_gateway_method" "search-batch-method" {
+  rest_api_id   = aws_api_gateway_rest_api.main-api.id
+  resource_id   = aws_api_gateway_resource.search-batch-resource.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "search-batch-lambda-integration" {
+  rest_api_id             = aws_api_gateway_rest_api.main-api.id
+  resource_id             = aws_api_gateway_resource.search-batch-resource.id
+  http_method             = aws_api_gateway_method.search-batch-method.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.api-handler-lambda.invoke_arn
+}
+
+resource "aws_api_gateway_resource" "fields-resource" {
+  rest_api_id = aws_api_gateway_rest_api.main-api.id
+  parent_id   = aws_api_gateway_rest_api.main-api.root_resource_id
+  path_part   = "fields"
+}
+
+resource "aws_api_gateway_method" "fields-method" {
+  rest_api_id   = aws_api_gateway_rest_api.main-api.id
+  resource_id   = aws_api_gateway_resource.fields-resource.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "fields-lambda-integration" {
+  rest_api_id             = aws_api_gateway_rest_api.main-api.id
+  resource_id             = aws_api_gateway_resource.fields-resource.id
+  http_method             = aws_api_gateway_method.fields-method.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.api-handler-lambda.invoke_arn
+}
+
 resource "aws_api_gateway_resource" "upload-resource" {
   rest_api_id = aws_api_gateway_rest_api.main-api.id
   parent_id   = aws_api_gateway_rest_api.main-api.root_resource_id
@@ -771,6 +1300,28 @@ resource "aws_api_gateway_integration" "upload-lambda-integration" {
   uri                     = aws_lambda_function.api-handler-lambda.invoke_arn 
 }
 
+resource "aws_api_gateway_resource" "upload-complete-resource" {
+  rest_api_id = aws_api_gateway_rest_api.main-api.id
+  parent_id   = aws_api_gateway_resource.upload-resource.id
+  path_part   = "complete"
+}
+
+resource "aws_api_gateway_method" "upload-complete-method" {
+  rest_api_id   = aws_api_gateway_rest_api.main-api.id
+  resource_id   = aws_api_gateway_resource.upload-complete-resource.id
+  http_method   = "POST"
+  authorization = "NONE"
+}
+
+resource "aws_api_gateway_integration" "upload-complete-lambda-integration" {
+  rest_api_id             = aws_api_gateway_rest_api.main-api.id
+  resource_id             = aws_api_gateway_resource.upload-complete-resource.id
+  http_method             = aws_api_gateway_method.upload-complete-method.http_method
+  integration_http_method = "POST"
+  type                    = "AWS_PROXY"
+  uri                     = aws_lambda_function.api-handler-lambda.invoke_arn
+}
+
 resource "aws_api_gateway_deployment" "main-api-deployment" {
   rest_api_id = aws_api_gateway_rest_api.main-api.id
   triggers = {
@@ -778,9 +1329,18 @@ resource "aws_api_gateway_deployment" "main-api-deployment" {
       aws_api_gateway_resource.search-resource.id,
       aws_api_gateway_method.search-method.id,
       aws_api_gateway_integration.search-lambda-integration.id,
+      aws_api_gateway_resource.search-batch-resource.id,
+      aws_api_gateway_method.search-batch-method.id,
+      aws_api_gateway_integration.search-batch-lambda-integration.id,
+      aws_api_gateway_resource.fields-resource.id,
+      aws_api_gateway_method.fields-method.id,
+      aws_api_gateway_integration.fields-lambda-integration.id,
       aws_api_gateway_resource.upload-resource.id,
       aws_api_gateway_method.upload-method.id,
       aws_api_gateway_integration.upload-lambda-integration.id,
+      aws_api_gateway_resource.upload-complete-resource.id,
+      aws_api_gateway_method.upload-complete-method.id,
+      aws_api_gateway_integration.upload-complete-lambda-integration.id,
     ]))
   }
   lifecycle {
@@ -874,10 +1434,44 @@ resource "aws_iam_role_policy" "api-handler-lambda-policy" { # Renamed policy
       },
       {
         Action = [
-          "s3:PutObject"
+          "s3:PutObject",
+          "s3:AbortMultipartUpload",
+          "s3:ListMultipartUploadParts"
+        ],
+        Effect   = "Allow",
+        Resource = "${aws_s3_bucket.document-input-bucket.arn}/*" # Allow putting objects (and multipart uploads) into the input bucket
+      },
+      {
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem"
         ],
         Effect   = "Allow",
-        Resource = "${aws_s3_bucket.document-input-bucket.arn}/*" # Allow putting objects into the input bucket
+        Resource = aws_dynamodb_table.query-embedding-cache-table.arn # Query embeddings and search results
+      },
+      {
+        Action = [
+          "dynamodb:GetItem"
+        ],
+        Effect   = "Allow",
+        Resource = aws_dynamodb_table.document-metadata-table.arn # Index generation (result cache versioning)
+      },
+      {
+        Action = [
+          "s3:GetObject"
+        ],
+        Effect   = "Allow",
+        Resource = "${aws_s3_bucket.textract-output-bucket.arn}/vector-store/*" # Vector store (local search backend)
+      },
+      {
+        Action = [
+          "s3:ListBucket"
+        ],
+        Effect    = "Allow",
+        Resource  = aws_s3_bucket.textract-output-bucket.arn
+        Condition = {
+          StringLike = { "s3:prefix" = ["vector-store/*"] }
+        }
       }
     ]
   })
@@ -894,16 +1488,38 @@ resource "aws_lambda_function" "api-handler-lambda" { # Renamed Lambda function
   filename         = "../src/api_handler_lambda/lambda_function.zip" # New path and filename
   source_code_hash = filebase64sha256("../src/api_handler_lambda/lambda_function.zip")
   layers = [
-    aws_lambda_layer_version.numpy-layer.arn
+    aws_lambda_layer_version.numpy-layer.arn,
+    aws_lambda_layer_version.shared-layer.arn
   ]
 
   environment {
     variables = {
-      SAGEMAKER_ENDPOINT_NAME    = aws_sagemaker_endpoint.embeddings-endpoint.name
-      OPENSEARCH_DOMAIN_ENDPOINT = replace(aws_opensearch_domain.document-search-domain.endpoint, "https://", "")
-      LOG_LEVEL                  = "INFO"
-      OPENSEARCH_INDEX_NAME      = "index"
-      S3_INPUT_BUCKET            = aws_s3_bucket.document-input-bucket.bucket
+      SAGEMAKER_ENDPOINT_NAME      = aws_sagemaker_endpoint.embeddings-endpoint.name
+      OPENSEARCH_DOMAIN_ENDPOINT   = replace(aws_opensearch_domain.document-search-domain.endpoint, "https://", "")
+      LOG_LEVEL                    = "INFO"
+      METRICS_NAMESPACE            = "DocuInsight"
+      EVENT_LOG_SAMPLE_RATE        = "0.01"
+      OPENSEARCH_INDEX_NAME        = "index"
+      OPENSEARCH_VECTOR_DATA_TYPE  = "float"
+      OPENSEARCH_FIELDS_INDEX_NAME = "fields"
+      EMBEDDING_WIRE_FORMAT        = "application/x-embeddings-f32"
+      S3_INPUT_BUCKET              = aws_s3_bucket.document-input-bucket.bucket
+      EMBEDDING_CACHE_TABLE        = aws_dynamodb_table.query-embedding-cache-table.name
+      EMBEDDING_CACHE_SIZE         = "1024"
+      EMBEDDING_CACHE_TTL_SECONDS  = "3600"
+      SEARCH_DEFAULT_MODE          = "knn"
+      SEARCH_MAX_SIZE              = "100"
+      SEARCH_PREVIEW_CHARS         = "500"
+      SEARCH_BATCH_MAX_QUERIES     = "50"
+      SEARCH_BACKEND               = "opensearch"
+      VECTOR_STORE_BUCKET          = aws_s3_bucket.textract-output-bucket.bucket
+      VECTOR_STORE_PREFIX          = "vector-store"
+      VECTOR_STORE_REFRESH_SECONDS = "60"
+      DYNAMODB_TABLE_NAME          = aws_dynamodb_table.document-metadata-table.name
+      RESULT_CACHE_SIZE            = "512"
+      RESULT_CACHE_TABLE           = aws_dynamodb_table.query-embedding-cache-table.name
+      UPLOAD_PART_SIZE_BYTES       = "16777216"
+      UPLOAD_MAX_PARTS             = "1000"
     }
   }
 
@@ -0,0 +1,134 @@
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A small in-memory LRU cache with a per-entry TTL.
+    Module-level instances live as long as the warm Lambda container.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=300, clock=time.monotonic):
+        if max_size <= 0:
+            raise ValueError("max_size must be positive.")
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._items = OrderedDict()
+
+    def get(self, key):
+        """
+        Returns the cached value for key, or None if it is missing or expired.
+        """
+        item = self._items.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= self._clock():
+            del self._items[key]
+            return None
+        self._items.move_to_end(key)
+        return value
+
+    def put(self, key, value, ttl_seconds=None):
+        """
+        Stores value under key, evicting the least recently used entry if the cache is full.
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._items[key] = (value, self._clock() + ttl)
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DynamoDBCacheTier:
+    """
+    A shared cache tier backed by a DynamoDB table, so warm containers can
+    reuse each other's entries. Values are stored as bytes.
+
+    The table needs a string partition key named 'cache_key'; enable DynamoDB
+    TTL on the 'expires_at' attribute to have expired items removed.
+    Any object with the same get(key) / put(key, value) methods (e.g. a
+    dict-backed stand-in for local runs) can be used in its place.
+    """
+
+    def __init__(self, table_name, ttl_seconds=3600, client=None):
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self._client = client
+
+    @property
+    def client(self):
+        # Created on first use, so containers that never reach the cache do not pay for it.
+        if self._client is None:
+            from docuinsight.clients import get_client
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def get(self, key):
+        response = self.client.get_item(
+            TableName=self.table_name,
+            Key={'cache_key': {'S': key}},
+            ProjectionExpression='cache_value, expires_at'
+        )
+        item = response.get('Item')
+        if not item:
+            return None
+        # DynamoDB deletes expired items lazily, so check the expiry ourselves.
+        if int(item['expires_at']['N']) <= int(time.time()):
+            return None
+        return bytes(item['cache_value']['B'])
+
+    def put(self, key, value, ttl_seconds=None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                'cache_key': {'S': key},
+                'cache_value': {'B': value},
+                'expires_at': {'N': str(int(time.time() + ttl))}
+            }
+        )
+
+
+class CacheStats:
+    """
+    Tracks hits and misses of a cache, and estimates the latency saved by hits
+    from the average latency of the misses.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.miss_ms_total = 0.0
+
+    def record_hit(self):
+        self.hits += 1
+
+    def record_miss(self, elapsed_ms):
+        self.misses += 1
+        self.miss_ms_total += elapsed_ms
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @property
+    def avg_miss_ms(self):
+        return self.miss_ms_total / self.misses if self.misses else 0.0
+
+    @property
+    def saved_ms(self):
+        return self.hits * self.avg_miss_ms
+
+    def summary(self):
+        return (f"{self.name}: hit ratio {self.hit_ratio:.2f} ({self.hits} hits / {self.misses} misses), "
+                f"avg miss {self.avg_miss_ms:.1f} ms, saved ~{self.saved_ms:.0f} ms")
@@ -0,0 +1,125 @@
+"""
+Request parsing and query construction for the /fields/ route.
+
+Looks up the form fields and table cells the processor extracted from
+Textract FORMS/TABLES results (see processor_lambda/structured.py). Every
+condition is an exact filter on the fields index, so a lookup such as
+
+    {"name": "total amount", "row_label": "acme corp"}
+
+is a term query on keyword fields rather than a vector search over chunk text.
+
+Accepted fields:
+    name        the field name (key or column header), required
+    value       exact value: a number, or a string compared case-insensitively
+    min / max   inclusive bounds: numbers for numeric fields, ISO dates for date fields
+    row_label   the first cell of a table row
+    source      'form' or 'table'
+    filters     document_id / date_from / date_to, as for /search/
+    size / from paging
+"""
+from datetime import date
+
+from search import SearchRequestError, parse_filters, build_filter_clauses, parse_int
+from docuinsight.field_names import normalize_text, normalize_field_name
+
+FIELD_SOURCES = ('form', 'table')
+
+RESULT_FIELDS = ["document_id", "part_index", "source", "name", "label", "value", "value_type", "value_number",
+                 "value_date", "row_label", "table_index", "row_index", "column_index", "page", "confidence",
+                 "timestamp"]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _parse_bound(body, name):
+    value = body.get(name)
+    if value is None or _is_number(value):
+        return value
+    if isinstance(value, str):
+        try:
+            return date.fromisoformat(value).isoformat()
+        except ValueError:
+            pass
+    raise SearchRequestError(f"'{name}' must be a number or an ISO 8601 date (YYYY-MM-DD).")
+
+
+def parse_fields_request(body, default_size=20, max_size=100):
+    """
+    Validates a /fields/ request body and returns the normalized parameters.
+    Raises SearchRequestError on invalid input.
+    """
+    if not isinstance(body, dict):
+        raise SearchRequestError("Request body must be a JSON object.")
+    name = body.get('name')
+    if not isinstance(name, str) or not normalize_field_name(name):
+        raise SearchRequestError("Missing name")
+
+    value = body.get('value')
+    if value is not None and not (_is_number(value) or (isinstance(value, str) and value.strip())):
+        raise SearchRequestError("'value' must be a number or a non-empty string.")
+    minimum, maximum = _parse_bound(body, 'min'), _parse_bound(body, 'max')
+    if minimum is not None and maximum is not None and _is_number(minimum) != _is_number(maximum):
+        raise SearchRequestError("'min' and 'max' must both be numbers or both be dates.")
+    row_label = body.get('row_label')
+    if row_label is not None and not isinstance(row_label, str):
+        raise SearchRequestError("'row_label' must be a string.")
+    source = body.get('source')
+    if source is not None and source not in FIELD_SOURCES:
+        raise SearchRequestError(f"'source' must be one of: {', '.join(FIELD_SOURCES)}.")
+
+    return {
+        'name': normalize_field_name(name),
+        'value': normalize_text(value) if isinstance(value, str) else value,
+        'min': minimum,
+        'max': maximum,
+        'row_label': normalize_text(row_label) if row_label else None,
+        'source': source,
+        'filters': parse_filters(body.get('filters')),
+        'size': parse_int(body, 'size', default_size, 1, max_size),
+        'from': parse_int(body, 'from', 0, 0, max_size * 10),
+    }
+
+
+def build_fields_search(params):
+    """
+    Returns the search body for a parsed /fields/ request: a bool query of filter clauses only.
+    """
+    clauses = [{"term": {"name": params['name']}}]
+    if isinstance(params['value'], str):
+        clauses.append({"term": {"value_keyword": params['value']}})
+    elif params['value'] is not None:
+        clauses.append({"term": {"value_number": params['value']}})
+    bounds = {}
+    if params['min'] is not None:
+        bounds['gte'] = params['min']
+    if params['max'] is not None:
+        bounds['lte'] = params['max']
+    if bounds:
+        field = 'value_number' if _is_number(next(iter(bounds.values()))) else 'value_date'
+        clauses.append({"range": {field: bounds}})
+    if params['row_label']:
+        clauses.append({"term": {"row_label": params['row_label']}})
+    if params['source']:
+        clauses.append({"term": {"source": params['source']}})
+    clauses.extend(build_filter_clauses(params['filters']))
+    return {
+        "size": params['size'],
+        "from": params['from'],
+        "query": {"bool": {"filter": clauses}},
+        "sort": [{"timestamp": {"order": "desc"}}, {"page": {"order": "asc"}}],
+        "_source": RESULT_FIELDS,
+        "track_total_hits": True,
+    }
+
+
+def fields_result_body(params, response):
+    return {
+        'name': params['name'],
+        'from': params['from'],
+        'size': params['size'],
+        'total': response['hits']['total']['value'],
+        'results': [{'id': hit['_id'], **hit.get('_source', {})} for hit in response['hits']['hits']]
+    }
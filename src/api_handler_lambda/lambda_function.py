@@ -1,40 +1,259 @@
+import time
+INIT_STARTED = time.perf_counter()
+
 import os
 import json
-import boto3
 import logging
 import base64
 import uuid
 import re
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
-import numpy as np
-from requests_toolbelt.multipart import decoder
+import hashlib
+import unicodedata
+from botocore.exceptions import ClientError
+from cache import LRUCache, DynamoDBCacheTier, CacheStats
+from search import (SearchRequestError, parse_search_request, parse_batch_search_request,
+                    search_result_body)
+from search_backends import OpenSearchBackend, LocalVectorBackend
+from fields import parse_fields_request, build_fields_search, fields_result_body
+from uploads import UploadRequestError, parse_upload_request, parse_complete_request, plan_parts
+from docuinsight.metrics import MetricsLogger, consume_cold_start, log_event
+from docuinsight.search_index import DEFAULT_BYTE_SCALE
+from docuinsight.index_generation import get_index_generation
+from docuinsight import clients
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-# AWS clients
-s3_client = boto3.client('s3')
-sagemaker_runtime_client = boto3.client('sagemaker-runtime')
+# AWS clients, created by the first route that needs them (see get_s3_client
+# and get_sagemaker_runtime_client) so an /upload/ cold start skips SageMaker.
+# They are the pooled, container-wide clients of docuinsight.clients.
+s3_client = None
+sagemaker_runtime_client = None
+dynamodb_client = None
+
+# numpy (and docuinsight.wire_format, which needs it) is only needed by the search
+# route; load_search_modules() imports them on first use.
+np = None
+wire_format = None
 
 # Environment variables
 SAGEMAKER_ENDPOINT_NAME = os.environ.get('SAGEMAKER_ENDPOINT_NAME')
 OPENSEARCH_DOMAIN_ENDPOINT = os.environ.get('OPENSEARCH_DOMAIN_ENDPOINT')
 AWS_REGION = os.environ.get('AWS_REGION')
-OPENSEARCH_INDEX_NAME = "index"
+# Index (normally an alias, see docuinsight.search_index) and the vector encoding it was created with.
+OPENSEARCH_INDEX_NAME = os.environ.get('OPENSEARCH_INDEX_NAME', 'index')
+OPENSEARCH_VECTOR_DATA_TYPE = os.environ.get('OPENSEARCH_VECTOR_DATA_TYPE', 'float')
+OPENSEARCH_VECTOR_BYTE_SCALE = float(os.environ.get('OPENSEARCH_VECTOR_BYTE_SCALE', DEFAULT_BYTE_SCALE))
 S3_INPUT_BUCKET = os.environ.get('S3_INPUT_BUCKET')
 
+# Uploads. Files of at least UPLOAD_MULTIPART_THRESHOLD_BYTES (when the client
+# sends fileSize) get a multipart upload with one presigned URL per part of
+# UPLOAD_PART_SIZE_BYTES, raised so a response carries at most
+# UPLOAD_MAX_PARTS URLs. Other files get a single presigned put_object URL.
+UPLOAD_URL_EXPIRES_SECONDS = int(os.environ.get('UPLOAD_URL_EXPIRES_SECONDS', '300'))
+UPLOAD_MULTIPART_THRESHOLD_BYTES = int(os.environ.get('UPLOAD_MULTIPART_THRESHOLD_BYTES', str(100 * 1024 * 1024)))
+UPLOAD_PART_SIZE_BYTES = int(os.environ.get('UPLOAD_PART_SIZE_BYTES', str(16 * 1024 * 1024)))
+UPLOAD_MAX_PARTS = int(os.environ.get('UPLOAD_MAX_PARTS', '1000'))
+UPLOAD_PART_URL_EXPIRES_SECONDS = int(os.environ.get('UPLOAD_PART_URL_EXPIRES_SECONDS', '3600'))
+
+# S3 errors caused by the completion request itself (reported as a 400).
+UPLOAD_CLIENT_ERRORS = {'NoSuchUpload', 'InvalidPart', 'InvalidPartOrder', 'EntityTooSmall'}
+# Form fields and table cells extracted by the processor (the /fields/ route).
+OPENSEARCH_FIELDS_INDEX_NAME = os.environ.get('OPENSEARCH_FIELDS_INDEX_NAME', 'fields')
+
+# Embedding wire format requested from the model server (sent as the Accept header;
+# see docuinsight.wire_format, which is loaded with numpy on the first search): raw
+# little-endian floats behind a 16 byte header by default, or application/json for
+# the original {"embeddings": [[...]]} response.
+EMBEDDING_WIRE_FORMAT = os.environ.get('EMBEDDING_WIRE_FORMAT', 'application/x-embeddings-f32')
+
+# Query-embedding cache configuration. The in-memory tier lives in the warm
+# container; EMBEDDING_CACHE_TABLE optionally enables a shared DynamoDB tier.
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', '1024'))
+EMBEDDING_CACHE_TTL_SECONDS = int(os.environ.get('EMBEDDING_CACHE_TTL_SECONDS', '3600'))
+EMBEDDING_CACHE_TABLE = os.environ.get('EMBEDDING_CACHE_TABLE')
+
+# Search defaults. SEARCH_DEFAULT_MODE is used when a request does not pick a
+# mode ('knn', 'text' or 'hybrid'); previews are highlighted fragments of at
+# most SEARCH_PREVIEW_CHARS characters.
+SEARCH_DEFAULT_MODE = os.environ.get('SEARCH_DEFAULT_MODE', 'knn')
+SEARCH_DEFAULT_SIZE = int(os.environ.get('SEARCH_DEFAULT_SIZE', '5'))
+SEARCH_MAX_SIZE = int(os.environ.get('SEARCH_MAX_SIZE', '100'))
+SEARCH_PREVIEW_CHARS = int(os.environ.get('SEARCH_PREVIEW_CHARS', '500'))
+SEARCH_RRF_RANK_CONSTANT = int(os.environ.get('SEARCH_RRF_RANK_CONSTANT', '60'))
+SEARCH_BATCH_MAX_QUERIES = int(os.environ.get('SEARCH_BATCH_MAX_QUERIES', '50'))
+
+# Search backend: 'opensearch' or 'local' (the in-process vector store the
+# processor appends to, see docuinsight.vector_store). The local store is read
+# from VECTOR_STORE_BUCKET/VECTOR_STORE_PREFIX, or VECTOR_STORE_DIR when no bucket is set.
+SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'opensearch').lower()
+VECTOR_STORE_BUCKET = os.environ.get('VECTOR_STORE_BUCKET')
+VECTOR_STORE_PREFIX = os.environ.get('VECTOR_STORE_PREFIX', 'vector-store')
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR')
+VECTOR_STORE_CACHE_DIR = os.environ.get('VECTOR_STORE_CACHE_DIR', '/tmp/vector-store')
+VECTOR_STORE_REFRESH_SECONDS = int(os.environ.get('VECTOR_STORE_REFRESH_SECONDS', '60'))
+VECTOR_STORE_NPROBE = int(os.environ.get('VECTOR_STORE_NPROBE', '8'))
+
+# Search result cache. Keys include the index generation the processor bumps
+# after every index write (docuinsight.index_generation, stored in the metadata
+# table DYNAMODB_TABLE_NAME), so new ingests invalidate older entries; the TTL
+# is only a backstop. The generation is re-read at most every
+# RESULT_CACHE_GENERATION_SECONDS, and results are not stored until
+# RESULT_CACHE_SETTLE_SECONDS after it changed (new writes need a refresh to
+# become searchable). RESULT_CACHE_TABLE optionally enables a shared DynamoDB
+# tier; RESULT_CACHE_SIZE=0 or no DYNAMODB_TABLE_NAME disables the cache.
+DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', '512'))
+RESULT_CACHE_TTL_SECONDS = int(os.environ.get('RESULT_CACHE_TTL_SECONDS', '3600'))
+RESULT_CACHE_TABLE = os.environ.get('RESULT_CACHE_TABLE')
+RESULT_CACHE_GENERATION_SECONDS = float(os.environ.get('RESULT_CACHE_GENERATION_SECONDS', '1'))
+RESULT_CACHE_SETTLE_SECONDS = float(os.environ.get('RESULT_CACHE_SETTLE_SECONDS', '2'))
+
 # Global OpenSearch client
 opensearch_client = None
 
-def get_awsauth(region, service):
-    credentials = boto3.Session().get_credentials()
-    return AWS4Auth(credentials.access_key,
-                    credentials.secret_key,
-                    region,
-                    service,
-                    session_token=credentials.token)
+# Global vector store reader (local search backend), loaded on first search
+vector_store_reader = None
+
+# Global query-embedding caches (reused across warm invocations)
+embedding_cache = LRUCache(max_size=EMBEDDING_CACHE_SIZE, ttl_seconds=EMBEDDING_CACHE_TTL_SECONDS)
+shared_embedding_cache = DynamoDBCacheTier(EMBEDDING_CACHE_TABLE, EMBEDDING_CACHE_TTL_SECONDS) if EMBEDDING_CACHE_TABLE else None
+embedding_cache_stats = CacheStats('Query embedding cache')
+
+# Global search result caches and the last index generation read: (generation, updated_at, read_at)
+result_cache = LRUCache(max_size=RESULT_CACHE_SIZE, ttl_seconds=RESULT_CACHE_TTL_SECONDS) if RESULT_CACHE_SIZE > 0 else None
+shared_result_cache = DynamoDBCacheTier(RESULT_CACHE_TABLE, RESULT_CACHE_TTL_SECONDS) if RESULT_CACHE_TABLE else None
+result_cache_stats = CacheStats('Search result cache')
+index_generation = None
+
+def get_s3_client():
+    global s3_client
+    if s3_client is None:
+        s3_client = clients.get_client('s3')
+    return s3_client
+
+def get_sagemaker_runtime_client():
+    global sagemaker_runtime_client
+    if sagemaker_runtime_client is None:
+        sagemaker_runtime_client = clients.get_client('sagemaker-runtime')
+    return sagemaker_runtime_client
+
+def get_dynamodb_client():
+    global dynamodb_client
+    if dynamodb_client is None:
+        dynamodb_client = clients.get_client('dynamodb')
+    return dynamodb_client
+
+def load_search_modules():
+    """
+    Imports the modules only the search route needs.
+    Returns the time spent importing in milliseconds (0 once they are loaded).
+    """
+    global np, wire_format
+    if np is not None:
+        return 0.0
+    start = time.perf_counter()
+    import numpy
+    from docuinsight import wire_format as wire_format_module
+    np, wire_format = numpy, wire_format_module
+    return (time.perf_counter() - start) * 1000
+
+def normalize_query(text):
+    """
+    Normalizes query text for cache lookups: Unicode NFKC, lowercase and
+    collapsed whitespace. The embedding model is uncased, so this does not
+    change the resulting embedding.
+    """
+    return " ".join(unicodedata.normalize('NFKC', text).lower().split())
+
+def query_cache_key(text):
+    normalized = normalize_query(text)
+    return hashlib.sha256(f"{SAGEMAKER_ENDPOINT_NAME}:{normalized}".encode('utf-8')).hexdigest()
+
+def generate_query_embeddings(queries):
+    """
+    Calls the SageMaker endpoint once to embed a list of queries.
+    Returns the embeddings as a (len(queries), dimension) float32 NumPy array.
+    """
+    sagemaker_response = get_sagemaker_runtime_client().invoke_endpoint(
+        EndpointName=SAGEMAKER_ENDPOINT_NAME,
+        ContentType='application/json',
+        Accept=EMBEDDING_WIRE_FORMAT,
+        Body=json.dumps({"text": queries})
+    )
+    embeddings = wire_format.decode_embeddings(sagemaker_response['Body'].read(), sagemaker_response.get('ContentType'))
+    if embeddings.ndim != 2 or embeddings.shape[0] != len(queries):
+        raise ValueError("Invalid embedding format")
+    return embeddings.astype('<f4', copy=False)
+
+def lookup_cached_embedding(key):
+    """
+    Returns (embedding, source) from the in-container cache or the shared tier, or (None, None).
+    """
+    embedding = embedding_cache.get(key)
+    if embedding is not None:
+        return embedding, 'memory'
+    if shared_embedding_cache is not None:
+        try:
+            cached = shared_embedding_cache.get(key)
+        except Exception as e:
+            logger.warning(f"Shared embedding cache lookup failed: {e}")
+            cached = None
+        if cached is not None:
+            embedding = np.frombuffer(cached, dtype='<f4')
+            embedding_cache.put(key, embedding)
+            return embedding, 'shared'
+    return None, None
+
+def store_embedding(key, embedding):
+    embedding_cache.put(key, embedding)
+    if shared_embedding_cache is not None:
+        try:
+            shared_embedding_cache.put(key, embedding.tobytes())
+        except Exception as e:
+            logger.warning(f"Shared embedding cache write failed: {e}")
+
+def get_query_embeddings(queries, metrics=None):
+    """
+    Returns the embeddings for a list of queries in input order, checking the
+    in-container cache and the optional shared tier first. All misses are
+    embedded with a single SageMaker call.
+    """
+    keys = [query_cache_key(query) for query in queries]
+    found = {}
+    misses = {}  # cache key -> query text, deduplicated
+    for key, query in zip(keys, queries):
+        if key in found or key in misses:
+            continue
+        embedding, source = lookup_cached_embedding(key)
+        if metrics is not None:
+            metrics.put_metric('EmbeddingCacheHit', int(embedding is not None), 'Count')
+        if embedding is not None:
+            embedding_cache_stats.record_hit()
+            logger.info(f"Query embedding served from {source} cache. {embedding_cache_stats.summary()}")
+            found[key] = embedding
+        else:
+            misses[key] = query
+
+    if misses:
+        start = time.perf_counter()
+        embeddings = generate_query_embeddings(list(misses.values()))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        for key, embedding in zip(misses, embeddings):
+            embedding_cache_stats.record_miss(elapsed_ms / len(misses))
+            store_embedding(key, embedding)
+            found[key] = embedding
+        if metrics is not None:
+            metrics.put_metric('EmbeddingTime', elapsed_ms)
+        logger.info(f"{len(misses)} query embeddings generated by SageMaker. {embedding_cache_stats.summary()}")
+    return [found[key] for key in keys]
+
+def get_query_embedding(user_query, metrics=None):
+    """
+    Returns the embedding for a single query (see get_query_embeddings).
+    """
+    return get_query_embeddings([user_query], metrics)[0]
 
 def initialize_opensearch_client():
     global opensearch_client
@@ -43,14 +262,7 @@ def initialize_opensearch_client():
             logger.error("Missing OpenSearch config.")
             return False
         try:
-            opensearch_client = OpenSearch(
-                hosts=[{'host': OPENSEARCH_DOMAIN_ENDPOINT, 'port': 443}],
-                http_auth=get_awsauth(AWS_REGION, 'es'),
-                use_ssl=True,
-                verify_certs=True,
-                connection_class=RequestsHttpConnection,
-                timeout=30
-            )
+            opensearch_client = clients.get_opensearch_client(OPENSEARCH_DOMAIN_ENDPOINT, AWS_REGION)
             logger.info("OpenSearch client initialized.")
             return True
         except Exception as e:
@@ -61,23 +273,30 @@ def initialize_opensearch_client():
 def sanitize_filename(name):
     return re.sub(r'[^a-zA-Z0-9_.-]', '_', name)
 
-def handle_upload(event):
+def handle_upload(event, metrics):
     logger.info("Handling upload request")
-    body = json.loads(event['body'])
-    file_name = body['fileName']
-    file_type = body['fileType']
+    try:
+        request = parse_upload_request(json.loads(event['body']))
+    except UploadRequestError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
+    except Exception as e:
+        logger.error(f"Failed to parse upload body: {e}")
+        return {'statusCode': 400, 'body': json.dumps({'message': 'Invalid JSON'})}
 
     # Optional: Add timestamp prefix or UUID
-    key = f"{uuid.uuid4()}_{file_name}"
+    key = f"{uuid.uuid4()}_{request['file_name']}"
+
+    if request['file_size'] and request['file_size'] >= UPLOAD_MULTIPART_THRESHOLD_BYTES:
+        return start_multipart_upload(key, request, metrics)
 
-    url = s3_client.generate_presigned_url(
+    url = get_s3_client().generate_presigned_url(
         'put_object',
         Params={
             'Bucket': S3_INPUT_BUCKET,
             'Key': key,
-            'ContentType': file_type
+            'ContentType': request['file_type']
         },
-        ExpiresIn=300  # URL valid for 5 mins
+        ExpiresIn=UPLOAD_URL_EXPIRES_SECONDS
     )
 
     return {
@@ -85,90 +304,401 @@ def handle_upload(event):
         "headers": { "Content-Type": "application/json" },
         "body": json.dumps({
             "uploadUrl": url,
-            "fileKey": key
+            "fileKey": key,
+            "multipart": False
         })
     }
 
+def start_multipart_upload(key, request, metrics):
+    """
+    Creates a multipart upload and returns a presigned upload_part URL for every part.
+    Presigning is local, so this costs one S3 call whatever the part count.
+    Uploads that are never completed are removed by the input bucket's lifecycle rule.
+    """
+    s3 = get_s3_client()
+    upload_id = s3.create_multipart_upload(Bucket=S3_INPUT_BUCKET, Key=key,
+                                           ContentType=request['file_type'])['UploadId']
+    part_size, part_count = plan_parts(request['file_size'], UPLOAD_PART_SIZE_BYTES, UPLOAD_MAX_PARTS)
+    parts = [{
+        "partNumber": number,
+        "uploadUrl": s3.generate_presigned_url(
+            'upload_part',
+            Params={'Bucket': S3_INPUT_BUCKET, 'Key': key, 'UploadId': upload_id, 'PartNumber': number},
+            ExpiresIn=UPLOAD_PART_URL_EXPIRES_SECONDS
+        )
+    } for number in range(1, part_count + 1)]
+    metrics.put_metric('UploadParts', part_count, 'Count')
+    logger.info(f"Started multipart upload of {request['file_size']} bytes to {key} in {part_count} parts.")
 
-def handle_search(event):
-    logger.info("Handling search request")
+    return {
+        "statusCode": 200,
+        "headers": { "Content-Type": "application/json" },
+        "body": json.dumps({
+            "fileKey": key,
+            "multipart": True,
+            "uploadId": upload_id,
+            "partSize": part_size,
+            "expiresIn": UPLOAD_PART_URL_EXPIRES_SECONDS,
+            "parts": parts
+        })
+    }
+
+def handle_upload_complete(event, metrics):
+    """
+    Completes a multipart upload (which triggers processing like any other
+    upload) or aborts it. Without a parts list, the parts S3 has received are used.
+    """
+    logger.info("Handling upload completion request")
+    try:
+        request = parse_complete_request(json.loads(event['body']))
+    except UploadRequestError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
+    except Exception as e:
+        logger.error(f"Failed to parse upload completion body: {e}")
+        return {'statusCode': 400, 'body': json.dumps({'message': 'Invalid JSON'})}
+
+    s3 = get_s3_client()
+    upload = {'Bucket': S3_INPUT_BUCKET, 'Key': request['file_key'], 'UploadId': request['upload_id']}
+    try:
+        if request['abort']:
+            s3.abort_multipart_upload(**upload)
+            result = {"fileKey": request['file_key'], "aborted": True}
+        else:
+            parts = request['parts']
+            if parts is None:
+                parts = [{'PartNumber': part['PartNumber'], 'ETag': part['ETag']}
+                         for page in s3.get_paginator('list_parts').paginate(**upload)
+                         for part in page.get('Parts', [])]
+                if not parts:
+                    return {'statusCode': 400, 'body': json.dumps({'message': 'No parts have been uploaded.'})}
+            with metrics.timer('UploadCompleteTime'):
+                s3.complete_multipart_upload(**upload, MultipartUpload={'Parts': parts})
+            result = {"fileKey": request['file_key'], "completed": True, "parts": len(parts)}
+    except ClientError as e:
+        code = e.response.get('Error', {}).get('Code')
+        if code in UPLOAD_CLIENT_ERRORS:
+            return {'statusCode': 400, 'body': json.dumps({'message': f'Upload could not be completed: {code}'})}
+        logger.error(f"Multipart upload completion failed: {e}", exc_info=True)
+        return {'statusCode': 500, 'body': json.dumps({'message': f'Upload completion failed: {str(e)}'})}
+
+    return {
+        "statusCode": 200,
+        "headers": { "Content-Type": "application/json" },
+        "body": json.dumps(result)
+    }
+
+
+def opensearch_unavailable(metrics):
+    """
+    Initializes the OpenSearch client if needed. Returns an error response if it is not available.
+    """
+    first_use = opensearch_client is None
+    start = time.perf_counter()
     if not initialize_opensearch_client():
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'message': 'OpenSearch not ready'})
         }
+    if first_use:
+        metrics.put_metric('OpenSearchInitTime', (time.perf_counter() - start) * 1000)
+    return None
+
+def embed_search_queries(param_list, metrics):
+    """
+    Returns the query vector for each parsed request (None for text-only searches),
+    using at most one SageMaker call.
+    """
+    vector_queries = [params['query_text'] for params in param_list if params['mode'] != 'text']
+    embeddings = iter(get_query_embeddings(vector_queries, metrics) if vector_queries else [])
+    return [next(embeddings).tolist() if params['mode'] != 'text' else None for params in param_list]
 
+def get_vector_store_reader(metrics):
+    """
+    Returns the container-wide vector store reader, loading the store on first use.
+    """
+    global vector_store_reader
+    if vector_store_reader is None:
+        from docuinsight.vector_store import S3Storage, LocalStorage, VectorStoreReader
+        if VECTOR_STORE_BUCKET:
+            storage = S3Storage(VECTOR_STORE_BUCKET, VECTOR_STORE_PREFIX, client=get_s3_client())
+        else:
+            storage = LocalStorage(VECTOR_STORE_DIR)
+        reader = VectorStoreReader(storage, VECTOR_STORE_CACHE_DIR, VECTOR_STORE_REFRESH_SECONDS, VECTOR_STORE_NPROBE)
+        with metrics.timer('VectorStoreLoadTime'):
+            reader.refresh(force=True)
+        vector_store_reader = reader
+    return vector_store_reader
+
+def get_search_backend(metrics):
+    """
+    Returns (backend, None) for the configured SEARCH_BACKEND, or (None, error response)
+    if the backend cannot be initialized.
+    """
+    if SEARCH_BACKEND == 'local':
+        try:
+            return LocalVectorBackend(get_vector_store_reader(metrics), SEARCH_PREVIEW_CHARS), None
+        except Exception as e:
+            logger.error(f"Failed to load vector store: {e}", exc_info=True)
+            return None, {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'message': 'Vector store not ready'})
+            }
+    error_response = opensearch_unavailable(metrics)
+    if error_response:
+        return None, error_response
+    return OpenSearchBackend(opensearch_client, OPENSEARCH_INDEX_NAME, SEARCH_PREVIEW_CHARS,
+                             SEARCH_RRF_RANK_CONSTANT, OPENSEARCH_VECTOR_DATA_TYPE,
+                             OPENSEARCH_VECTOR_BYTE_SCALE), None
+
+def current_index_generation(metrics):
+    """
+    Returns (generation, settled). settled is False while writes of the latest
+    generation may not be searchable yet, so results must not be stored.
+    """
+    global index_generation
+    now = time.time()
+    if index_generation is None or now - index_generation[2] >= RESULT_CACHE_GENERATION_SECONDS:
+        with metrics.timer('IndexGenerationReadTime'):
+            generation, updated_at = get_index_generation(get_dynamodb_client(), DYNAMODB_TABLE_NAME)
+        index_generation = (generation, updated_at, now)
+    generation, updated_at, _ = index_generation
+    settle_seconds = RESULT_CACHE_SETTLE_SECONDS
+    if SEARCH_BACKEND == 'local':
+        settle_seconds = max(settle_seconds, VECTOR_STORE_REFRESH_SECONDS)
+    return generation, now - updated_at >= settle_seconds
+
+def result_cache_key(params, generation):
+    key_params = {**params, 'query_text': normalize_query(params['query_text'])}
+    payload = json.dumps(key_params, sort_keys=True)
+    return hashlib.sha256(f"{SEARCH_BACKEND}:{OPENSEARCH_INDEX_NAME}:{generation}:{payload}".encode('utf-8')).hexdigest()
+
+def lookup_cached_results(param_list, metrics):
+    """
+    Looks up each parsed request in the result caches.
+
+    Returns (outcomes, keys, settled): the cached outcome per request (None for
+    a miss), the cache keys (None when the cache is disabled or the generation
+    could not be read) and whether new results may be stored.
+    """
+    if result_cache is None or not DYNAMODB_TABLE_NAME:
+        return [None] * len(param_list), None, False
     try:
-        body = json.loads(event['body'])
-        user_query = body.get('query_text')
-        if not user_query:
-            return {'statusCode': 400, 'body': json.dumps({'message': 'Missing query_text'})}
+        generation, settled = current_index_generation(metrics)
+    except Exception as e:
+        logger.warning(f"Could not read the index generation; bypassing the result cache: {e}")
+        return [None] * len(param_list), None, False
+
+    keys = [result_cache_key(params, generation) for params in param_list]
+    outcomes = []
+    for key in keys:
+        outcome = result_cache.get(key)
+        if outcome is None and shared_result_cache is not None:
+            try:
+                cached = shared_result_cache.get(key)
+            except Exception as e:
+                logger.warning(f"Shared result cache lookup failed: {e}")
+                cached = None
+            if cached is not None:
+                outcome = json.loads(cached)
+                result_cache.put(key, outcome)
+        metrics.put_metric('ResultCacheHit', int(outcome is not None), 'Count')
+        if outcome is not None:
+            result_cache_stats.record_hit()
+        outcomes.append(outcome)
+    return outcomes, keys, settled
+
+def store_results(keys, outcomes, settled, elapsed_ms):
+    """
+    Caches the successful outcomes (lists of hits) under their keys.
+    """
+    if keys is None:
+        return
+    for key, outcome in zip(keys, outcomes):
+        result_cache_stats.record_miss(elapsed_ms / len(keys))
+        if not settled or not isinstance(outcome, list):
+            continue
+        result_cache.put(key, outcome)
+        if shared_result_cache is not None:
+            try:
+                shared_result_cache.put(key, json.dumps(outcome).encode('utf-8'))
+            except Exception as e:
+                logger.warning(f"Shared result cache write failed: {e}")
+    logger.info(result_cache_stats.summary())
+
+def handle_search(event, metrics):
+    logger.info("Handling search request")
+    import_ms = load_search_modules()
+    if import_ms:
+        metrics.put_metric('SearchImportTime', import_ms)
+    backend, error_response = get_search_backend(metrics)
+    if error_response:
+        return error_response
+
+    try:
+        params = parse_search_request(json.loads(event['body']), SEARCH_DEFAULT_MODE,
+                                      SEARCH_DEFAULT_SIZE, SEARCH_MAX_SIZE)
+        backend.validate([params])
+    except SearchRequestError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
     except Exception as e:
         logger.error(f"Failed to parse search body: {e}")
         return {'statusCode': 400, 'body': json.dumps({'message': 'Invalid JSON'})}
+    metrics.set_property('SearchMode', params['mode'])
+
+    cached, keys, settled = lookup_cached_results([params], metrics)
+    outcome = cached[0]
+    if outcome is None:
+        start = time.perf_counter()
+        try:
+            vectors = embed_search_queries([params], metrics)
+        except Exception as e:
+            logger.error(f"SageMaker error: {e}")
+            return {'statusCode': 500, 'body': json.dumps({'message': f'Embedding generation failed: {str(e)}'})}
+
+        try:
+            outcome = backend.search([params], vectors, metrics)[0]
+            if isinstance(outcome, dict):
+                raise RuntimeError(outcome['error'])
+        except Exception as e:
+            logger.error(f"Search error: {e}", exc_info=True)
+            return {'statusCode': 500, 'body': json.dumps({'message': f'Search failed: {str(e)}'})}
+        store_results(keys, [outcome], settled, (time.perf_counter() - start) * 1000)
+
+    metrics.put_metric('ResultCount', len(outcome), 'Count')
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(search_result_body(params, outcome))
+    }
+
+def handle_search_batch(event, metrics):
+    """
+    Runs a list of searches with one SageMaker call for all query embeddings
+    and one _msearch request. Results are returned in input order; a query whose
+    search failed carries an 'error' instead of 'results'.
+    """
+    logger.info("Handling batch search request")
+    import_ms = load_search_modules()
+    if import_ms:
+        metrics.put_metric('SearchImportTime', import_ms)
+    backend, error_response = get_search_backend(metrics)
+    if error_response:
+        return error_response
 
     try:
-        sagemaker_response = sagemaker_runtime_client.invoke_endpoint(
-            EndpointName=SAGEMAKER_ENDPOINT_NAME,
-            ContentType='application/json',
-            Body=json.dumps({"text": user_query})
-        )
-        response_body = sagemaker_response['Body'].read().decode('utf-8')
-        embedding = json.loads(response_body)['embeddings']
-        if not embedding or not isinstance(embedding[0], list):
-            raise ValueError("Invalid embedding format")
-        embedding = embedding[0]
+        param_list = parse_batch_search_request(json.loads(event['body']), SEARCH_DEFAULT_MODE,
+                                                SEARCH_DEFAULT_SIZE, SEARCH_MAX_SIZE, SEARCH_BATCH_MAX_QUERIES)
+        backend.validate(param_list)
+    except SearchRequestError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
     except Exception as e:
-        logger.error(f"SageMaker error: {e}")
-        return {'statusCode': 500, 'body': json.dumps({'message': f'Embedding generation failed: {str(e)}'})}
+        logger.error(f"Failed to parse batch search body: {e}")
+        return {'statusCode': 400, 'body': json.dumps({'message': 'Invalid JSON'})}
+    metrics.put_metric('BatchQueryCount', len(param_list), 'Count')
 
-    try:
-        search_body = {
-            "size": 5,
-            "query": {
-                "knn": {
-                    "embedding": {
-                        "vector": embedding,
-                        "k": 5
-                    }
-                }
-            },
-            "_source": ["document_id", "text_content", "timestamp"]
-        }
+    # Only the queries missing from the result cache are embedded and searched.
+    outcomes, keys, settled = lookup_cached_results(param_list, metrics)
+    misses = [i for i, outcome in enumerate(outcomes) if outcome is None]
+    if misses:
+        start = time.perf_counter()
+        miss_params = [param_list[i] for i in misses]
+        try:
+            vectors = embed_search_queries(miss_params, metrics)
+        except Exception as e:
+            logger.error(f"SageMaker error: {e}")
+            return {'statusCode': 500, 'body': json.dumps({'message': f'Embedding generation failed: {str(e)}'})}
+
+        try:
+            results = backend.search(miss_params, vectors, metrics)
+        except Exception as e:
+            logger.error(f"Batch search error: {e}", exc_info=True)
+            return {'statusCode': 500, 'body': json.dumps({'message': f'Search failed: {str(e)}'})}
+        for i, outcome in zip(misses, results):
+            outcomes[i] = outcome
+        store_results([keys[i] for i in misses] if keys else None, results, settled,
+                      (time.perf_counter() - start) * 1000)
 
-        response = opensearch_client.search(index=OPENSEARCH_INDEX_NAME, body=search_body)
-        results = []
-        for hit in response['hits']['hits']:
-            results.append({
-                "score": hit['_score'],
-                "job_id": hit['_id'],
-                "document_id": hit['_source'].get('document_id'),
-                "full_text_preview": hit['_source'].get('text_content', '')[:500],
-                "timestamp": hit['_source'].get('timestamp')
-            })
+    responses = []
+    for params, outcome in zip(param_list, outcomes):
+        if isinstance(outcome, dict):
+            responses.append({'query_text': params['query_text'], 'mode': params['mode'], **outcome})
+        else:
+            responses.append(search_result_body(params, outcome))
+    metrics.put_metric('ResultCount', sum(len(outcome) for outcome in outcomes if isinstance(outcome, list)), 'Count')
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'responses': responses})
+    }
+
+def handle_fields(event, metrics):
+    """
+    Looks up extracted form fields and table cells with an exact filtered query
+    on the fields index; no query embedding is needed.
+    """
+    logger.info("Handling fields request")
+    error_response = opensearch_unavailable(metrics)
+    if error_response:
+        return error_response
+
+    try:
+        params = parse_fields_request(json.loads(event['body']), SEARCH_DEFAULT_SIZE, SEARCH_MAX_SIZE)
+    except SearchRequestError as e:
+        return {'statusCode': 400, 'body': json.dumps({'message': str(e)})}
+    except Exception as e:
+        logger.error(f"Failed to parse fields body: {e}")
+        return {'statusCode': 400, 'body': json.dumps({'message': 'Invalid JSON'})}
 
+    try:
+        with metrics.timer('OpenSearchSearchTime'):
+            response = opensearch_client.search(index=OPENSEARCH_FIELDS_INDEX_NAME, body=build_fields_search(params))
+        body = fields_result_body(params, response)
+        metrics.put_metric('ResultCount', len(body['results']), 'Count')
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'query_text': user_query, 'results': results})
+            'body': json.dumps(body)
         }
-
     except Exception as e:
-        logger.error(f"Search error: {e}", exc_info=True)
+        logger.error(f"Fields search error: {e}", exc_info=True)
         return {'statusCode': 500, 'body': json.dumps({'message': f'Search failed: {str(e)}'})}
 
+ROUTES = ('/upload/', '/upload/complete/', '/search/', '/search/batch/', '/fields/')
+
 def lambda_handler(event, context):
-    logger.info(f"Event: {json.dumps(event)}")
+    start = time.perf_counter()
+    log_event(logger, event)
     path = event.get('path')
     method = event.get('httpMethod')
+    # Unknown paths share one dimension value to keep metric cardinality bounded.
+    metrics = MetricsLogger('api', Route=path if path in ROUTES else 'other')
+    cold_start = consume_cold_start()
+    metrics.put_metric('ColdStart', int(cold_start), 'Count')
+    if cold_start:
+        metrics.put_metric('InitTime', INIT_DURATION_MS)
     if path == '/upload/' and method == 'POST':
-        return handle_upload(event)
+        response = handle_upload(event, metrics)
+    elif path == '/upload/complete/' and method == 'POST':
+        response = handle_upload_complete(event, metrics)
     elif path == '/search/' and method == 'POST':
-        return handle_search(event)
+        response = handle_search(event, metrics)
+    elif path == '/search/batch/' and method == 'POST':
+        response = handle_search_batch(event, metrics)
+    elif path == '/fields/' and method == 'POST':
+        response = handle_fields(event, metrics)
     else:
-        return {
+        response = {
             'statusCode': 404,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
             'body': json.dumps({'message': 'Route not found'})
         }
+    metrics.set_property('StatusCode', response['statusCode'])
+    metrics.put_metric('ResponseBytes', len(response.get('body') or ''), 'Bytes')
+    metrics.put_metric('HandlerTime', (time.perf_counter() - start) * 1000)
+    metrics.flush()
+    return response
+
+# Module import and global setup time, reported with the first invocation.
+INIT_DURATION_MS = (time.perf_counter() - INIT_STARTED) * 1000
@@ -0,0 +1,296 @@
+"""
+Search request parsing, OpenSearch query construction and result fusion for
+the /search/ and /search/batch/ routes.
+
+Modes:
+    knn    - vector search on the chunk embeddings (the original behaviour)
+    text   - BM25 match query on text_content
+    hybrid - both, sent in one _msearch request and merged client-side with
+             reciprocal rank fusion ('rrf') or a weighted sum of min-max
+             normalized scores ('weighted')
+
+Hits carry a short preview produced by OpenSearch highlighting instead of the
+full text_content, so response size no longer grows with chunk length.
+"""
+from datetime import datetime
+
+SEARCH_MODES = ('knn', 'text', 'hybrid')
+FUSION_METHODS = ('rrf', 'weighted')
+
+# Fields returned for every hit; text_content is only read server-side for highlighting.
+RESULT_FIELDS = ["document_id", "chunk_index", "page_start", "page_end", "timestamp"]
+
+
+class SearchRequestError(ValueError):
+    """
+    Raised for a malformed search request; reported to the caller as a 400.
+    """
+
+
+def parse_int(body, name, default, minimum, maximum):
+    value = body.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise SearchRequestError(f"'{name}' must be an integer.")
+    if not minimum <= value <= maximum:
+        raise SearchRequestError(f"'{name}' must be between {minimum} and {maximum}.")
+    return value
+
+
+def _parse_date(value, name):
+    if not isinstance(value, str):
+        raise SearchRequestError(f"'{name}' must be an ISO 8601 date string.")
+    try:
+        datetime.fromisoformat(value)
+    except ValueError:
+        raise SearchRequestError(f"'{name}' must be an ISO 8601 date string.")
+    return value
+
+
+def parse_filters(filters):
+    """
+    Validates the optional filters object: document_id (a string or a list of
+    strings) and date_from / date_to (inclusive bounds on the chunk timestamp).
+    """
+    if filters is None:
+        return {}
+    if not isinstance(filters, dict):
+        raise SearchRequestError("'filters' must be an object.")
+    unknown = set(filters) - {'document_id', 'date_from', 'date_to'}
+    if unknown:
+        raise SearchRequestError(f"Unsupported filters: {', '.join(sorted(unknown))}.")
+
+    parsed = {}
+    document_ids = filters.get('document_id')
+    if document_ids is not None:
+        if isinstance(document_ids, str):
+            document_ids = [document_ids]
+        if not document_ids or not all(isinstance(value, str) and value for value in document_ids):
+            raise SearchRequestError("'filters.document_id' must be a string or a list of strings.")
+        parsed['document_id'] = list(document_ids)
+    for name in ('date_from', 'date_to'):
+        if filters.get(name) is not None:
+            parsed[name] = _parse_date(filters[name], f"filters.{name}")
+    return parsed
+
+
+def parse_search_request(body, default_mode='knn', default_size=5, max_size=100):
+    """
+    Validates a search request body and returns the normalized parameters.
+
+    Accepted fields: query_text (required), mode, size, from, k, filters,
+    fusion and knn_weight. Raises SearchRequestError on invalid input.
+    """
+    if not isinstance(body, dict):
+        raise SearchRequestError("Request body must be a JSON object.")
+    query_text = body.get('query_text')
+    if not isinstance(query_text, str) or not query_text.strip():
+        raise SearchRequestError("Missing query_text")
+
+    mode = body.get('mode', default_mode)
+    if mode not in SEARCH_MODES:
+        raise SearchRequestError(f"'mode' must be one of: {', '.join(SEARCH_MODES)}.")
+    fusion = body.get('fusion', 'rrf')
+    if fusion not in FUSION_METHODS:
+        raise SearchRequestError(f"'fusion' must be one of: {', '.join(FUSION_METHODS)}.")
+    knn_weight = body.get('knn_weight', 0.5)
+    if isinstance(knn_weight, bool) or not isinstance(knn_weight, (int, float)) or not 0 <= knn_weight <= 1:
+        raise SearchRequestError("'knn_weight' must be a number between 0 and 1.")
+
+    size = parse_int(body, 'size', default_size, 1, max_size)
+    offset = parse_int(body, 'from', 0, 0, max_size * 10)
+    k = parse_int(body, 'k', size, 1, max_size * 10)
+    return {
+        'query_text': query_text,
+        'mode': mode,
+        'size': size,
+        'from': offset,
+        # kNN must return at least every hit up to the end of the requested page.
+        'k': max(k, offset + size),
+        'filters': parse_filters(body.get('filters')),
+        'fusion': fusion,
+        'knn_weight': float(knn_weight),
+    }
+
+
+def build_filter_clauses(filters):
+    clauses = []
+    if filters.get('document_id'):
+        clauses.append({"terms": {"document_id": filters['document_id']}})
+    date_range = {}
+    if filters.get('date_from'):
+        date_range['gte'] = filters['date_from']
+    if filters.get('date_to'):
+        date_range['lte'] = filters['date_to']
+    if date_range:
+        clauses.append({"range": {"timestamp": date_range}})
+    return clauses
+
+
+def _with_filters(query, filters):
+    clauses = build_filter_clauses(filters)
+    if not clauses:
+        return query
+    return {"bool": {"must": [query], "filter": clauses}}
+
+
+def _knn_query(vector, params):
+    # Filters go inside the knn clause, so the faiss and lucene engines apply them
+    # during the search. Wrapped in a bool (as _with_filters does), they would only
+    # be applied to the global top k, returning few or no hits for a narrow filter.
+    knn = {"vector": vector, "k": params['k']}
+    clauses = build_filter_clauses(params['filters'])
+    if clauses:
+        knn["filter"] = {"bool": {"filter": clauses}}
+    return {"knn": {"embedding": knn}}
+
+
+def _highlight(preview_chars):
+    # no_match_size makes hits without a matching term (e.g. from kNN) still
+    # return the first preview_chars characters as their preview.
+    return {
+        "fields": {
+            "text_content": {
+                "fragment_size": preview_chars,
+                "number_of_fragments": 1,
+                "no_match_size": preview_chars,
+            }
+        }
+    }
+
+
+def build_knn_search(vector, params, size, offset, preview_chars):
+    return {
+        "size": size,
+        "from": offset,
+        "query": _knn_query(vector, params),
+        "_source": RESULT_FIELDS,
+        "highlight": _highlight(preview_chars),
+    }
+
+
+def build_text_search(params, size, offset, preview_chars):
+    return {
+        "size": size,
+        "from": offset,
+        "query": _with_filters({"match": {"text_content": params['query_text']}}, params['filters']),
+        "_source": RESULT_FIELDS,
+        "highlight": _highlight(preview_chars),
+    }
+
+
+def build_searches(params, vector, preview_chars):
+    """
+    Returns the search bodies for a request: one for knn/text, two for hybrid.
+    Hybrid sub-searches fetch the first from+size hits each so the fused page is complete.
+    """
+    if params['mode'] == 'knn':
+        return [build_knn_search(vector, params, params['size'], params['from'], preview_chars)]
+    if params['mode'] == 'text':
+        return [build_text_search(params, params['size'], params['from'], preview_chars)]
+    window = params['from'] + params['size']
+    return [
+        build_knn_search(vector, params, window, 0, preview_chars),
+        build_text_search(params, window, 0, preview_chars),
+    ]
+
+
+def reciprocal_rank_fusion(hit_lists, rank_constant=60):
+    """
+    Merges ranked hit lists by summing 1 / (rank_constant + rank) per document.
+    Returns (hit, score) pairs, best first. When a hit appears in several lists
+    the one from the later list is kept, so text matches keep their highlight.
+    """
+    merged = {}
+    for hits in hit_lists:
+        for rank, hit in enumerate(hits, start=1):
+            entry = merged.setdefault(hit['_id'], [hit, 0.0])
+            entry[0] = hit
+            entry[1] += 1.0 / (rank_constant + rank)
+    return sorted(merged.values(), key=lambda entry: entry[1], reverse=True)
+
+
+def weighted_fusion(hit_lists, weights):
+    """
+    Merges hit lists by a weighted sum of their min-max normalized scores.
+    """
+    merged = {}
+    for hits, weight in zip(hit_lists, weights):
+        if not hits:
+            continue
+        scores = [hit['_score'] for hit in hits]
+        low, high = min(scores), max(scores)
+        for hit in hits:
+            normalized = (hit['_score'] - low) / (high - low) if high > low else 1.0
+            entry = merged.setdefault(hit['_id'], [hit, 0.0])
+            entry[0] = hit
+            entry[1] += weight * normalized
+    return sorted(merged.values(), key=lambda entry: entry[1], reverse=True)
+
+
+def rank_hits(params, responses, rank_constant=60):
+    """
+    Turns the OpenSearch response(s) for a request into the requested page of (hit, score) pairs.
+    """
+    hit_lists = [response['hits']['hits'] for response in responses]
+    if params['mode'] != 'hybrid':
+        return [(hit, hit['_score']) for hit in hit_lists[0]]
+    if params['fusion'] == 'weighted':
+        fused = weighted_fusion(hit_lists, [params['knn_weight'], 1.0 - params['knn_weight']])
+    else:
+        fused = reciprocal_rank_fusion(hit_lists, rank_constant)
+    return fused[params['from']:params['from'] + params['size']]
+
+
+def format_hit(hit, score):
+    source = hit.get('_source', {})
+    fragments = hit.get('highlight', {}).get('text_content') or ['']
+    return {
+        "score": score,
+        "job_id": hit['_id'],
+        "document_id": source.get('document_id'),
+        "chunk_index": source.get('chunk_index'),
+        "page_start": source.get('page_start'),
+        "page_end": source.get('page_end'),
+        "full_text_preview": fragments[0],
+        "timestamp": source.get('timestamp')
+    }
+
+
+def parse_batch_search_request(body, default_mode='knn', default_size=5, max_size=100, max_queries=50):
+    """
+    Validates a /search/batch/ body: {"queries": [...], ...}.
+
+    Each entry is a query string or an object with the same fields as a /search/
+    body. Other top-level fields (mode, size, filters, ...) are defaults for
+    every entry. Returns one parameter dict per query, in input order.
+    """
+    if not isinstance(body, dict):
+        raise SearchRequestError("Request body must be a JSON object.")
+    queries = body.get('queries')
+    if not isinstance(queries, list) or not queries:
+        raise SearchRequestError("'queries' must be a non-empty list.")
+    if len(queries) > max_queries:
+        raise SearchRequestError(f"At most {max_queries} queries are allowed per batch.")
+
+    defaults = {key: value for key, value in body.items() if key != 'queries'}
+    parsed = []
+    for i, query in enumerate(queries):
+        if isinstance(query, str):
+            query = {'query_text': query}
+        if not isinstance(query, dict):
+            raise SearchRequestError(f"queries[{i}]: must be a string or an object.")
+        try:
+            parsed.append(parse_search_request({**defaults, **query}, default_mode, default_size, max_size))
+        except SearchRequestError as e:
+            raise SearchRequestError(f"queries[{i}]: {e}")
+    return parsed
+
+
+def search_result_body(params, results):
+    return {
+        'query_text': params['query_text'],
+        'mode': params['mode'],
+        'from': params['from'],
+        'size': params['size'],
+        'results': results
+    }
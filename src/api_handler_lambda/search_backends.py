@@ -0,0 +1,116 @@
+"""
+Search backends behind /search/ and /search/batch/.
+
+    opensearch - the OpenSearch domain (knn, text and hybrid modes)
+    local      - the in-process vector store of docuinsight.vector_store,
+                 loaded from S3 into the Lambda container (knn mode only)
+
+Both take the parsed requests from search.py plus one query vector per
+request and return, in input order, a list of formatted hits per request or
+an {'error': ...} dict for a request whose search failed.
+"""
+from search import SEARCH_MODES, SearchRequestError, build_searches, rank_hits, format_hit
+from docuinsight.search_index import encode_vector, DEFAULT_BYTE_SCALE
+
+
+class SearchBackend:
+    name = None
+    modes = SEARCH_MODES
+
+    def validate(self, param_list):
+        """
+        Raises SearchRequestError if a request uses a mode this backend cannot serve.
+        """
+        for params in param_list:
+            if params['mode'] not in self.modes:
+                raise SearchRequestError(f"Mode '{params['mode']}' is not supported by the {self.name} "
+                                         f"search backend (supported: {', '.join(self.modes)}).")
+
+    def search(self, param_list, vectors, metrics):
+        raise NotImplementedError
+
+
+class OpenSearchBackend(SearchBackend):
+    name = 'opensearch'
+
+    def __init__(self, client, index_name, preview_chars=500, rank_constant=60,
+                 vector_data_type='float', byte_scale=DEFAULT_BYTE_SCALE):
+        self.client = client
+        self.index_name = index_name
+        self.preview_chars = preview_chars
+        self.rank_constant = rank_constant
+        self.vector_data_type = vector_data_type
+        self.byte_scale = byte_scale
+
+    def run_searches(self, searches):
+        """
+        Sends the search bodies in one round trip: a plain search for a single body,
+        _msearch otherwise. Failed searches come back as {'error': ...} entries.
+        """
+        if len(searches) == 1:
+            return [self.client.search(index=self.index_name, body=searches[0])]
+        lines = []
+        for search_body in searches:
+            lines.append({'index': self.index_name})
+            lines.append(search_body)
+        return self.client.msearch(body=lines)['responses']
+
+    def search(self, param_list, vectors, metrics):
+        """
+        Runs every request's search bodies (two per hybrid request) in a single
+        OpenSearch round trip.
+        """
+        searches = []
+        spans = []
+        for params, vector in zip(param_list, vectors):
+            if vector is not None:
+                vector = encode_vector(vector, self.vector_data_type, self.byte_scale)
+            bodies = build_searches(params, vector, self.preview_chars)
+            spans.append((len(searches), len(searches) + len(bodies)))
+            searches.extend(bodies)
+
+        with metrics.timer('OpenSearchSearchTime'):
+            responses = self.run_searches(searches)
+
+        outcomes = []
+        for params, (start, end) in zip(param_list, spans):
+            errors = [response['error'] for response in responses[start:end] if 'error' in response]
+            if errors:
+                outcomes.append({'error': f"Search failed: {errors[0]}"})
+                continue
+            hits = rank_hits(params, responses[start:end], self.rank_constant)
+            outcomes.append([format_hit(hit, score) for hit, score in hits])
+        return outcomes
+
+
+class LocalVectorBackend(SearchBackend):
+    """
+    Exact (or IVF) top-k over the vector store matrix; previews are the stored
+    leading characters of each chunk rather than highlighted fragments.
+    """
+    name = 'local'
+    modes = ('knn',)
+
+    def __init__(self, reader, preview_chars=500):
+        self.reader = reader
+        self.preview_chars = preview_chars
+
+    def format_hit(self, hit):
+        return {
+            "score": hit['score'],
+            "job_id": hit['id'],
+            "document_id": hit['document_id'],
+            "chunk_index": hit['chunk_index'],
+            "page_start": hit['page_start'],
+            "page_end": hit['page_end'],
+            "full_text_preview": (hit['preview'] or '')[:self.preview_chars],
+            "timestamp": hit['timestamp']
+        }
+
+    def search(self, param_list, vectors, metrics):
+        outcomes = []
+        with metrics.timer('VectorStoreSearchTime'):
+            for params, vector in zip(param_list, vectors):
+                hits = self.reader.search(vector, params['from'] + params['size'], params['filters'])
+                outcomes.append([self.format_hit(hit) for hit in hits[params['from']:]])
+        return outcomes
@@ -0,0 +1,78 @@
+"""
+Request parsing and part planning for the /upload/ and /upload/complete/ routes.
+
+Files of at least the multipart threshold are uploaded as an S3 multipart
+upload: /upload/ creates it and returns one presigned upload_part URL per
+part, the client PUTs the parts in parallel, then calls /upload/complete/
+with the ETag of every part (or with "abort": true to discard it).
+Smaller files keep the single presigned put_object URL.
+"""
+import math
+
+# S3 multipart limits.
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10000
+MAX_OBJECT_SIZE = 5 * 1024 ** 4
+
+
+class UploadRequestError(ValueError):
+    """
+    Raised for a malformed upload request; reported to the caller as a 400.
+    """
+
+
+def plan_parts(file_size, part_size, max_parts=MAX_PARTS):
+    """
+    Returns (part size, part count) for a multipart upload of file_size bytes.
+    The part size is raised when needed to stay within max_parts (at most S3's 10,000).
+    """
+    part_size = max(part_size, MIN_PART_SIZE, math.ceil(file_size / min(max_parts, MAX_PARTS)))
+    return part_size, max(1, math.ceil(file_size / part_size))
+
+
+def parse_upload_request(body):
+    """
+    Validates an /upload/ body: fileName and fileType, plus fileSize (bytes) to allow a multipart upload.
+    """
+    if not isinstance(body, dict):
+        raise UploadRequestError("Request body must be a JSON object.")
+    for name in ('fileName', 'fileType'):
+        if not isinstance(body.get(name), str) or not body[name]:
+            raise UploadRequestError(f"Missing {name}")
+    file_size = body.get('fileSize')
+    if file_size is not None:
+        if isinstance(file_size, bool) or not isinstance(file_size, int) or not 0 < file_size <= MAX_OBJECT_SIZE:
+            raise UploadRequestError(f"'fileSize' must be an integer between 1 and {MAX_OBJECT_SIZE}.")
+    return {'file_name': body['fileName'], 'file_type': body['fileType'], 'file_size': file_size}
+
+
+def parse_complete_request(body):
+    """
+    Validates an /upload/complete/ body: fileKey, uploadId and either parts
+    ([{"partNumber": n, "eTag": "..."}]; omitted to use the parts S3 has received) or "abort": true.
+    """
+    if not isinstance(body, dict):
+        raise UploadRequestError("Request body must be a JSON object.")
+    for name in ('fileKey', 'uploadId'):
+        if not isinstance(body.get(name), str) or not body[name]:
+            raise UploadRequestError(f"Missing {name}")
+    abort = body.get('abort', False)
+    if not isinstance(abort, bool):
+        raise UploadRequestError("'abort' must be a boolean.")
+
+    parts = body.get('parts')
+    if parts is not None and not abort:
+        if not isinstance(parts, list) or not parts or len(parts) > MAX_PARTS:
+            raise UploadRequestError(f"'parts' must be a list of 1 to {MAX_PARTS} parts.")
+        parsed = []
+        for i, part in enumerate(parts):
+            number = part.get('partNumber') if isinstance(part, dict) else None
+            etag = part.get('eTag') if isinstance(part, dict) else None
+            if isinstance(number, bool) or not isinstance(number, int) or not 1 <= number <= MAX_PARTS \
+                    or not isinstance(etag, str) or not etag:
+                raise UploadRequestError(f"parts[{i}]: must have an integer partNumber and an eTag.")
+            parsed.append({'PartNumber': number, 'ETag': etag})
+        parts = sorted(parsed, key=lambda part: part['PartNumber'])
+        if len({part['PartNumber'] for part in parts}) != len(parts):
+            raise UploadRequestError("'parts' has duplicate part numbers.")
+    return {'file_key': body['fileKey'], 'upload_id': body['uploadId'], 'parts': parts, 'abort': abort}
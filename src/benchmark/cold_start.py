@@ -0,0 +1,105 @@
+"""
+Measures cold-start cost of each Lambda: the time to import lambda_function.py
+(module-level imports and client construction) in a fresh interpreter, plus
+the lazy imports the API handler's search route pays on its first request.
+
+Each measurement runs in a new process so nothing is already imported.
+
+Usage:
+    python src/benchmark/cold_start.py --runs 5 [--model-server] [--output cold_start.json]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_LAYER_DIR = os.path.join(SRC_DIR, 'shared_layer', 'python')
+
+# Runs inside the child interpreter; prints a JSON object of millisecond timings.
+LAMBDA_PROBE = """
+import json, time
+start = time.perf_counter()
+import lambda_function
+timings = {'import_ms': (time.perf_counter() - start) * 1000,
+           'module_init_ms': getattr(lambda_function, 'INIT_DURATION_MS', None)}
+if hasattr(lambda_function, 'load_search_modules'):
+    timings['search_import_ms'] = lambda_function.load_search_modules()
+    start = time.perf_counter()
+    import opensearchpy, requests_aws4auth
+    timings['opensearch_import_ms'] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+"""
+
+MODEL_SERVER_PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+timings = {'import_ms': (time.perf_counter() - start) * 1000}
+start = time.perf_counter()
+app.model_fn(app.DEFAULT_MODEL_DIR)
+timings['model_load_ms'] = (time.perf_counter() - start) * 1000
+start = time.perf_counter()
+app.init_worker()
+timings['warmup_ms'] = (time.perf_counter() - start) * 1000
+print(json.dumps(timings))
+"""
+
+LAMBDAS = {
+    'orchestrator': 'orchestrator_lambda',
+    'processor': 'processor_lambda',
+    'api_handler': 'api_handler_lambda',
+}
+
+
+def probe(directory, script):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([directory, SHARED_LAYER_DIR, env.get('PYTHONPATH', '')])
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    env.setdefault('AWS_REGION', env['AWS_DEFAULT_REGION'])
+    env['METRICS_ENABLED'] = 'false'
+    result = subprocess.run([sys.executable, '-c', script], cwd=directory, env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples if sample.get(key) is not None]
+        if values:
+            summary[key] = {'median': statistics.median(values), 'min': min(values), 'max': max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters per component.")
+    parser.add_argument('--model-server', action='store_true',
+                        help="Also measure the model server's import, model load and warm-up (needs its dependencies).")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    components = {name: (os.path.join(SRC_DIR, directory), LAMBDA_PROBE) for name, directory in LAMBDAS.items()}
+    if args.model_server:
+        components['model_server'] = (os.path.join(SRC_DIR, 'sagemaker'), MODEL_SERVER_PROBE)
+
+    results = {}
+    for name, (directory, script) in components.items():
+        results[name] = summarize([probe(directory, script) for _ in range(args.runs)])
+
+    print(f"{'component':<16}{'timing':<24}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    for name, summary in results.items():
+        for key, stats in summary.items():
+            print(f"{name:<16}{key:<24}{stats['median']:>12.1f}{stats['min']:>10.1f}{stats['max']:>10.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,373 @@
+"""
+Local stand-ins for the AWS services that moto does not cover well enough
+for a throughput benchmark: Textract, the SageMaker endpoint and OpenSearch.
+"""
+import hashlib
+import io
+import json
+import random
+import threading
+import time
+import uuid
+import numpy as np
+from opensearchpy.serializer import JSONSerializer
+
+EMBEDDING_DIMENSION = 384
+
+WORDS = (
+    "invoice total amount due payment terms net days customer account number date "
+    "shipping address billing tax subtotal quantity unit price description item order "
+    "reference contract agreement party clause liability warranty service delivery "
+    "period renewal notice termination confidential signature approved vendor supplier"
+).split()
+
+BOILERPLATE_LINES = [
+    "This document is confidential and intended solely for the addressee.",
+    "Payment is due within 30 days of the invoice date.",
+    "All amounts are stated in US dollars unless otherwise noted.",
+    "Acme Corp, 100 Main Street, Springfield. Registered in Delaware.",
+]
+
+
+class Timer:
+    """
+    Thread-safe collection of named duration samples (milliseconds).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = {}
+
+    def record(self, stage, elapsed_ms):
+        with self._lock:
+            self.samples.setdefault(stage, []).append(elapsed_ms)
+
+    def time(self, stage):
+        timer = self
+
+        class _Context:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                timer.record(stage, (time.perf_counter() - self.start) * 1000)
+                return False
+
+        return _Context()
+
+
+def generate_blocks(document_seed, pages, lines_per_page, boilerplate_ratio=0.2):
+    """
+    Yields canned Textract blocks (PAGE, LINE and a FORMS key-value pair per page) for a synthetic document.
+    """
+    rng = random.Random(document_seed)
+    for page in range(1, pages + 1):
+        yield {'BlockType': 'PAGE', 'Id': str(uuid.UUID(int=rng.getrandbits(128))), 'Page': page}
+        for _ in range(lines_per_page):
+            if rng.random() < boilerplate_ratio:
+                text = rng.choice(BOILERPLATE_LINES)
+            else:
+                text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+            yield {
+                'BlockType': 'LINE',
+                'Id': str(uuid.UUID(int=rng.getrandbits(128))),
+                'Text': text,
+                'Page': page,
+                'Confidence': 99.0,
+            }
+        yield from form_blocks(document_seed, page)
+
+
+def form_blocks(document_seed, page):
+    """
+    Yields one FORMS key-value pair ("Page Total:" -> an amount) for a page, with its WORD blocks.
+    Ids are derived from the seed and page so the LINE blocks above are unaffected.
+    """
+    def block_id(name):
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, f"{document_seed}-{page}-{name}"))
+
+    amount = f"${(document_seed % 100000) / 100 + page:,.2f}"
+    yield {'BlockType': 'KEY_VALUE_SET', 'Id': block_id('key'), 'EntityTypes': ['KEY'], 'Page': page,
+           'Confidence': 95.0, 'Relationships': [{'Type': 'VALUE', 'Ids': [block_id('value')]},
+                                                 {'Type': 'CHILD', 'Ids': [block_id('w1'), block_id('w2')]}]}
+    yield {'BlockType': 'KEY_VALUE_SET', 'Id': block_id('value'), 'EntityTypes': ['VALUE'], 'Page': page,
+           'Confidence': 95.0, 'Relationships': [{'Type': 'CHILD', 'Ids': [block_id('w3')]}]}
+    for name, text in (('w1', 'Page'), ('w2', 'Total:'), ('w3', amount)):
+        yield {'BlockType': 'WORD', 'Id': block_id(name), 'Text': text, 'Page': page, 'Confidence': 99.0}
+
+
+class FakeTextractClient:
+    """
+    Implements start_document_analysis / get_document_analysis over canned blocks.
+
+    Starting a job writes the results to the OutputConfig prefix in (moto) S3, like
+    Textract does, and calls on_complete(job_id, bucket, key, job_tag) so the caller can
+    publish the completion notification.
+    """
+
+    def __init__(self, s3_client, pages, lines_per_page, blocks_per_part=1000, on_complete=None):
+        self.s3_client = s3_client
+        self.pages = pages
+        self.lines_per_page = lines_per_page
+        self.blocks_per_part = blocks_per_part
+        self.on_complete = on_complete
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    def start_document_analysis(self, DocumentLocation, OutputConfig=None, **kwargs):
+        job_id = uuid.uuid4().hex
+        bucket = DocumentLocation['S3Object']['Bucket']
+        key = DocumentLocation['S3Object']['Name']
+        seed = int(hashlib.sha256(key.encode('utf-8')).hexdigest()[:8], 16)
+        blocks = list(generate_blocks(seed, self.pages, self.lines_per_page))
+        with self._lock:
+            self.jobs[job_id] = blocks
+        if OutputConfig:
+            prefix = OutputConfig.get('S3Prefix', 'textract_output')
+            for part, start in enumerate(range(0, len(blocks), self.blocks_per_part), start=1):
+                self.s3_client.put_object(
+                    Bucket=OutputConfig['S3Bucket'],
+                    Key=f"{prefix}/{job_id}/{part}",
+                    Body=json.dumps({'JobStatus': 'SUCCEEDED', 'Blocks': blocks[start:start + self.blocks_per_part]})
+                )
+        if self.on_complete:
+            self.on_complete(job_id, bucket, key, kwargs.get('JobTag'))
+        return {'JobId': job_id}
+
+    def get_document_analysis(self, JobId, NextToken=None, MaxResults=1000):
+        blocks = self.jobs[JobId]
+        start = int(NextToken or 0)
+        response = {'JobStatus': 'SUCCEEDED', 'Blocks': blocks[start:start + MaxResults]}
+        if start + MaxResults < len(blocks):
+            response['NextToken'] = str(start + MaxResults)
+        return response
+
+
+def fake_encode(texts, dimension=EMBEDDING_DIMENSION):
+    """
+    Deterministic stand-in for the embedding model: a unit vector seeded by the text.
+    """
+    rows = np.empty((len(texts), dimension), dtype=np.float32)
+    for i, text in enumerate(texts):
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        rows[i] = np.random.default_rng(seed).standard_normal(dimension, dtype=np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return rows
+
+
+class FakeSageMakerRuntime:
+    """
+    Implements invoke_endpoint. Requests are served by the fake encoder (with an
+    optional simulated per-call and per-row latency) or by the Flask model server's
+    /invocations route through its test client.
+    """
+
+    def __init__(self, timer, call_latency_ms=0.0, row_latency_ms=0.0, flask_app=None):
+        self.timer = timer
+        self.call_latency_ms = call_latency_ms
+        self.row_latency_ms = row_latency_ms
+        self.flask_client = flask_app.test_client() if flask_app is not None else None
+        self.calls = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType='application/json', Accept='application/json', **kwargs):
+        start = time.perf_counter()
+        if self.flask_client is not None:
+            response = self.flask_client.post('/invocations', data=Body, content_type=ContentType,
+                                              headers={'Accept': Accept})
+            if response.status_code != 200:
+                raise RuntimeError(f"Model server returned {response.status_code}: {response.data[:200]}")
+            body, content_type = response.data, response.mimetype
+            rows = None
+        else:
+            from docuinsight.wire_format import encode_embeddings
+            texts = json.loads(Body)['text']
+            texts = [texts] if isinstance(texts, str) else texts
+            rows = len(texts)
+            simulated = self.call_latency_ms + self.row_latency_ms * rows
+            if simulated:
+                time.sleep(simulated / 1000.0)
+            body, content_type = encode_embeddings(fake_encode(texts), Accept)
+            body = body.encode('utf-8') if isinstance(body, str) else body
+        with self._lock:
+            self.calls += 1
+            self.rows += rows or 0
+        self.timer.record('sagemaker.invoke_endpoint', (time.perf_counter() - start) * 1000)
+        return {'Body': io.BytesIO(body), 'ContentType': content_type}
+
+
+class _FakeIndices:
+    def __init__(self, store):
+        self.store = store
+
+    def put_settings(self, index, body):
+        for name in self.store.resolve(index):
+            settings = self.store.settings.setdefault(name, {})
+            settings.update(body.get('index', body))
+            # A null value resets the setting to its default.
+            for key in [key for key, value in settings.items() if value is None]:
+                del settings[key]
+        return {'acknowledged': True}
+
+    def get_settings(self, index, name=None):
+        key = name[len('index.'):] if name else None
+        result = {}
+        for index_name in self.store.resolve(index):
+            settings = self.store.settings.get(index_name, {})
+            if key is not None:
+                settings = {key: settings[key]} if key in settings else {}
+            result[index_name] = {'settings': {'index': dict(settings)}}
+        return result
+
+    def exists(self, index):
+        return index in self.store.docs or index in self.store.aliases
+
+    def create(self, index, body=None):
+        self.store.docs.setdefault(index, {})
+        self.store.mappings[index] = (body or {}).get('mappings', {})
+        return {'acknowledged': True, 'index': index}
+
+    def get_mapping(self, index):
+        return {name: {'mappings': self.store.mappings.get(name, {})} for name in self.store.resolve(index)}
+
+    def refresh(self, index=None):
+        return {}
+
+    def exists_alias(self, name):
+        return name in self.store.aliases
+
+    def get_alias(self, name):
+        return {index: {'aliases': {name: {}}} for index in self.store.aliases[name]}
+
+    def update_aliases(self, body):
+        with self.store._lock:
+            for action in body['actions']:
+                if 'add' in action:
+                    self.store.aliases.setdefault(action['add']['alias'], set()).add(action['add']['index'])
+                elif 'remove' in action:
+                    self.store.aliases.get(action['remove']['alias'], set()).discard(action['remove']['index'])
+                elif 'remove_index' in action:
+                    self.store.docs.pop(action['remove_index']['index'], None)
+        return {'acknowledged': True}
+
+
+class _FakeTransport:
+    serializer = JSONSerializer()
+
+
+class FakeOpenSearch:
+    """
+    In-memory OpenSearch stand-in supporting bulk indexing, aliases and exact kNN search.
+    """
+
+    def __init__(self, timer):
+        self.timer = timer
+        self.docs = {}
+        self.settings = {}
+        self.mappings = {}
+        self.aliases = {}
+        self.indices = _FakeIndices(self)
+        self.transport = _FakeTransport()
+        self._lock = threading.Lock()
+
+    def resolve(self, index):
+        """
+        Returns the indices behind a name: the alias's indices, or the name itself.
+        """
+        return sorted(self.aliases[index]) if index in self.aliases else [index]
+
+    def bulk(self, body, **kwargs):
+        start = time.perf_counter()
+        lines = body.splitlines() if isinstance(body, str) else body
+        items = []
+        with self._lock:
+            for action_line, source_line in zip(lines[::2], lines[1::2]):
+                action = json.loads(action_line)['index']
+                source = json.loads(source_line)
+                self.docs.setdefault(self.resolve(action['_index'])[0], {})[action['_id']] = source
+                items.append({'index': {'_id': action['_id'], 'status': 201}})
+        self.timer.record('opensearch.bulk', (time.perf_counter() - start) * 1000)
+        return {'errors': False, 'items': items}
+
+    def index(self, index, id, body, **kwargs):
+        with self._lock:
+            self.docs.setdefault(self.resolve(index)[0], {})[id] = json.loads(self.transport.serializer.dumps(body))
+        return {'result': 'created', '_id': id}
+
+    def search(self, index, body, **kwargs):
+        start = time.perf_counter()
+        response = self._search(index, body)
+        self.timer.record('opensearch.search', (time.perf_counter() - start) * 1000)
+        return response
+
+    def msearch(self, body, index=None, **kwargs):
+        start = time.perf_counter()
+        responses = []
+        for header, search_body in zip(body[::2], body[1::2]):
+            responses.append(self._search(header.get('index', index), search_body))
+        self.timer.record('opensearch.msearch', (time.perf_counter() - start) * 1000)
+        return {'responses': responses}
+
+    @staticmethod
+    def _matches_filters(source, clauses):
+        for clause in clauses:
+            if 'terms' in clause:
+                field, values = next(iter(clause['terms'].items()))
+                if source.get(field) not in values:
+                    return False
+            elif 'range' in clause:
+                field, bounds = next(iter(clause['range'].items()))
+                value = str(source.get(field))
+                if 'gte' in bounds and value < bounds['gte']:
+                    return False
+                if 'lte' in bounds and value > bounds['lte']:
+                    return False
+        return True
+
+    def _search(self, index, body):
+        """
+        Supports the query shapes the API handler sends: knn with an optional
+        filter, or match optionally wrapped in a bool with filter clauses, plus
+        from/size and highlighting.
+        """
+        query = body['query']
+        filters = []
+        if 'bool' in query:
+            filters = query['bool'].get('filter', [])
+            query = query['bool']['must'][0]
+        elif 'knn' in query:
+            filters = query['knn']['embedding'].get('filter', {}).get('bool', {}).get('filter', [])
+        with self._lock:
+            docs = [(doc_id, source) for name in self.resolve(index) for doc_id, source in self.docs.get(name, {}).items()
+                    if self._matches_filters(source, filters)]
+        offset = body.get('from', 0)
+        size = body.get('size', 10)
+        if not docs:
+            return {'hits': {'total': {'value': 0}, 'hits': []}}
+
+        if 'knn' in query:
+            knn = query['knn']['embedding']
+            matrix = np.asarray([source['embedding'] for _, source in docs], dtype=np.float32)
+            vector = np.asarray(knn['vector'], dtype=np.float32)
+            # Default knn_vector space (l2): score = 1 / (1 + squared distance)
+            scores = 1.0 / (1.0 + np.sum((matrix - vector) ** 2, axis=1))
+            top = np.argsort(-scores)[:knn.get('k', size)]
+        else:
+            # Term-overlap stand-in for BM25.
+            terms = set(query['match']['text_content'].lower().split())
+            scores = np.asarray([len(terms & set(source.get('text_content', '').lower().split()))
+                                 for _, source in docs], dtype=np.float32)
+            top = [i for i in np.argsort(-scores, kind='stable') if scores[i] > 0]
+
+        fields = body.get('_source')
+        highlight = body.get('highlight', {}).get('fields', {}).get('text_content')
+        hits = []
+        for i in list(top)[offset:offset + size]:
+            doc_id, source = docs[i]
+            hit = {'_id': doc_id, '_score': float(scores[i])}
+            hit['_source'] = {field: source.get(field) for field in fields if field in source} if fields else source
+            if highlight:
+                hit['highlight'] = {'text_content': [source.get('text_content', '')[:highlight['fragment_size']]]}
+            hits.append(hit)
+        return {'hits': {'total': {'value': len(top)}, 'hits': hits}}
@@ -0,0 +1,444 @@
+"""
+Offline end-to-end pipeline benchmark.
+
+Runs orchestrator -> processor -> api_handler in-process against local stand-ins:
+moto for S3, SQS and DynamoDB, a canned Textract block generator, a deterministic
+fake encoder (or the Flask model server in src/sagemaker/app.py), and an in-memory
+OpenSearch. Reports per-stage latency percentiles, documents/sec and queries/sec,
+and writes the results as JSON so runs can be compared for regressions.
+
+Usage:
+    python run_benchmark.py --documents 20 --pages 30 --queries 500 --concurrency 4
+    python run_benchmark.py --output current.json --baseline baseline.json --tolerance 0.2
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, 'sagemaker'))  # app.py for --encoder flask
+sys.path.insert(0, os.path.join(SRC_DIR, 'shared_layer', 'python'))  # docuinsight (the shared Lambda layer)
+
+from fakes import Timer, FakeTextractClient, FakeSageMakerRuntime, FakeOpenSearch, WORDS  # noqa: E402
+
+REGION = 'us-east-1'
+INPUT_BUCKET = 'docuinsight-bench-input'
+OUTPUT_BUCKET = 'docuinsight-bench-textract-output'
+METADATA_TABLE = 'DocuInsight-Bench-Metadata'
+CHUNK_CACHE_TABLE = 'DocuInsight-Bench-Chunk-Cache'
+QUERY_CACHE_TABLE = 'DocuInsight-Bench-Query-Cache'
+REINDEX_TABLE = 'DocuInsight-Bench-Reindex-Runs'
+QUEUE_NAME = 'DocuInsight-Bench-Textract-Notifications'
+ENDPOINT_NAME = 'docuinsight-bench-endpoint'
+
+
+class FakeContext:
+    """
+    Minimal Lambda context exposing the remaining time budget.
+    """
+
+    def __init__(self, timeout_seconds):
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return int((self.deadline - time.monotonic()) * 1000)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=10, help='Number of documents to ingest.')
+    parser.add_argument('--pages', type=int, default=20, help='Pages per document.')
+    parser.add_argument('--lines-per-page', type=int, default=40, help='Textract LINE blocks per page.')
+    parser.add_argument('--queries', type=int, default=200, help='Number of search queries to run.')
+    parser.add_argument('--distinct-queries', type=int, default=50, help='Size of the query pool (repeats hit caches).')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='Processor workers per batch, and concurrent api_handler containers.')
+    parser.add_argument('--sqs-batch-size', type=int, default=10, help='SQS records per processor invocation.')
+    parser.add_argument('--embedding-batch-size', type=int, default=64, help='Chunks per embedding call.')
+    parser.add_argument('--encoder', choices=['fake', 'flask'], default='fake',
+                        help="'fake' uses a deterministic hash encoder; 'flask' calls the model server in app.py.")
+    parser.add_argument('--call-latency-ms', type=float, default=20.0,
+                        help='Simulated endpoint overhead per invoke_endpoint call (fake encoder only).')
+    parser.add_argument('--row-latency-ms', type=float, default=0.5,
+                        help='Simulated encode time per text (fake encoder only).')
+    parser.add_argument('--chunk-cache', choices=['dynamodb', 'local', 'none'], default='dynamodb',
+                        help='Chunk embedding cache backend for the processor.')
+    parser.add_argument('--search-mode', choices=['knn', 'text', 'hybrid'], default='knn',
+                        help='Search mode sent with every query.')
+    parser.add_argument('--search-backend', choices=['opensearch', 'local'], default='opensearch',
+                        help="Serve queries from OpenSearch or from the in-process vector store (knn mode only).")
+    parser.add_argument('--result-cache-size', type=int, default=512,
+                        help='Search result cache entries per API container (0 disables it).')
+    parser.add_argument('--backfill', action='store_true',
+                        help="After ingest, rebuild the index with the backfill job and swap the alias before querying.")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='benchmark_results.json', help='Where to write the JSON results.')
+    parser.add_argument('--baseline', help='Previous results file to compare throughput against.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed fractional throughput drop versus the baseline before failing.')
+    parser.add_argument('--verbose', action='store_true', help='Show Lambda logs and prints.')
+    return parser.parse_args(argv)
+
+
+def configure_environment(args):
+    os.environ.update({
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'benchmark',
+        'AWS_SECRET_ACCESS_KEY': 'benchmark',
+        'SAGEMAKER_ENDPOINT_NAME': ENDPOINT_NAME,
+        'OPENSEARCH_DOMAIN_ENDPOINT': 'localhost',
+        'DYNAMODB_TABLE_NAME': METADATA_TABLE,
+        'TEXTRACT_OUTPUT_S3_BUCKET': OUTPUT_BUCKET,
+        'S3_INPUT_BUCKET': INPUT_BUCKET,
+        'EMBEDDING_CACHE_TABLE': QUERY_CACHE_TABLE,
+        'MAX_WORKERS': str(args.concurrency),
+        'EMBEDDING_BATCH_SIZE': str(args.embedding_batch_size),
+        'LOG_LEVEL': 'INFO' if args.verbose else 'WARNING',
+        'SEARCH_BACKEND': args.search_backend,
+        'REINDEX_TABLE_NAME': REINDEX_TABLE,
+        'BACKFILL_EMBEDDINGS_PER_SECOND': '0',
+        'RESULT_CACHE_SIZE': str(args.result_cache_size),
+        # The in-memory OpenSearch makes writes searchable immediately.
+        'RESULT_CACHE_SETTLE_SECONDS': '0',
+    })
+    if args.search_backend == 'local':
+        # The processor appends segments to the store in the moto bucket the API then loads.
+        os.environ['VECTOR_STORE_BUCKET'] = OUTPUT_BUCKET
+        os.environ['VECTOR_STORE_CACHE_DIR'] = os.path.join(os.getcwd(), '.benchmark-vector-store')
+    if args.chunk_cache == 'none':
+        os.environ['EMBEDDING_CACHE_BACKEND'] = ''
+    else:
+        os.environ['EMBEDDING_CACHE_BACKEND'] = args.chunk_cache
+        os.environ['EMBEDDING_CACHE_DIR'] = os.path.join(os.getcwd(), '.benchmark-embedding-cache')
+
+
+def create_resources():
+    import boto3
+    s3 = boto3.client('s3', region_name=REGION)
+    for bucket in (INPUT_BUCKET, OUTPUT_BUCKET):
+        s3.create_bucket(Bucket=bucket)
+
+    dynamodb = boto3.client('dynamodb', region_name=REGION)
+    dynamodb.create_table(
+        TableName=METADATA_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'document_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[
+            {'AttributeName': 'document_id', 'AttributeType': 'S'},
+            {'AttributeName': 'content_hash', 'AttributeType': 'S'},
+        ],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'content_hash-index',
+            'KeySchema': [{'AttributeName': 'content_hash', 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'},
+        }]
+    )
+    for table in (CHUNK_CACHE_TABLE, QUERY_CACHE_TABLE):
+        dynamodb.create_table(
+            TableName=table,
+            BillingMode='PAY_PER_REQUEST',
+            KeySchema=[{'AttributeName': 'cache_key', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'cache_key', 'AttributeType': 'S'}]
+        )
+
+    dynamodb.create_table(
+        TableName=REINDEX_TABLE,
+        BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'run_id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'run_id', 'AttributeType': 'S'}]
+    )
+
+    sqs = boto3.client('sqs', region_name=REGION)
+    queue_url = sqs.create_queue(QueueName=QUEUE_NAME)['QueueUrl']
+    return s3, sqs, queue_url
+
+
+def load_lambda(module_name, directory, env=None):
+    """
+    Imports a Lambda's lambda_function.py under a unique module name, with its
+    directory on sys.path so its helper modules resolve. env temporarily
+    overrides environment variables read at import time.
+    """
+    directory = os.path.join(SRC_DIR, directory)
+    saved_env = {key: os.environ.get(key) for key in (env or {})}
+    os.environ.update(env or {})
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(directory, 'lambda_function.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(directory)
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def load_backfill(processor):
+    """
+    Imports processor_lambda/backfill.py on top of an already loaded (and patched)
+    processor module, which it sees as lambda_function.
+    """
+    directory = os.path.join(SRC_DIR, 'processor_lambda')
+    saved_module = sys.modules.get('lambda_function')
+    sys.modules['lambda_function'] = processor
+    sys.path.insert(0, directory)
+    try:
+        spec = importlib.util.spec_from_file_location('bench_backfill', os.path.join(directory, 'backfill.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    finally:
+        sys.path.remove(directory)
+        if saved_module is None:
+            sys.modules.pop('lambda_function', None)
+        else:
+            sys.modules['lambda_function'] = saved_module
+
+
+def timed_generator(timer, stage, generator):
+    """
+    Wraps a generator, recording the total time spent producing its items as one sample.
+    """
+    def wrapper(*args, **kwargs):
+        iterator = iter(generator(*args, **kwargs))
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            timer.record(stage, elapsed * 1000)
+    return wrapper
+
+
+def timed_function(timer, stage, function):
+    def wrapper(*args, **kwargs):
+        with timer.time(stage):
+            return function(*args, **kwargs)
+    return wrapper
+
+
+def percentiles(samples):
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        'count': int(values.size),
+        'mean_ms': round(float(values.mean()), 3),
+        'p50_ms': round(float(np.percentile(values, 50)), 3),
+        'p90_ms': round(float(np.percentile(values, 90)), 3),
+        'p99_ms': round(float(np.percentile(values, 99)), 3),
+        'max_ms': round(float(values.max()), 3),
+    }
+
+
+def make_queries(args):
+    rng = random.Random(args.seed)
+    pool = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for _ in range(args.distinct_queries)]
+    return [rng.choice(pool) for _ in range(args.queries)]
+
+
+def run(args):
+    from moto import mock_aws
+
+    timer = Timer()
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    with mock_aws(), quiet:
+        configure_environment(args)
+        s3, sqs, queue_url = create_resources()
+
+        flask_app = None
+        if args.encoder == 'flask':
+            import app as model_server
+            model_server.model_fn(None)
+            model_server.init_worker()
+            flask_app = model_server.app
+        sagemaker = FakeSageMakerRuntime(timer, args.call_latency_ms, args.row_latency_ms, flask_app=flask_app)
+        opensearch = FakeOpenSearch(timer)
+
+        def publish_completion(job_id, bucket, key, job_tag=None):
+            message = {
+                'JobId': job_id,
+                'Status': 'SUCCEEDED',
+                'API': 'StartDocumentAnalysis',
+                'DocumentLocation': {'S3Bucket': bucket, 'S3ObjectName': key},
+            }
+            if job_tag:
+                message['JobTag'] = job_tag
+            sqs.send_message(QueueUrl=queue_url, MessageBody=json.dumps({'Message': json.dumps(message)}))
+
+        textract = FakeTextractClient(s3, args.pages, args.lines_per_page, on_complete=publish_completion)
+
+        orchestrator = load_lambda('bench_orchestrator', 'orchestrator_lambda')
+        orchestrator.textract_client = textract
+
+        processor = load_lambda('bench_processor', 'processor_lambda',
+                                env={'EMBEDDING_CACHE_TABLE': CHUNK_CACHE_TABLE})
+        processor.textract_client = textract
+        processor.sagemaker_runtime_client = sagemaker
+        processor.opensearch_client = opensearch
+        processor.iter_textract_lines = timed_generator(timer, 'processor.textract_fetch', processor.iter_textract_lines)
+        processor.embed_chunks = timed_function(timer, 'processor.embed_batch', processor.embed_chunks)
+
+        # One module instance per concurrent api_handler container, each with its own warm caches.
+        api_handlers = []
+        for i in range(max(1, args.concurrency)):
+            api = load_lambda(f'bench_api_handler_{i}', 'api_handler_lambda')
+            api.sagemaker_runtime_client = sagemaker
+            api.opensearch_client = opensearch
+            api_handlers.append(api)
+
+        logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+        # --- Ingest: upload -> orchestrator -> (fake Textract -> SQS) -> processor ---
+        ingest_start = time.perf_counter()
+        for i in range(args.documents):
+            key = f"bench/document-{args.seed}-{i}.pdf"
+            response = s3.put_object(Bucket=INPUT_BUCKET, Key=key, Body=f"document {i}".encode('utf-8'))
+            event = {'Records': [{'s3': {
+                'bucket': {'name': INPUT_BUCKET},
+                'object': {'key': key, 'eTag': response['ETag'].strip('"'), 'size': len(f"document {i}")},
+            }}]}
+            with timer.time('orchestrator.handler'):
+                orchestrator.handler(event, FakeContext(900))
+
+        failed_records = 0
+        while True:
+            messages = sqs.receive_message(QueueUrl=queue_url,
+                                           MaxNumberOfMessages=min(10, args.sqs_batch_size)).get('Messages', [])
+            if not messages:
+                break
+            records = [{'messageId': m['MessageId'], 'receiptHandle': m['ReceiptHandle'], 'body': m['Body']}
+                       for m in messages]
+            with timer.time('processor.lambda_handler'):
+                result = processor.lambda_handler({'Records': records}, FakeContext(180))
+            failed = {failure['itemIdentifier'] for failure in result.get('batchItemFailures', [])}
+            failed_records += len(failed)
+            for m in messages:
+                # Failed messages are dropped rather than redelivered so the benchmark terminates.
+                sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=m['ReceiptHandle'])
+        ingest_seconds = time.perf_counter() - ingest_start
+        ingest_endpoint_calls = sagemaker.calls
+
+        # --- Optional backfill: re-chunk and re-embed every document into a new index, then swap the alias ---
+        backfill_seconds = None
+        if args.backfill:
+            backfill = load_backfill(processor)
+            backfill_start = time.perf_counter()
+            with timer.time('backfill.handler'):
+                run = backfill.lambda_handler({'action': 'start', 'alias': processor.OPENSEARCH_INDEX_NAME,
+                                               'replace_index': True}, FakeContext(900))
+            backfill_seconds = time.perf_counter() - backfill_start
+            if run['status'] != 'COMPLETED':
+                raise RuntimeError(f"Backfill run ended with status {run['status']}: {run}")
+        query_endpoint_start = sagemaker.calls
+
+        # --- Query: concurrent /search/ calls spread over the api_handler containers ---
+        queries = make_queries(args)
+
+        def search(indexed_query):
+            index, query_text = indexed_query
+            api = api_handlers[index % len(api_handlers)]
+            event = {'path': '/search/', 'httpMethod': 'POST', 'body': json.dumps({'query_text': query_text, 'mode': args.search_mode})}
+            start = time.perf_counter()
+            response = api.lambda_handler(event, FakeContext(300))
+            timer.record('api.search', (time.perf_counter() - start) * 1000)
+            return response['statusCode']
+
+        query_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(api_handlers)) as executor:
+            statuses = list(executor.map(search, enumerate(queries)))
+        query_seconds = time.perf_counter() - query_start
+
+        chunks_indexed = sum(len(docs) for docs in opensearch.docs.values())
+
+    return {
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'verbose')},
+        'throughput': {
+            'documents_per_sec': round(args.documents / ingest_seconds, 3) if ingest_seconds else None,
+            'backfill_documents_per_sec': round(args.documents / backfill_seconds, 3) if backfill_seconds else None,
+            'chunks_per_sec': round(chunks_indexed / ingest_seconds, 3) if ingest_seconds else None,
+            'queries_per_sec': round(len(queries) / query_seconds, 3) if query_seconds else None,
+        },
+        'totals': {
+            'documents': args.documents,
+            'chunks_indexed': chunks_indexed,
+            'failed_records': failed_records,
+            'ingest_seconds': round(ingest_seconds, 3),
+            'query_seconds': round(query_seconds, 3),
+            'backfill_seconds': round(backfill_seconds, 3) if backfill_seconds else None,
+            'ingest_endpoint_calls': ingest_endpoint_calls,
+            'query_endpoint_calls': sagemaker.calls - query_endpoint_start,
+            'failed_queries': sum(1 for status in statuses if status != 200),
+        },
+        'stages': {stage: percentiles(samples) for stage, samples in sorted(timer.samples.items())},
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns a list of throughput metrics that dropped by more than tolerance versus the baseline.
+    """
+    regressions = []
+    for metric, value in results['throughput'].items():
+        previous = baseline.get('throughput', {}).get(metric)
+        if previous and value is not None and value < previous * (1 - tolerance):
+            regressions.append(f"{metric}: {value} vs baseline {previous} (-{(1 - value / previous) * 100:.1f}%)")
+    return regressions
+
+
+def print_report(results):
+    print("\nThroughput")
+    for metric, value in results['throughput'].items():
+        print(f"  {metric:<28} {value}")
+    print("\nTotals")
+    for metric, value in results['totals'].items():
+        print(f"  {metric:<24} {value}")
+    print(f"\n{'stage':<28}{'count':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<28}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p90_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print_report(results)
+    print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\nThroughput regressions:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("\nNo throughput regressions against the baseline.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
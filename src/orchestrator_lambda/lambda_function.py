@@ -1,75 +1,485 @@
+import time
+INIT_STARTED = time.perf_counter()
+
 import os
-import boto3
 import json
+import uuid
+import hashlib
+import logging
+import tempfile
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from urllib.parse import unquote_plus
+from docuinsight.metrics import MetricsLogger, consume_cold_start, log_event
+from docuinsight.fanout import format_part_tag
+from docuinsight import clients
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-s3_client = boto3.client('s3')
-textract_client = boto3.client("textract", region_name="us-east-1")
+s3_client = clients.get_client('s3')
+textract_client = clients.get_client('textract', region_name='us-east-1')
+dynamodb_client = clients.get_client('dynamodb')
 
 TEXTRACT_OUTPUT_S3_BUCKET = os.environ.get('TEXTRACT_OUTPUT_S3_BUCKET')
 TEXTRACT_SNS_TOPIC_ARN = os.environ.get('TEXTRACT_SNS_TOPIC_ARN')
 TEXTRACT_SNS_TOPIC_ROLE_ARN = os.environ.get('TEXTRACT_SNS_TOPIC_ROLE_ARN')
+TEXTRACT_OUTPUT_S3_PREFIX = os.environ.get('TEXTRACT_OUTPUT_S3_PREFIX', 'textract_output')
 
-def handler(event, context):
+# Content-hash deduplication. DEDUP_HASH_MODE is 'etag' (free, taken from the S3 event)
+# or 'sha256' (streams the object; also matches re-uploads that used different multipart sizes).
+DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME')
+CONTENT_HASH_INDEX_NAME = os.environ.get('CONTENT_HASH_INDEX_NAME', 'content_hash-index')
+DEDUP_HASH_MODE = os.environ.get('DEDUP_HASH_MODE', 'etag').lower()
+
+# Metadata statuses that mean an identical document is already (being) processed.
+REUSABLE_STATUSES = {'TEXTRACT_STARTED', 'EMBEDDINGS_GENERATED'}
+
+# The content_hash GSI is eventually consistent, so before starting Textract an
+# upload claims its hash with a conditional put of a hash-keyed item
+# (document_id = DEDUP_CLAIM_PREFIX + hash). It has no status or content_hash,
+# so the backfill scan and the GSI never see it. A claim that never got its
+# document (the invocation died before starting Textract) can be taken over
+# after DEDUP_CLAIM_TIMEOUT_SECONDS.
+DEDUP_CLAIM_PREFIX = 'content_hash#'
+DEDUP_CLAIM_TIMEOUT_SECONDS = int(os.environ.get('DEDUP_CLAIM_TIMEOUT_SECONDS', '900'))
+
+# Page-range fan-out for large PDFs. A PDF of more than TEXTRACT_FANOUT_PAGE_THRESHOLD
+# pages is split into parts of TEXTRACT_FANOUT_PAGES_PER_PART pages, each analysed by
+# its own Textract job, so the time to searchable follows the largest part rather than
+# the whole document. 0 disables the fan-out. Only PDFs of at least
+# TEXTRACT_FANOUT_MIN_BYTES are opened to count their pages.
+TEXTRACT_FANOUT_PAGE_THRESHOLD = int(os.environ.get('TEXTRACT_FANOUT_PAGE_THRESHOLD', '0'))
+TEXTRACT_FANOUT_PAGES_PER_PART = int(os.environ.get('TEXTRACT_FANOUT_PAGES_PER_PART', '50'))
+TEXTRACT_FANOUT_MIN_BYTES = int(os.environ.get('TEXTRACT_FANOUT_MIN_BYTES', str(1024 * 1024)))
+TEXTRACT_FANOUT_CONCURRENCY = int(os.environ.get('TEXTRACT_FANOUT_CONCURRENCY', '5'))
+# Part PDFs are staged under their own prefix of the Textract output bucket, which
+# expires them (see the bucket's lifecycle rule); the input bucket would trigger
+# this function again for every part.
+TEXTRACT_FANOUT_PARTS_PREFIX = os.environ.get('TEXTRACT_FANOUT_PARTS_PREFIX', 'fanout_parts')
+
+def compute_content_hash(bucket_name, object_key, s3_object):
     """
-    Lambda handler for the Orchestrator function.
-    Triggered by S3 ObjectCreated events.
-    Initiates an asynchronous Textract document analysis job.
+    Returns a content hash for the uploaded object.
+    ETags are prefixed with the object size, as multipart ETags are not plain MD5 digests.
     """
-    print(f"Received event: {json.dumps(event)}")
+    if DEDUP_HASH_MODE == 'sha256':
+        digest = hashlib.sha256()
+        response = s3_client.get_object(Bucket=bucket_name, Key=object_key)
+        for chunk in response['Body'].iter_chunks(chunk_size=1024 * 1024):
+            digest.update(chunk)
+        return f"sha256:{digest.hexdigest()}"
 
-    # Extract bucket name and object key from the S3 event
-    if 'Records' not in event or not event['Records']:
-        print("No records found in the S3 event.")
-        return {
-            'statusCode': 400,
-            'body': json.dumps({'message': 'No S3 records found in event.'})
-        }
+    etag = s3_object.get('eTag')
+    size = s3_object.get('size')
+    if not etag:
+        head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+        etag, size = head['ETag'], head['ContentLength']
+    etag = etag.strip('"')
+    return f"etag:{etag}:{size}"
 
-    s3_record = event['Records'][0]['s3']
-    bucket_name = s3_record['bucket']['name']
-    object_key = s3_record['object']['key']
+def find_existing_document(content_hash):
+    """
+    Looks up a document with the same content hash in the metadata table.
+    Returns the metadata item, or None if this content has not been seen.
+    """
+    response = dynamodb_client.query(
+        TableName=DYNAMODB_TABLE_NAME,
+        IndexName=CONTENT_HASH_INDEX_NAME,
+        KeyConditionExpression='content_hash = :content_hash',
+        ExpressionAttributeValues={':content_hash': {'S': content_hash}}
+    )
+    for item in response.get('Items', []):
+        if item.get('status', {}).get('S') in REUSABLE_STATUSES:
+            return item
+    return None
+
+def claim_key(content_hash):
+    return {'document_id': {'S': f"{DEDUP_CLAIM_PREFIX}{content_hash}"}}
+
+def get_document_status(document_id):
+    response = dynamodb_client.get_item(
+        TableName=DYNAMODB_TABLE_NAME,
+        Key={'document_id': {'S': document_id}},
+        ProjectionExpression='#status',
+        ExpressionAttributeNames={'#status': 'status'},
+        ConsistentRead=True
+    )
+    return response.get('Item', {}).get('status', {}).get('S')
+
+def claim_content_hash(content_hash, s3_path):
+    """
+    Claims the content hash for this upload before any Textract job is started.
+
+    Returns None if this upload now owns the hash and must be processed.
+    Otherwise returns the item this duplicate upload is recorded on: the
+    claimed document's id (recording it is left to the caller), or, while the
+    owner is still starting Textract, the claim item's own id. In that case
+    the upload has already been added to the claim's pending duplicates, which
+    complete_claim moves to the document.
+    """
+    key = claim_key(content_hash)
+    for _attempt in range(3):
+        now = str(time.time())
+        try:
+            dynamodb_client.put_item(
+                TableName=DYNAMODB_TABLE_NAME,
+                Item={**key, 'claimed_s3_path': {'S': s3_path}, 'claimed_at': {'N': now}},
+                ConditionExpression='attribute_not_exists(document_id)'
+            )
+            return None
+        except dynamodb_client.exceptions.ConditionalCheckFailedException:
+            pass
+
+        claim = dynamodb_client.get_item(TableName=DYNAMODB_TABLE_NAME, Key=key, ConsistentRead=True).get('Item')
+        if claim is None:
+            continue  # Released in the meantime; claim it again.
+        document_id = claim.get('claimed_document_id', {}).get('S')
+        if document_id:
+            if get_document_status(document_id) in REUSABLE_STATUSES:
+                return document_id
+            # The claimed document failed; this upload processes the content again.
+            condition = 'claimed_document_id = :previous'
+            values = {':previous': {'S': document_id}}
+        else:
+            if time.time() - float(claim['claimed_at']['N']) < DEDUP_CLAIM_TIMEOUT_SECONDS:
+                if record_pending_duplicate(content_hash, s3_path):
+                    return key['document_id']['S']
+                continue  # Completed or released in the meantime; look again.
+            condition = 'claimed_at = :previous AND attribute_not_exists(claimed_document_id)'
+            values = {':previous': claim['claimed_at']}
+        try:
+            dynamodb_client.update_item(
+                TableName=DYNAMODB_TABLE_NAME,
+                Key=key,
+                UpdateExpression='SET claimed_s3_path = :path, claimed_at = :now REMOVE claimed_document_id',
+                ConditionExpression=condition,
+                ExpressionAttributeValues={**values, ':path': {'S': s3_path}, ':now': {'N': now}}
+            )
+            logger.info(f"Took over the claim on {content_hash} from {document_id or 'an unfinished upload'}.")
+            return None
+        except dynamodb_client.exceptions.ConditionalCheckFailedException:
+            continue  # Another upload took it over first; look again.
+    raise RuntimeError(f"Could not claim or resolve content hash {content_hash}.")
+
+def complete_claim(content_hash, document_id):
+    """
+    Points the claim at the document it started. Uploads recorded on the claim
+    while the job was being started are moved to the document.
+    """
+    response = dynamodb_client.update_item(
+        TableName=DYNAMODB_TABLE_NAME,
+        Key=claim_key(content_hash),
+        UpdateExpression='SET claimed_document_id = :document_id',
+        ExpressionAttributeValues={':document_id': {'S': document_id}},
+        ReturnValues='ALL_NEW'
+    )
+    pending = response.get('Attributes', {}).get('duplicate_s3_paths')
+    if pending:
+        record_duplicate(document_id, pending['SS'])
 
-    print(f"Processing S3 object: s3://{bucket_name}/{object_key}")
-    print(f"Role ARN for Textract SNS Topic: {TEXTRACT_SNS_TOPIC_ROLE_ARN}")
-   
+def record_pending_duplicate(content_hash, s3_path):
+    """
+    Adds a duplicate upload to the claim while its owner is still starting
+    Textract. Returns False if the claim has got its document (complete_claim
+    has already moved the pending uploads) or has been released in the meantime.
+    """
     try:
-        response = textract_client.start_document_analysis(
-            DocumentLocation={
-                'S3Object': {
-                    'Bucket': bucket_name,
-                    'Name': object_key
-                }
-            },
-            FeatureTypes=['FORMS', 'TABLES'],
-            
-            NotificationChannel={
-                'SNSTopicArn': TEXTRACT_SNS_TOPIC_ARN,
-                'RoleArn': TEXTRACT_SNS_TOPIC_ROLE_ARN
-            },
-            
-            OutputConfig={
-                'S3Bucket': TEXTRACT_OUTPUT_S3_BUCKET
-                
-            }
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key=claim_key(content_hash),
+            UpdateExpression='ADD duplicate_s3_paths :path',
+            ConditionExpression='attribute_exists(document_id) AND attribute_not_exists(claimed_document_id)',
+            ExpressionAttributeValues={':path': {'SS': [s3_path]}}
         )
+        return True
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        return False
 
-        job_id = response['JobId']
-        print(f"Successfully started Textract job: {job_id} for s3://{bucket_name}/{object_key}")
+def release_claim(content_hash, s3_path):
+    """
+    Deletes this upload's claim after a failed start, so a retry or re-upload can claim the content again.
+    """
+    try:
+        dynamodb_client.delete_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key=claim_key(content_hash),
+            ConditionExpression='claimed_s3_path = :path AND attribute_not_exists(claimed_document_id)',
+            ExpressionAttributeValues={':path': {'S': s3_path}}
+        )
+    except Exception as e:
+        logger.warning(f"Could not release the claim on {content_hash}: {e}")
 
-        return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': f'Textract job {job_id} initiated.',
-                'jobId': job_id,
+def record_duplicate(document_id, s3_paths):
+    dynamodb_client.update_item(
+        TableName=DYNAMODB_TABLE_NAME,
+        Key={'document_id': {'S': document_id}},
+        UpdateExpression='ADD duplicate_s3_paths :path',
+        ExpressionAttributeValues={':path': {'SS': list(s3_paths)}}
+    )
+
+def start_textract_job(bucket_name, object_key, job_tag=None):
+    params = {}
+    if job_tag:
+        params['JobTag'] = job_tag
+    response = textract_client.start_document_analysis(
+        DocumentLocation={
+            'S3Object': {
+                'Bucket': bucket_name,
+                'Name': object_key
+            }
+        },
+        FeatureTypes=['FORMS', 'TABLES'],
+
+        NotificationChannel={
+            'SNSTopicArn': TEXTRACT_SNS_TOPIC_ARN,
+            'RoleArn': TEXTRACT_SNS_TOPIC_ROLE_ARN
+        },
+
+        OutputConfig={
+            'S3Bucket': TEXTRACT_OUTPUT_S3_BUCKET,
+            'S3Prefix': TEXTRACT_OUTPUT_S3_PREFIX
+        },
+        **params
+    )
+    return response['JobId']
+
+@contextmanager
+def open_pdf_for_fanout(bucket_name, object_key, s3_object):
+    """
+    Yields a pypdf reader for the upload if it is a PDF large enough to be split, otherwise None.
+
+    The object is downloaded to /tmp in chunks and the reader is given the open
+    file, so pypdf reads only the objects it needs instead of holding the whole
+    PDF in memory. The file is removed on exit.
+    """
+    if TEXTRACT_FANOUT_PAGE_THRESHOLD <= 0 or not object_key.lower().endswith('.pdf'):
+        yield None
+        return
+    size = s3_object.get('size')
+    if size is not None and size < TEXTRACT_FANOUT_MIN_BYTES:
+        yield None
+        return
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        logger.warning("pypdf is not installed; large PDFs are analysed as a single Textract job.")
+        yield None
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'upload.pdf')
+        s3_client.download_file(bucket_name, object_key, path)
+        with open(path, 'rb') as handle:
+            try:
+                reader = PdfReader(handle)
+                page_count = len(reader.pages)
+            except Exception as e:
+                logger.warning(f"Could not read s3://{bucket_name}/{object_key} as a PDF ({e}); not splitting it.")
+                reader, page_count = None, 0
+            yield reader if page_count > TEXTRACT_FANOUT_PAGE_THRESHOLD else None
+
+def page_ranges(page_count, pages_per_part):
+    """
+    Returns (first page, last page) pairs, 1-based and inclusive, covering page_count pages.
+    """
+    return [(first, min(first + pages_per_part - 1, page_count))
+            for first in range(1, page_count + 1, pages_per_part)]
+
+def write_pdf_part(reader, document_id, part_index, first_page, last_page):
+    """
+    Uploads pages first_page..last_page of the PDF to the fan-out parts prefix of
+    the Textract output bucket, staging the part in /tmp. Returns the object key.
+    """
+    from pypdf import PdfWriter
+    writer = PdfWriter()
+    for page_number in range(first_page - 1, last_page):
+        writer.add_page(reader.pages[page_number])
+    key = f"{TEXTRACT_FANOUT_PARTS_PREFIX}/{document_id}/part-{part_index:04d}.pdf"
+    with tempfile.NamedTemporaryFile(suffix='.pdf') as part:
+        writer.write(part)
+        part.flush()
+        s3_client.upload_file(part.name, TEXTRACT_OUTPUT_S3_BUCKET, key,
+                              ExtraArgs={'ContentType': 'application/pdf'})
+    return key
+
+def start_fanout_jobs(reader, s3_path, content_hash, metrics):
+    """
+    Splits a large PDF into page ranges and starts one Textract job per part, concurrently.
+
+    The document gets its own id; each part's job tag carries that id, the part
+    index and its page offset so the processor can index the part as soon as its
+    job completes. The metadata item lists the parts, and the processor marks the
+    document EMBEDDINGS_GENERATED once every part is indexed.
+    """
+    document_id = uuid.uuid4().hex
+    ranges = page_ranges(len(reader.pages), TEXTRACT_FANOUT_PAGES_PER_PART)
+    with metrics.timer('FanoutSplitTime'):
+        keys = [write_pdf_part(reader, document_id, i, first, last) for i, (first, last) in enumerate(ranges)]
+
+    def start(part):
+        i, (first, _last) = part
+        return start_textract_job(TEXTRACT_OUTPUT_S3_BUCKET, keys[i],
+                                  job_tag=format_part_tag(document_id, i, first - 1))
+
+    with metrics.timer('TextractStartTime'):
+        with ThreadPoolExecutor(max_workers=max(1, min(TEXTRACT_FANOUT_CONCURRENCY, len(ranges)))) as executor:
+            job_ids = list(executor.map(start, enumerate(ranges)))
+    metrics.put_metric('FanoutParts', len(ranges), 'Count')
+    logger.info(f"Started {len(job_ids)} Textract jobs for the {len(reader.pages)} pages of {s3_path} (document {document_id}).")
+
+    if DYNAMODB_TABLE_NAME:
+        parts = [{'M': {'job_id': {'S': job_id}, 'first_page': {'N': str(first)}, 'last_page': {'N': str(last)}}}
+                 for job_id, (first, last) in zip(job_ids, ranges)]
+        with metrics.timer('DynamoDBWriteTime'):
+            dynamodb_client.put_item(
+                TableName=DYNAMODB_TABLE_NAME,
+                Item={
+                    'document_id': {'S': document_id},
+                    's3_path': {'S': s3_path},
+                    'content_hash': {'S': content_hash},
+                    'status': {'S': 'TEXTRACT_STARTED'},
+                    'page_count': {'N': str(len(reader.pages))},
+                    'part_count': {'N': str(len(ranges))},
+                    'parts': {'L': parts},
+                    'part_chunks': {'M': {}},
+                    'part_fields': {'M': {}},
+                    'timestamp': {'S': datetime.now(timezone.utc).isoformat()}
+                }
+            )
+    return document_id, job_ids
+
+def process_s3_record(s3_record, metrics):
+    """
+    Starts a Textract job for one uploaded object, unless an identical
+    document has already been processed, in which case its results are reused.
+    The content hash is claimed first, so concurrent identical uploads start
+    only one job. Stage durations are recorded on metrics.
+    """
+    bucket_name = s3_record['bucket']['name']
+    object_key = unquote_plus(s3_record['object']['key'])
+    s3_path = f"s3://{bucket_name}/{object_key}"
+
+    logger.info(f"Processing S3 object: {s3_path}")
+
+    content_hash = None
+    if DYNAMODB_TABLE_NAME:
+        with metrics.timer('HashTime'):
+            content_hash = compute_content_hash(bucket_name, object_key, s3_record['object'])
+        with metrics.timer('DedupLookupTime'):
+            # The GSI still finds documents processed before claims existed.
+            existing = find_existing_document(content_hash)
+            duplicate_of = existing['document_id']['S'] if existing else claim_content_hash(content_hash, s3_path)
+        if duplicate_of:
+            logger.info(f"{s3_path} is identical to {duplicate_of} ({content_hash}); skipping Textract.")
+            # Uploads pending on a claim were already recorded on it by claim_content_hash.
+            if not duplicate_of.startswith(DEDUP_CLAIM_PREFIX):
+                record_duplicate(duplicate_of, [s3_path])
+            return {
+                'jobId': None if duplicate_of.startswith(DEDUP_CLAIM_PREFIX) else duplicate_of,
+                'deduplicated': True,
                 'originalS3Bucket': bucket_name,
                 'originalS3Key': object_key
-            })
+            }
+
+    try:
+        result = start_document(bucket_name, object_key, s3_record['object'], s3_path, content_hash, metrics)
+    except Exception:
+        if content_hash:
+            release_claim(content_hash, s3_path)
+        raise
+    if content_hash:
+        complete_claim(content_hash, result['jobId'])
+    return result
+
+def start_document(bucket_name, object_key, s3_object, s3_path, content_hash, metrics):
+    """
+    Starts the Textract job(s) for an upload and writes its metadata item.
+    """
+    with open_pdf_for_fanout(bucket_name, object_key, s3_object) as reader:
+        fanout = start_fanout_jobs(reader, s3_path, content_hash, metrics) if reader is not None else None
+    if fanout is not None:
+        document_id, job_ids = fanout
+        return {
+            'jobId': document_id,
+            'partJobIds': job_ids,
+            'deduplicated': False,
+            'originalS3Bucket': bucket_name,
+            'originalS3Key': object_key
         }
 
-    except Exception as e:
-        print(f"Error starting Textract job for {object_key}: {e}")
+    with metrics.timer('TextractStartTime'):
+        job_id = start_textract_job(bucket_name, object_key)
+    logger.info(f"Successfully started Textract job: {job_id} for {s3_path}")
+
+    if DYNAMODB_TABLE_NAME:
+        with metrics.timer('DynamoDBWriteTime'):
+            dynamodb_client.put_item(
+                TableName=DYNAMODB_TABLE_NAME,
+                Item={
+                    'document_id': {'S': job_id},
+                    's3_path': {'S': s3_path},
+                    'content_hash': {'S': content_hash},
+                    'status': {'S': 'TEXTRACT_STARTED'},
+                    'timestamp': {'S': datetime.now(timezone.utc).isoformat()}
+                }
+            )
+
+    return {
+        'jobId': job_id,
+        'deduplicated': False,
+        'originalS3Bucket': bucket_name,
+        'originalS3Key': object_key
+    }
+
+def handler(event, context):
+    """
+    Lambda handler for the Orchestrator function.
+    Triggered by S3 ObjectCreated events.
+    Initiates an asynchronous Textract document analysis job for every record,
+    skipping uploads whose content has already been processed.
+    """
+    started_at = time.perf_counter()
+    metrics = MetricsLogger('orchestrator')
+    cold_start = consume_cold_start()
+    metrics.put_metric('ColdStart', int(cold_start), 'Count')
+    if cold_start:
+        metrics.put_metric('InitTime', INIT_DURATION_MS)
+    log_event(logger, event)
+
+    # Extract bucket name and object key from the S3 event
+    if 'Records' not in event or not event['Records']:
+        logger.warning("No records found in the S3 event.")
         return {
-            'statusCode': 500,
-            'body': json.dumps({'message': f'Failed to start Textract job: {str(e)}'})
+            'statusCode': 400,
+            'body': json.dumps({'message': 'No S3 records found in event.'})
         }
 
+    results = []
+    errors = []
+    for record in event['Records']:
+        try:
+            results.append(process_s3_record(record['s3'], metrics))
+        except Exception as e:
+            object_key = record.get('s3', {}).get('object', {}).get('key')
+            logger.exception(f"Error starting Textract job for {object_key}: {e}")
+            errors.append({'originalS3Key': object_key, 'message': f'Failed to start Textract job: {str(e)}'})
+
+    started = sum(1 for result in results if not result['deduplicated'])
+    metrics.put_metric('RecordCount', len(event['Records']), 'Count')
+    metrics.put_metric('TextractJobsStarted', started, 'Count')
+    metrics.put_metric('Deduplicated', len(results) - started, 'Count')
+    metrics.put_metric('FailedRecords', len(errors), 'Count')
+    metrics.put_metric('HandlerTime', (time.perf_counter() - started_at) * 1000)
+    metrics.flush()
+    return {
+        'statusCode': 500 if errors else 200,
+        'body': json.dumps({
+            'message': f'{started} Textract jobs initiated, {len(results) - started} duplicates skipped.',
+            'results': results,
+            'errors': errors
+        })
+    }
+
+# Module import and global setup time, reported with the first invocation.
+INIT_DURATION_MS = (time.perf_counter() - INIT_STARTED) * 1000
@@ -0,0 +1,354 @@
+"""
+Re-embedding / reindex backfill job (handler: backfill.lambda_handler).
+
+Rebuilds the chunk index from the Textract outputs already in the output
+bucket, without re-uploading documents or running Textract again. It uses the
+processor's chunking and embedding code, so a new CHUNK_* setting, embedding
+model (SAGEMAKER_ENDPOINT_NAME / EMBEDDING_MODEL_ID) or index configuration
+takes effect for every document.
+
+    {"action": "start", "alias": "index", "index_config": {"m": 32}, "replace_index": false}
+    {"action": "resume", "run_id": "..."}      (also sent by the job to itself)
+    {"action": "status", "run_id": "..."}
+    {"action": "swap", "run_id": "...", "replace_index": false}
+
+A run creates a new versioned index, walks the document metadata table page
+by page and processes each page's documents on BACKFILL_WORKERS threads.
+After every page the scan position is checkpointed in REINDEX_TABLE_NAME.
+Before the Lambda runs out of time it invokes itself asynchronously with
+"resume". A run killed by a timeout is retried by the async invocation and
+continues from its last checkpoint, since chunk ids are deterministic and
+re-indexing a page is idempotent.
+
+When the scan is done, documents processed live since the run started are
+caught up. Then replicas and refresh are restored and the alias is swapped to
+the new index. The swap is skipped (status READY_TO_SWAP) if documents failed
+or "swap" is false; once the failures have been reviewed, "swap" moves the alias
+of a READY_TO_SWAP run.
+
+Document timestamps and the catch-up bounds are UTC isoformat() strings, so the
+catch-up filter compares them as strings. (Items written before timestamps
+carried an offset hold the Lambda's local time, which is UTC, and still order
+correctly.)
+
+Endpoint load is bounded by BACKFILL_EMBEDDINGS_PER_SECOND, a token bucket on
+the texts sent to SageMaker, and by BACKFILL_WORKERS concurrent calls. Deploy
+the function with a reserved concurrency of 1.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import lambda_function as processor
+from lambda_function import logger, dynamodb_client, index_document, get_opensearch_client, remaining_seconds
+from docuinsight.metrics import MetricsLogger, log_event
+from docuinsight import clients
+from docuinsight.search_index import create_index, get_index_config, swap_alias
+
+REINDEX_TABLE_NAME = os.environ.get('REINDEX_TABLE_NAME')
+BACKFILL_INDEX_PREFIX = os.environ.get('BACKFILL_INDEX_PREFIX', 'docuinsight-chunks')
+BACKFILL_WORKERS = int(os.environ.get('BACKFILL_WORKERS', '2'))
+BACKFILL_PAGE_SIZE = int(os.environ.get('BACKFILL_PAGE_SIZE', '20'))
+BACKFILL_EMBEDDINGS_PER_SECOND = float(os.environ.get('BACKFILL_EMBEDDINGS_PER_SECOND', '50'))
+# Refresh interval the finished index gets; it is loaded with refresh off, which
+# index_document(manage_refresh=False) leaves alone.
+BACKFILL_REFRESH_INTERVAL = os.environ.get('BACKFILL_REFRESH_INTERVAL', '1s')
+# Time kept in reserve to finish the current page, checkpoint and re-invoke.
+BACKFILL_STOP_SECONDS = float(os.environ.get('BACKFILL_STOP_SECONDS', '120'))
+# Failed document ids kept on the run item (the count is always exact).
+MAX_RECORDED_FAILURES = 100
+
+# Statuses of a document whose chunks belong in the index.
+INDEXED_STATUSES = ('EMBEDDINGS_GENERATED',)
+
+lambda_client = clients.get_client('lambda')
+
+
+class RateLimiter:
+    """
+    Token bucket shared by the worker threads: acquire(n) blocks until n tokens
+    (texts) are available. The bucket holds at most one second of tokens, so
+    an idle period does not turn into a burst on the endpoint.
+    """
+
+    def __init__(self, rate_per_second):
+        self.rate = rate_per_second
+        self.tokens = rate_per_second
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, count):
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Batches larger than the bucket are let through once it is full.
+                if self.tokens >= min(count, self.rate):
+                    self.tokens -= count
+                    return
+                wait = (min(count, self.rate) - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def new_run_id():
+    return datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')
+
+
+def load_run(run_id):
+    response = dynamodb_client.get_item(TableName=REINDEX_TABLE_NAME, Key={'run_id': {'S': run_id}},
+                                        ConsistentRead=True)
+    if 'Item' not in response:
+        raise ValueError(f"Unknown backfill run: {run_id}")
+    return json.loads(response['Item']['state']['S'])
+
+
+def run_exists(run_id):
+    response = dynamodb_client.get_item(TableName=REINDEX_TABLE_NAME, Key={'run_id': {'S': run_id}},
+                                        ProjectionExpression='run_id', ConsistentRead=True)
+    return 'Item' in response
+
+
+def save_run(run):
+    """
+    Checkpoints the run. The whole state is one JSON attribute; status is duplicated for queries.
+    """
+    run['updated_at'] = datetime.now(timezone.utc).isoformat()
+    dynamodb_client.put_item(TableName=REINDEX_TABLE_NAME, Item={
+        'run_id': {'S': run['run_id']},
+        'status': {'S': run['status']},
+        'state': {'S': json.dumps(run)},
+    })
+
+
+def start_run(event):
+    """
+    Creates the target index (refresh off, no replicas while loading) and the run record.
+    """
+    alias = event.get('alias', processor.OPENSEARCH_INDEX_NAME)
+    run_id = event.get('run_id') or new_run_id()
+    target_index = event.get('target_index') or f"{BACKFILL_INDEX_PREFIX}-{run_id}"
+    client = get_opensearch_client()
+
+    # Unless overridden, the new index keeps the live index's settings.
+    index_config = {}
+    if client.indices.exists(index=alias):
+        index_config = get_index_config(client, alias) or {}
+    index_config.update(event.get('index_config', {}))
+    index_config = create_index(client, target_index, index_config)
+    client.indices.put_settings(index=target_index, body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+
+    run = {
+        'run_id': run_id,
+        'status': 'RUNNING',
+        'phase': 'scan',
+        'alias': alias,
+        'target_index': target_index,
+        'index_config': index_config,
+        'swap': event.get('swap', True),
+        'replace_index': event.get('replace_index', False),
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'cursor': None,
+        'documents_done': 0,
+        'chunks_done': 0,
+        'documents_failed': 0,
+        'failed_documents': [],
+        'invocations': 0,
+    }
+    save_run(run)
+    logger.info(f"Started backfill run {run_id} into '{target_index}' (alias '{alias}').")
+    return run
+
+
+def scan_page(cursor, caught_up_since=None):
+    """
+    Returns one page of indexable documents from the metadata table and the next cursor.
+    With caught_up_since, only documents processed at or after that time are returned.
+    """
+    expression = '#status IN (' + ', '.join(f":s{i}" for i in range(len(INDEXED_STATUSES))) + ')'
+    values = {f":s{i}": {'S': status} for i, status in enumerate(INDEXED_STATUSES)}
+    if caught_up_since:
+        expression += ' AND #timestamp >= :since'
+        values[':since'] = {'S': caught_up_since}
+    params = {
+        'TableName': processor.DYNAMODB_TABLE_NAME,
+        'Limit': BACKFILL_PAGE_SIZE,
+        'FilterExpression': expression,
+        'ProjectionExpression': 'document_id, #timestamp, parts',
+        'ExpressionAttributeNames': {'#status': 'status', '#timestamp': 'timestamp'},
+        'ExpressionAttributeValues': values,
+    }
+    if cursor:
+        params['ExclusiveStartKey'] = cursor
+    response = dynamodb_client.scan(**params)
+    documents = [(item['document_id']['S'], item.get('timestamp', {}).get('S'), document_parts(item))
+                 for item in response.get('Items', [])]
+    return documents, response.get('LastEvaluatedKey')
+
+
+def document_parts(item):
+    """
+    Returns the (Textract job id, part) pairs of a fanned-out document's metadata item, or None.
+    """
+    if 'parts' not in item:
+        return None
+    return [(entry['M']['job_id']['S'],
+             {'document_id': item['document_id']['S'], 'index': index,
+              'page_offset': int(entry['M']['first_page']['N']) - 1})
+            for index, entry in enumerate(item['parts']['L'])]
+
+
+def reindex_page(documents, target_index, rate_limiter, metrics):
+    """
+    Re-chunks, re-embeds and indexes a page of documents in parallel.
+    Returns (documents indexed, chunks indexed, failed document ids).
+    """
+    def reindex(document):
+        job_id, timestamp, parts = document
+        try:
+            processed_at = datetime.fromisoformat(timestamp) if timestamp else datetime.now(timezone.utc)
+            if parts is None:
+                chunk_count, _ = index_document(job_id, target_index, processed_at, metrics, rate_limiter,
+                                                manage_refresh=False)
+                return chunk_count, None
+            chunk_count = 0
+            for part_job_id, part in parts:
+                part_chunks, _ = index_document(part_job_id, target_index, processed_at, metrics, rate_limiter,
+                                                part=part, manage_refresh=False)
+                chunk_count += part_chunks
+            return chunk_count, None
+        except Exception as e:
+            logger.error(f"Backfill failed for document {job_id}: {e}", exc_info=True)
+            return 0, job_id
+
+    with ThreadPoolExecutor(max_workers=max(1, BACKFILL_WORKERS)) as executor:
+        results = list(executor.map(reindex, documents))
+    failed = [job_id for _, job_id in results if job_id is not None]
+    return len(documents) - len(failed), sum(chunks for chunks, _ in results), failed
+
+
+def finish_run(run):
+    """
+    Restores replicas and refresh on the new index and swaps the alias, unless the run should not swap.
+    """
+    client = get_opensearch_client()
+    target = run['target_index']
+    client.indices.put_settings(index=target, body={'index': {
+        'refresh_interval': BACKFILL_REFRESH_INTERVAL,
+        'number_of_replicas': run['index_config'].get('replicas', 1),
+    }})
+    client.indices.refresh(index=target)
+    if run['documents_failed'] or not run['swap']:
+        run['status'] = 'READY_TO_SWAP'
+        logger.warning(f"Backfill run {run['run_id']} finished without swapping the alias "
+                       f"({run['documents_failed']} failed documents, swap={run['swap']}).")
+        return
+    swap_run(run)
+
+
+def swap_run(run):
+    """
+    Points the run's alias at its index. On failure the run stays READY_TO_SWAP with the error recorded.
+    """
+    try:
+        run['previous_indices'] = swap_alias(get_opensearch_client(), run['alias'], run['target_index'],
+                                             replace_index=run['replace_index'])
+        run['status'] = 'COMPLETED'
+        run.pop('error', None)
+        processor.record_index_write()
+        logger.info(f"Backfill run {run['run_id']} swapped alias '{run['alias']}' to '{run['target_index']}'.")
+    except ValueError as e:
+        run['status'] = 'READY_TO_SWAP'
+        run['error'] = str(e)
+        logger.warning(f"Backfill run {run['run_id']} could not swap the alias: {e}")
+
+
+def continue_run(run, context, metrics):
+    """
+    Processes pages until the run is done or the time budget is spent. Returns True if the run needs another invocation.
+    """
+    rate_limiter = RateLimiter(BACKFILL_EMBEDDINGS_PER_SECOND)
+    run['invocations'] += 1
+    while True:
+        if remaining_seconds(context) < BACKFILL_STOP_SECONDS:
+            save_run(run)
+            return True
+
+        # The catch-up phase picks up documents the live processor indexed into the old index during the scan.
+        caught_up_since = run['catch_up_since'] if run['phase'] == 'catch_up' else None
+        documents, cursor = scan_page(run['cursor'], caught_up_since)
+        if documents:
+            with metrics.timer('BackfillPageTime'):
+                done, chunks, failed = reindex_page(documents, run['target_index'], rate_limiter, metrics)
+            run['documents_done'] += done
+            run['chunks_done'] += chunks
+            run['documents_failed'] += len(failed)
+            run['failed_documents'] = (run['failed_documents'] + failed)[:MAX_RECORDED_FAILURES]
+            metrics.put_metric('BackfillDocuments', done, 'Count')
+            metrics.put_metric('BackfillFailedDocuments', len(failed), 'Count')
+        run['cursor'] = cursor
+        if run['phase'] == 'catch_up' and documents:
+            run['catch_up_found'] = True
+        if cursor is None:
+            if run['phase'] == 'scan' or run['catch_up_found']:
+                # Another catch-up pass over the documents processed since the previous pass started,
+                # repeated until a pass finds nothing new.
+                run['phase'] = 'catch_up'
+                run['catch_up_since'] = run.get('catch_up_next', run['started_at'])
+                run['catch_up_next'] = datetime.now(timezone.utc).isoformat()
+                run['catch_up_found'] = False
+            else:
+                finish_run(run)
+                save_run(run)
+                return False
+        save_run(run)
+        logger.info(f"Backfill run {run['run_id']}: {run['documents_done']} documents, {run['chunks_done']} chunks, "
+                    f"{run['documents_failed']} failed (phase {run['phase']}).")
+
+
+def lambda_handler(event, context):
+    log_event(logger, event)
+    if not REINDEX_TABLE_NAME:
+        raise RuntimeError("REINDEX_TABLE_NAME environment variable not set.")
+    action = event.get('action', 'resume' if event.get('run_id') else 'start')
+
+    if action == 'status':
+        return load_run(event['run_id'])
+    if action == 'swap':
+        run = load_run(event['run_id'])
+        if run['status'] != 'READY_TO_SWAP':
+            logger.info(f"Backfill run {run['run_id']} is {run['status']}; only READY_TO_SWAP runs can be swapped.")
+            return run
+        if 'replace_index' in event:
+            run['replace_index'] = event['replace_index']
+        swap_run(run)
+        save_run(run)
+        return run
+    if action == 'start' and event.get('run_id') and run_exists(event['run_id']):
+        # A retried start event continues the run it already created.
+        action = 'resume'
+    if action == 'start':
+        run = start_run(event)
+    else:
+        run = load_run(event['run_id'])
+        if run['status'] != 'RUNNING':
+            logger.info(f"Backfill run {run['run_id']} is already {run['status']}.")
+            return run
+
+    metrics = MetricsLogger('backfill')
+    metrics.set_property('RunId', run['run_id'])
+    try:
+        needs_more_time = continue_run(run, context, metrics)
+    finally:
+        metrics.flush()
+
+    if needs_more_time:
+        logger.info(f"Backfill run {run['run_id']} checkpointed; continuing in a new invocation.")
+        lambda_client.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event',
+                             Payload=json.dumps({'action': 'resume', 'run_id': run['run_id']}))
+    return run
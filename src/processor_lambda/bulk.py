@@ -0,0 +1,183 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+# Bulk item statuses worth retrying: throttling and transient server errors.
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+# Refresh is disabled while at least one large ingest is running in this
+# container and restored when the last one finishes, to the interval the index
+# had before the first one started. index -> [ingests running, interval to restore]
+_refresh_lock = threading.Lock()
+_refresh_state = {}
+
+
+class BulkIndexError(Exception):
+    """
+    Raised when some documents could not be indexed after all retries.
+    """
+
+    def __init__(self, message, failed_items):
+        super().__init__(message)
+        self.failed_items = failed_items
+
+
+def _get_refresh_interval(client, index):
+    """
+    Returns the index's explicit refresh_interval, or None if it uses the cluster default.
+    """
+    response = client.indices.get_settings(index=index, name='index.refresh_interval')
+    # Keyed by concrete index name, also when index is an alias.
+    for settings in response.values():
+        return settings.get('settings', {}).get('index', {}).get('refresh_interval')
+    return None
+
+
+def _disable_refresh(client, index, default_interval):
+    with _refresh_lock:
+        state = _refresh_state.get(index)
+        if state is None:
+            previous = _get_refresh_interval(client, index)
+            if previous == '-1':
+                # Left off by an ingest in another container, or by one that was killed
+                # before it could restore it; either way not the interval to put back.
+                previous = default_interval
+            client.indices.put_settings(index=index, body={'index': {'refresh_interval': '-1'}})
+            logger.info(f"Disabled refresh on index '{index}' for a large ingest "
+                        f"(restoring {previous or 'the default'} afterwards).")
+            state = _refresh_state[index] = [0, previous]
+        state[0] += 1
+
+
+def _restore_refresh(client, index):
+    with _refresh_lock:
+        state = _refresh_state.get(index)
+        if state is None:
+            return
+        state[0] -= 1
+        if state[0] <= 0:
+            del _refresh_state[index]
+            previous = state[1]
+            # None resets the setting, so an index that had no explicit interval gets the default back.
+            client.indices.put_settings(index=index, body={'index': {'refresh_interval': previous}})
+            logger.info(f"Restored refresh_interval={previous or 'default'} on index '{index}'.")
+
+
+class BulkIndexer:
+    """
+    Buffers index operations and sends them through the _bulk API in
+    requests of at most max_bytes.
+
+    Items that fail with a retryable status are re-sent on their own (not the
+    whole request) with exponential backoff. Once an ingest needs more than
+    one bulk request, index refresh is switched off until close(), which puts
+    back the refresh_interval the index had before. If refresh was already off,
+    refresh_interval is restored instead. Pass manage_refresh=False for an index
+    that is loaded with refresh off on purpose (a backfill target).
+
+    Usage:
+        with BulkIndexer(client, 'index') as indexer:
+            indexer.index(doc_id, body)
+    """
+
+    def __init__(self, client, index, max_bytes=5 * 1024 * 1024, max_retries=3,
+                 initial_backoff=0.5, refresh_interval='1s', manage_refresh=True):
+        self.client = client
+        self.index_name = index
+        self.max_bytes = max_bytes
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.refresh_interval = refresh_interval
+        self.manage_refresh = manage_refresh
+        self._serializer = client.transport.serializer
+        self._buffer = []  # (doc_id, action line, source line)
+        self._buffer_bytes = 0
+        self._refresh_disabled = False
+        self.indexed = 0
+        self.requests = 0
+        self.bytes_sent = 0
+        self.bulk_ms = 0.0
+        self.failed_items = []
+
+    def index(self, doc_id, body):
+        """
+        Queues a document for indexing, flushing first if it would overflow the current request.
+        """
+        action = self._serializer.dumps({'index': {'_index': self.index_name, '_id': doc_id}})
+        source = self._serializer.dumps(body)
+        size = len(action.encode('utf-8')) + len(source.encode('utf-8')) + 2
+        if self._buffer and self._buffer_bytes + size > self.max_bytes:
+            self.flush()
+        self._buffer.append((doc_id, action, source))
+        self._buffer_bytes += size
+
+    def flush(self):
+        """
+        Sends the buffered operations, retrying failed items individually.
+        """
+        if not self._buffer:
+            return
+        if self.manage_refresh and not self._refresh_disabled and self.requests > 0:
+            _disable_refresh(self.client, self.index_name, self.refresh_interval)
+            self._refresh_disabled = True
+
+        pending = self._buffer
+        self._buffer, self._buffer_bytes = [], 0
+        backoff = self.initial_backoff
+        for attempt in range(self.max_retries + 1):
+            retry = []
+            payload = "".join(f"{action}\n{source}\n" for _, action, source in pending)
+            self.requests += 1
+            self.bytes_sent += len(payload.encode('utf-8'))
+            started = time.perf_counter()
+            response = self.client.bulk(body=payload)
+            self.bulk_ms += (time.perf_counter() - started) * 1000
+            if not response.get('errors'):
+                self.indexed += len(pending)
+                return
+            for operation, item in zip(pending, response['items']):
+                result = item.get('index', {})
+                status = result.get('status', 500)
+                if status < 300:
+                    self.indexed += 1
+                elif status in RETRYABLE_STATUSES and attempt < self.max_retries:
+                    retry.append(operation)
+                else:
+                    self.failed_items.append({'id': operation[0], 'status': status, 'error': result.get('error')})
+            if not retry:
+                return
+            logger.warning(f"Retrying {len(retry)} of {len(pending)} bulk items in {backoff:.1f}s "
+                           f"(attempt {attempt + 1}/{self.max_retries}).")
+            time.sleep(backoff)
+            backoff *= 2
+            pending = retry
+
+    def close(self):
+        """
+        Flushes remaining operations and restores the refresh interval.
+        Raises BulkIndexError if any document could not be indexed.
+        """
+        try:
+            self.flush()
+        finally:
+            if self._refresh_disabled:
+                self._refresh_disabled = False
+                _restore_refresh(self.client, self.index_name)
+        if self.failed_items:
+            raise BulkIndexError(
+                f"{len(self.failed_items)} documents failed to index into '{self.index_name}'.",
+                self.failed_items
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._refresh_disabled:
+            self._refresh_disabled = False
+            _restore_refresh(self.client, self.index_name)
+        return False
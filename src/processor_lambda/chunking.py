@@ -0,0 +1,110 @@
+import re
+from collections import deque
+from itertools import islice
+
+# all-MiniLM-L6-v2 truncates its input at 256 word-piece tokens. Our estimate
+# below counts whitespace/punctuation pieces (what BERT's basic tokenizer sees
+# before word-piece splitting), so the default leaves headroom for sub-words.
+DEFAULT_CHUNK_MAX_TOKENS = 200
+DEFAULT_CHUNK_OVERLAP_TOKENS = 40
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text):
+    """
+    Returns an approximate token count for a piece of text.
+    Words and punctuation marks are counted separately, mirroring the
+    pre-tokenization step of the embedding model's tokenizer.
+    """
+    return len(_TOKEN_PATTERN.findall(text))
+
+
+def _split_long_line(text, page, max_tokens):
+    """
+    Splits a single line that is longer than max_tokens into word-bounded pieces.
+    """
+    piece, piece_tokens = [], 0
+    for word in text.split():
+        word_tokens = estimate_tokens(word) or 1
+        if piece and piece_tokens + word_tokens > max_tokens:
+            yield " ".join(piece), piece_tokens, page
+            piece, piece_tokens = [], 0
+        piece.append(word)
+        piece_tokens += word_tokens
+    if piece:
+        yield " ".join(piece), piece_tokens, page
+
+
+def chunk_lines(lines, max_tokens=DEFAULT_CHUNK_MAX_TOKENS, overlap_tokens=DEFAULT_CHUNK_OVERLAP_TOKENS):
+    """
+    Groups a stream of Textract lines into overlapping, token-bounded chunks.
+
+    Args:
+        lines (iterable[tuple[str, int]]): (line text, page number) pairs, in reading order.
+        max_tokens (int): Upper bound on the estimated tokens in a chunk.
+        overlap_tokens (int): Approximate number of tokens repeated from the end of
+                              one chunk at the start of the next.
+
+    Yields:
+        dict: {'chunk_index', 'text', 'page_start', 'page_end', 'token_count'}.
+
+    Only the lines of the chunk currently being built are held in memory, so
+    memory use is independent of the document length.
+    """
+    if max_tokens <= 0:
+        raise ValueError("max_tokens must be positive.")
+    if not 0 <= overlap_tokens < max_tokens:
+        raise ValueError("overlap_tokens must be between 0 and max_tokens.")
+
+    window = deque()  # (text, tokens, page) entries of the chunk being built
+    window_tokens = 0
+    chunk_index = 0
+    has_new_content = False
+
+    def emit():
+        return {
+            'chunk_index': chunk_index,
+            'text': "\n".join(entry[0] for entry in window),
+            'page_start': window[0][2],
+            'page_end': window[-1][2],
+            'token_count': window_tokens,
+        }
+
+    for text, page in lines:
+        text = text.strip()
+        if not text:
+            continue
+        tokens = estimate_tokens(text) or 1
+        pieces = _split_long_line(text, page, max_tokens) if tokens > max_tokens else [(text, tokens, page)]
+
+        for entry in pieces:
+            if window and window_tokens + entry[1] > max_tokens:
+                yield emit()
+                chunk_index += 1
+                has_new_content = False
+                # Keep the tail of the previous chunk as overlap for the next one.
+                while window and window_tokens > overlap_tokens:
+                    window_tokens -= window.popleft()[1]
+                while window and window_tokens + entry[1] > max_tokens:
+                    window_tokens -= window.popleft()[1]
+            window.append(entry)
+            window_tokens += entry[1]
+            has_new_content = True
+
+    if window and has_new_content:
+        yield emit()
+
+
+def batched(iterable, batch_size):
+    """
+    Yields lists of up to batch_size items from iterable without materializing it.
+    """
+    if batch_size <= 0:
+        raise ValueError("batch_size must be positive.")
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
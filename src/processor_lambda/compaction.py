@@ -0,0 +1,63 @@
+"""
+Scheduled vector store compaction (handler: compaction.lambda_handler).
+
+The processor appends one segment per document to the vector store, and every
+reader holds all segments in memory on top of the base matrix. Run on a
+schedule, this job folds the segments into a new base generation with
+docuinsight.vector_store.compact() once at least
+VECTOR_STORE_COMPACT_MIN_SEGMENTS have accumulated, so the number of segments
+readers fetch and scan stays bounded.
+
+    {}                      compact if the segment threshold is reached
+    {"force": true}         compact whenever there is at least one segment
+
+compact() is not safe to run concurrently; deploy the function with a
+reserved concurrency of 1.
+"""
+import logging
+import os
+
+from docuinsight.clients import get_client
+from docuinsight.metrics import MetricsLogger, log_event
+from docuinsight.vector_store import S3Storage, LocalStorage, SEGMENTS_DIR, compact
+
+logger = logging.getLogger()
+logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
+
+VECTOR_STORE_BUCKET = os.environ.get('VECTOR_STORE_BUCKET')
+VECTOR_STORE_PREFIX = os.environ.get('VECTOR_STORE_PREFIX', 'vector-store')
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR')
+VECTOR_STORE_DTYPE = os.environ.get('VECTOR_STORE_DTYPE', 'float16')
+
+# Segments needed before a scheduled run compacts, and the IVF settings of the new base.
+VECTOR_STORE_COMPACT_MIN_SEGMENTS = int(os.environ.get('VECTOR_STORE_COMPACT_MIN_SEGMENTS', '50'))
+VECTOR_STORE_IVF_MIN_ROWS = int(os.environ.get('VECTOR_STORE_IVF_MIN_ROWS', '50000'))
+VECTOR_STORE_IVF_LISTS = int(os.environ.get('VECTOR_STORE_IVF_LISTS', '0')) or None
+
+
+def create_storage():
+    if VECTOR_STORE_BUCKET:
+        return S3Storage(VECTOR_STORE_BUCKET, VECTOR_STORE_PREFIX, client=get_client('s3'))
+    if VECTOR_STORE_DIR:
+        return LocalStorage(VECTOR_STORE_DIR)
+    raise RuntimeError("VECTOR_STORE_BUCKET or VECTOR_STORE_DIR environment variable not set.")
+
+
+def lambda_handler(event, context):
+    log_event(logger, event)
+    storage = create_storage()
+    segment_count = len(storage.list(SEGMENTS_DIR))
+    threshold = 1 if (event or {}).get('force') else VECTOR_STORE_COMPACT_MIN_SEGMENTS
+
+    metrics = MetricsLogger('compaction')
+    metrics.put_metric('VectorStoreSegments', segment_count, 'Count')
+    try:
+        if segment_count < max(1, threshold):
+            logger.info(f"{segment_count} vector store segments; compaction starts at {threshold}.")
+            return {'compacted': False, 'segments': segment_count}
+        with metrics.timer('CompactionTime'):
+            manifest = compact(storage, VECTOR_STORE_DTYPE, VECTOR_STORE_IVF_MIN_ROWS, VECTOR_STORE_IVF_LISTS)
+        metrics.put_metric('CompactedSegments', manifest.get('merged_segments', 0), 'Count')
+        return {'compacted': True, 'segments': segment_count, 'manifest': manifest}
+    finally:
+        metrics.flush()
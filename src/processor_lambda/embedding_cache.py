@@ -0,0 +1,183 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger()
+
+EMBEDDING_DTYPE = np.dtype('<f4')
+
+
+def chunk_cache_key(text, model_id):
+    """
+    Returns the content address of a chunk: a SHA-256 of the model id and the chunk text.
+    """
+    return hashlib.sha256(f"{model_id}\0{text}".encode('utf-8')).hexdigest()
+
+
+class DynamoDBEmbeddingStore:
+    """
+    Stores embeddings in a DynamoDB table with a string partition key 'cache_key'
+    and the raw float32 vector in the binary attribute 'cache_value'.
+    """
+
+    def __init__(self, table_name, client=None, max_retries=5):
+        if client is None:
+            from docuinsight.clients import get_client
+            client = get_client('dynamodb')
+        self.table_name = table_name
+        self.client = client
+        self.max_retries = max_retries
+
+    def get_many(self, keys):
+        found = {}
+        for start in range(0, len(keys), 100):  # BatchGetItem limit
+            request = {self.table_name: {
+                'Keys': [{'cache_key': {'S': key}} for key in keys[start:start + 100]],
+                'ProjectionExpression': 'cache_key, cache_value'
+            }}
+            for attempt in range(self.max_retries + 1):
+                response = self.client.batch_get_item(RequestItems=request)
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    found[item['cache_key']['S']] = bytes(item['cache_value']['B'])
+                request = response.get('UnprocessedKeys')
+                if not request:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+        return found
+
+    def put_many(self, values):
+        items = list(values.items())
+        for start in range(0, len(items), 25):  # BatchWriteItem limit
+            request = {self.table_name: [
+                {'PutRequest': {'Item': {'cache_key': {'S': key}, 'cache_value': {'B': value}}}}
+                for key, value in items[start:start + 25]
+            ]}
+            for attempt in range(self.max_retries + 1):
+                response = self.client.batch_write_item(RequestItems=request)
+                request = response.get('UnprocessedItems')
+                if not request:
+                    break
+                time.sleep(0.05 * 2 ** attempt)
+
+
+class S3EmbeddingStore:
+    """
+    Stores each embedding as an S3 object named <prefix>/<cache key>.
+    """
+
+    def __init__(self, bucket, prefix='embedding-cache', client=None):
+        if client is None:
+            from docuinsight.clients import get_client
+            client = get_client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.rstrip('/')
+        self.client = client
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            try:
+                response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")
+            except self.client.exceptions.NoSuchKey:
+                continue
+            found[key] = response['Body'].read()
+        return found
+
+    def put_many(self, values):
+        for key, value in values.items():
+            self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}", Body=value)
+
+
+class LocalFileEmbeddingStore:
+    """
+    Stores each embedding as a file under a local directory. Intended for tests and local runs.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            path = os.path.join(self.directory, key)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    found[key] = f.read()
+        return found
+
+    def put_many(self, values):
+        for key, value in values.items():
+            with open(os.path.join(self.directory, key), 'wb') as f:
+                f.write(value)
+
+
+class ChunkEmbeddingCache:
+    """
+    A persistent, content-addressed cache in front of the embedding endpoint.
+
+    Texts shared across documents (headers, legal footers, standard clauses)
+    are embedded once per model; later occurrences are served from the store.
+    """
+
+    def __init__(self, store, model_id):
+        self.store = store
+        self.model_id = model_id
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed(self, texts, embed_fn):
+        """
+        Returns embeddings for texts, calling embed_fn only for cache misses.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            embed_fn (callable): Embeds a list of texts in one call and returns a
+                                 (len(texts), dimension) array.
+
+        Returns:
+            tuple[numpy.ndarray, int, int]: The (len(texts), dimension) float32 embeddings
+            in input order, and the number of hits and misses for this call.
+        """
+        keys = [chunk_cache_key(text, self.model_id) for text in texts]
+        try:
+            cached = self.store.get_many(list(dict.fromkeys(keys)))
+        except Exception as e:
+            logger.warning(f"Chunk embedding cache lookup failed, embedding all texts: {e}")
+            cached = {}
+
+        # Each distinct missing text is sent once, even if it repeats within the batch.
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+
+        vectors = {key: np.frombuffer(value, dtype=EMBEDDING_DTYPE) for key, value in cached.items()}
+        if missing:
+            embeddings = np.asarray(embed_fn(list(missing.values())), dtype=EMBEDDING_DTYPE)
+            new_values = {}
+            for key, embedding in zip(missing, embeddings):
+                vectors[key] = embedding
+                new_values[key] = embedding.tobytes()
+            try:
+                self.store.put_many(new_values)
+            except Exception as e:
+                logger.warning(f"Chunk embedding cache write failed: {e}")
+
+        hits = sum(1 for key in keys if key in cached)
+        misses = len(keys) - hits
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        return np.stack([vectors[key] for key in keys]), hits, misses
+
+    def summary(self):
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        ratio = hits / lookups if lookups else 0.0
+        return f"Chunk embedding cache: hit ratio {ratio:.2f} ({hits} hits / {misses} misses)"
@@ -1,180 +1,628 @@
-from datetime import datetime
+import time
+INIT_STARTED = time.perf_counter()
+
+from datetime import datetime, timezone
 import os
 import json
-import boto3
+import math
+import threading
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np # <--- ADDED THIS LINE
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
+from chunking import chunk_lines, batched, DEFAULT_CHUNK_MAX_TOKENS, DEFAULT_CHUNK_OVERLAP_TOKENS
+from bulk import BulkIndexer
+from textract_source import iter_blocks, iter_lines, DEFAULT_OUTPUT_PREFIX
+from structured import StructuredExtractor
+from embedding_cache import ChunkEmbeddingCache, DynamoDBEmbeddingStore, S3EmbeddingStore, LocalFileEmbeddingStore
+from docuinsight.metrics import MetricsLogger, consume_cold_start, log_event
+from docuinsight.vector_store import S3Storage, LocalStorage, append_segment
+from docuinsight.search_index import encode_vector, ensure_fields_index, DEFAULT_BYTE_SCALE
+from docuinsight.fanout import parse_part_tag
+from docuinsight.index_generation import bump_index_generation
+from docuinsight.wire_format import FLOAT32_CONTENT_TYPE, decode_embeddings
+from docuinsight import clients
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(os.environ.get('LOG_LEVEL', 'INFO'))
 
-# Initialize AWS clients
-textract_client = boto3.client('textract')
-dynamodb_client = boto3.client('dynamodb')
-sagemaker_runtime_client = boto3.client('sagemaker-runtime')
-s3_client = boto3.client('s3')
+# Initialize AWS clients (pooled and shared across the container, see docuinsight.clients)
+textract_client = clients.get_client('textract')
+dynamodb_client = clients.get_client('dynamodb')
+sagemaker_runtime_client = clients.get_client('sagemaker-runtime')
+s3_client = clients.get_client('s3')
 
 # Environment variables (will be set in Terraform)
 SAGEMAKER_ENDPOINT_NAME = os.environ.get('SAGEMAKER_ENDPOINT_NAME')
 DYNAMODB_TABLE_NAME = os.environ.get('DYNAMODB_TABLE_NAME') # Placeholder for future
 OPENSEARCH_DOMAIN_ENDPOINT = os.environ.get('OPENSEARCH_DOMAIN_ENDPOINT') # Placeholder for future
+# Index (normally an alias, see docuinsight.search_index) and the vector encoding it was created with.
+OPENSEARCH_INDEX_NAME = os.environ.get('OPENSEARCH_INDEX_NAME', 'index')
+OPENSEARCH_VECTOR_DATA_TYPE = os.environ.get('OPENSEARCH_VECTOR_DATA_TYPE', 'float')
+OPENSEARCH_VECTOR_BYTE_SCALE = float(os.environ.get('OPENSEARCH_VECTOR_BYTE_SCALE', DEFAULT_BYTE_SCALE))
+TEXTRACT_OUTPUT_S3_BUCKET = os.environ.get('TEXTRACT_OUTPUT_S3_BUCKET')
+TEXTRACT_OUTPUT_S3_PREFIX = os.environ.get('TEXTRACT_OUTPUT_S3_PREFIX', DEFAULT_OUTPUT_PREFIX)
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+# OpenSearch bulk indexing configuration
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(5 * 1024 * 1024)))
+BULK_MAX_RETRIES = int(os.environ.get('BULK_MAX_RETRIES', '3'))
+# Interval restored after a large ingest if the index's refresh was already off when it started.
+OPENSEARCH_REFRESH_INTERVAL = os.environ.get('OPENSEARCH_REFRESH_INTERVAL', '1s')
+
+# Chunking / embedding batch configuration
+CHUNK_MAX_TOKENS = int(os.environ.get('CHUNK_MAX_TOKENS', DEFAULT_CHUNK_MAX_TOKENS))
+CHUNK_OVERLAP_TOKENS = int(os.environ.get('CHUNK_OVERLAP_TOKENS', DEFAULT_CHUNK_OVERLAP_TOKENS))
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', '64'))
+
+# Embedding wire format requested from the model server (sent as the Accept header;
+# see docuinsight.wire_format): raw little-endian floats behind a 16 byte header
+# by default, or application/json for the original {"embeddings": [[...]]} response.
+EMBEDDING_WIRE_FORMAT = os.environ.get('EMBEDDING_WIRE_FORMAT', FLOAT32_CONTENT_TYPE)
+
+# Content-addressed chunk embedding cache, shared across documents.
+# EMBEDDING_CACHE_BACKEND is 'dynamodb', 's3', 'local' or empty (disabled).
+EMBEDDING_MODEL_ID = os.environ.get('EMBEDDING_MODEL_ID', 'all-MiniLM-L6-v2')
+EMBEDDING_CACHE_BACKEND = os.environ.get('EMBEDDING_CACHE_BACKEND', '').lower()
+EMBEDDING_CACHE_TABLE = os.environ.get('EMBEDDING_CACHE_TABLE')
+EMBEDDING_CACHE_BUCKET = os.environ.get('EMBEDDING_CACHE_BUCKET')
+EMBEDDING_CACHE_PREFIX = os.environ.get('EMBEDDING_CACHE_PREFIX', 'embedding-cache')
+EMBEDDING_CACHE_DIR = os.environ.get('EMBEDDING_CACHE_DIR', '/tmp/embedding-cache')
+
+# In-process vector store (the API's 'local' search backend). When a bucket or
+# directory is configured, every document's embeddings are also appended as a segment.
+VECTOR_STORE_BUCKET = os.environ.get('VECTOR_STORE_BUCKET')
+VECTOR_STORE_PREFIX = os.environ.get('VECTOR_STORE_PREFIX', 'vector-store')
+VECTOR_STORE_DIR = os.environ.get('VECTOR_STORE_DIR')
+VECTOR_STORE_DTYPE = os.environ.get('VECTOR_STORE_DTYPE', 'float16')
+VECTOR_STORE_PREVIEW_CHARS = int(os.environ.get('VECTOR_STORE_PREVIEW_CHARS', '500'))
 
+# Structured extraction of the FORMS and TABLES results (see structured.py). Every
+# key-value pair and table cell is indexed into OPENSEARCH_FIELDS_INDEX_NAME; the
+# first STRUCTURED_DYNAMODB_MAX_FIELDS form fields are also kept on the metadata item.
+STRUCTURED_EXTRACTION = os.environ.get('STRUCTURED_EXTRACTION', 'true').lower() == 'true'
+OPENSEARCH_FIELDS_INDEX_NAME = os.environ.get('OPENSEARCH_FIELDS_INDEX_NAME', 'fields')
+STRUCTURED_DATE_DAY_FIRST = os.environ.get('STRUCTURED_DATE_DAY_FIRST', 'false').lower() == 'true'
+STRUCTURED_DYNAMODB_MAX_FIELDS = int(os.environ.get('STRUCTURED_DYNAMODB_MAX_FIELDS', '100'))
+
+# SQS batch concurrency configuration. Records of one batch are processed on up
+# to MAX_WORKERS threads; the worker count is sized from the remaining time budget.
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '4'))
+RECORD_ESTIMATED_SECONDS = float(os.environ.get('RECORD_ESTIMATED_SECONDS', '30'))
+RECORD_MIN_START_SECONDS = float(os.environ.get('RECORD_MIN_START_SECONDS', '20'))
+
+# Global OpenSearch client, created once per container and reused across warm invocations
 opensearch_client = None
+opensearch_client_lock = threading.Lock()
+
+# Set once the fields index is known to exist in this container
+fields_index_ready = False
 
-def get_awsauth(region, service):
+def create_chunk_embedding_cache():
     """
-    Returns an AWS4Auth object for signing requests to AWS services.
+    Builds the chunk embedding cache for the configured backend, or returns None if disabled.
     """
-    credentials = boto3.Session().get_credentials()
-    logger.info(f"Retrieved AWS credentials: {credentials}")
-    return AWS4Auth(credentials.access_key,
-                    credentials.secret_key,
-                    region,
-                    service,
-                    session_token=credentials.token)
+    if EMBEDDING_CACHE_BACKEND == 'dynamodb':
+        store = DynamoDBEmbeddingStore(EMBEDDING_CACHE_TABLE, client=dynamodb_client)
+    elif EMBEDDING_CACHE_BACKEND == 's3':
+        store = S3EmbeddingStore(EMBEDDING_CACHE_BUCKET, EMBEDDING_CACHE_PREFIX, client=s3_client)
+    elif EMBEDDING_CACHE_BACKEND == 'local':
+        store = LocalFileEmbeddingStore(EMBEDDING_CACHE_DIR)
+    else:
+        return None
+    return ChunkEmbeddingCache(store, EMBEDDING_MODEL_ID)
 
-def lambda_handler(event, context):
+# Global chunk embedding cache (None when disabled)
+chunk_embedding_cache = create_chunk_embedding_cache()
+
+def create_vector_store():
     """
-    Lambda handler for processing Textract job completion notifications.
-    It retrieves Textract results, sends text for embeddings, and
-    (in future steps) stores metadata and indexes into OpenSearch.
-    """
-    print("Processor Lambda invoked!")
-    logger.info(f"Received event: {json.dumps(event)}")
-    print(f"Received event: {json.dumps(event)}")
-    
-    # Process each record from the SQS event
-    for record in event['Records']:
+    Returns the vector store storage to append segments to, or None if disabled.
+    """
+    if VECTOR_STORE_BUCKET:
+        return S3Storage(VECTOR_STORE_BUCKET, VECTOR_STORE_PREFIX, client=s3_client)
+    if VECTOR_STORE_DIR:
+        return LocalStorage(VECTOR_STORE_DIR)
+    return None
+
+# Global vector store storage (None when disabled)
+vector_store = create_vector_store()
+
+def get_opensearch_client():
+    """
+    Returns the container-wide OpenSearch client, creating it on first use.
+    The underlying connection pool keeps TLS connections open between invocations.
+    """
+    global opensearch_client
+    with opensearch_client_lock:
+        if opensearch_client is None:
+            logger.info("Initializing OpenSearch client...")
+            # Pool size and timeout come from OPENSEARCH_POOL_MAXSIZE / OPENSEARCH_TIMEOUT_SECONDS (docuinsight.clients).
+            opensearch_client = clients.get_opensearch_client(OPENSEARCH_DOMAIN_ENDPOINT, AWS_REGION)
+            logger.info("OpenSearch client initialized.")
+    return opensearch_client
+
+def iter_textract_lines(job_id, extractor=None):
+    """
+    Yields (text, page) for every LINE block of a Textract analysis job.
+    Results are streamed from the job's S3 output objects, falling back to
+    paginated GetDocumentAnalysis calls when they are not available.
+    With an extractor, every block also passes through extractor.observe().
+    """
+    blocks = iter_blocks(job_id, s3_client, textract_client,
+                         output_bucket=TEXTRACT_OUTPUT_S3_BUCKET,
+                         output_prefix=TEXTRACT_OUTPUT_S3_PREFIX)
+    if extractor is not None:
+        blocks = extractor.observe(blocks)
+    return iter_lines(blocks)
+
+def embed_texts(texts, metrics=None, rate_limiter=None):
+    """
+    Generates embeddings for a batch of texts with a single SageMaker invocation.
+
+    Args:
+        texts (list[str]): The texts to embed.
+        metrics (MetricsLogger, optional): Receives the call duration, batch size and payload size.
+        rate_limiter (optional): Object whose acquire(n) blocks until n more texts may be sent
+            to the endpoint (used by the backfill job to leave capacity for live traffic).
+
+    Returns:
+        numpy.ndarray: A (len(texts), dimension) array, one embedding per input text, in input order.
+    """
+    if rate_limiter is not None:
+        rate_limiter.acquire(len(texts))
+    started = time.perf_counter()
+    sagemaker_response = sagemaker_runtime_client.invoke_endpoint(
+        EndpointName=SAGEMAKER_ENDPOINT_NAME,
+        ContentType='application/json',
+        Accept=EMBEDDING_WIRE_FORMAT,
+        Body=json.dumps({"text": texts})
+    )
+    response_body = sagemaker_response['Body'].read()
+    embeddings = decode_embeddings(response_body, sagemaker_response.get('ContentType'))
+    if embeddings.shape[0] != len(texts):
+        raise ValueError(f"Expected {len(texts)} embeddings, got {embeddings.shape[0]}.")
+    if metrics is not None:
+        metrics.put_metric('EmbeddingTime', (time.perf_counter() - started) * 1000)
+        metrics.put_metric('EmbeddingBatchSize', len(texts), 'Count')
+        metrics.put_metric('EmbeddingPayloadBytes', len(response_body), 'Bytes')
+    logger.debug(f"Generated embeddings (shape: {embeddings.shape}, {len(response_body)} bytes).")
+    return embeddings
+
+def embed_chunks(texts, metrics=None, rate_limiter=None):
+    """
+    Embeds a batch of chunk texts, serving cached embeddings when the cache is enabled.
+    Only the misses are sent to SageMaker, in a single invocation.
+
+    Returns:
+        tuple[numpy.ndarray, int, int]: The embeddings in input order, cache hits and cache misses.
+    """
+    if chunk_embedding_cache is None:
+        return embed_texts(texts, metrics, rate_limiter), 0, len(texts)
+    return chunk_embedding_cache.embed(texts, lambda misses: embed_texts(misses, metrics, rate_limiter))
+
+def index_document(job_id, index_name, timestamp, metrics, rate_limiter=None, collect_segment=False, part=None,
+                   extractor=None, manage_refresh=True):
+    """
+    Chunks, embeds and indexes the results of a successful Textract job into index_name.
+    Raises on any failure. Per-stage durations and sizes are recorded on metrics.
+
+    Args:
+        timestamp (datetime): The processing time stored with every chunk.
+        rate_limiter (optional): Passed to embed_texts to throttle endpoint calls.
+        collect_segment (bool): Also return the embeddings and metadata for a vector store segment.
+        part (dict, optional): For a fan-out part (see docuinsight.fanout), its document_id, index
+            and page_offset. Chunks are indexed under the parent document with document page numbers.
+        extractor (StructuredExtractor, optional): Sees every Textract block on the way to chunking.
+        manage_refresh (bool): Switch refresh off on index_name during a large ingest (see BulkIndexer).
+
+    Returns:
+        tuple[int, tuple | None]: The chunk count and, if collected, (embeddings, metadata).
+    """
+    if not SAGEMAKER_ENDPOINT_NAME:
+        raise RuntimeError("SAGEMAKER_ENDPOINT_NAME environment variable not set. Cannot generate embeddings.")
+
+    # --- 1. Stream Textract lines into overlapping chunks ---
+    # --- 2. Embed each batch of chunks with one SageMaker call ---
+    # --- 3. Index every chunk as its own vector through the _bulk API ---
+    # Only one batch of chunks (plus one bulk request) is held in memory at a time.
+    lines = metrics.timed_iter('TextractFetchTime', iter_textract_lines(job_id, extractor))
+    chunks = chunk_lines(lines, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS)
+    document_id = job_id
+    id_prefix = job_id
+    page_offset = 0
+    part_fields = {}
+    if part is not None:
+        document_id = part['document_id']
+        id_prefix = f"{document_id}-{part['index']}"
+        page_offset = part['page_offset']
+        part_fields = {"part_index": part['index']}
+    chunk_count = 0
+    batch_count = 0
+    cache_hits = 0
+    # Rows for the vector store segment; embeddings are kept per batch and joined once.
+    segment_embeddings = []
+    segment_metadata = {'id': [], 'document_id': [], 'chunk_index': [], 'page_start': [],
+                        'page_end': [], 'timestamp': [], 'preview': []}
+    with BulkIndexer(get_opensearch_client(), index_name,
+                     max_bytes=BULK_MAX_BYTES,
+                     max_retries=BULK_MAX_RETRIES,
+                     refresh_interval=OPENSEARCH_REFRESH_INTERVAL,
+                     manage_refresh=manage_refresh) as indexer:
+        for batch in batched(chunks, EMBEDDING_BATCH_SIZE):
+            embeddings, hits, misses = embed_chunks([chunk['text'] for chunk in batch], metrics, rate_limiter)
+            cache_hits += hits
+            if misses:
+                batch_count += 1
+            for chunk, embedding in zip(batch, embeddings):
+                indexer.index(f"{id_prefix}-{chunk['chunk_index']}", {
+                    "document_id": document_id,
+                    "chunk_index": chunk['chunk_index'],
+                    "page_start": chunk['page_start'] + page_offset,
+                    "page_end": chunk['page_end'] + page_offset,
+                    "text_content": chunk['text'],
+                    "embedding": encode_vector(embedding, OPENSEARCH_VECTOR_DATA_TYPE, OPENSEARCH_VECTOR_BYTE_SCALE),
+                    "timestamp": timestamp,
+                    **part_fields
+                })
+            chunk_count += len(batch)
+            if collect_segment:
+                segment_embeddings.append(embeddings)
+                for chunk in batch:
+                    segment_metadata['id'].append(f"{id_prefix}-{chunk['chunk_index']}")
+                    segment_metadata['document_id'].append(document_id)
+                    segment_metadata['chunk_index'].append(chunk['chunk_index'])
+                    segment_metadata['page_start'].append(chunk['page_start'] + page_offset)
+                    segment_metadata['page_end'].append(chunk['page_end'] + page_offset)
+                    segment_metadata['timestamp'].append(timestamp.isoformat())
+                    segment_metadata['preview'].append(chunk['text'][:VECTOR_STORE_PREVIEW_CHARS])
+
+    logger.info(f"Indexed {chunk_count} chunks into '{index_name}' using {batch_count} SageMaker invocations "
+                f"and {indexer.requests} bulk requests ({cache_hits} chunk embeddings served from cache).")
+    if chunk_embedding_cache is not None:
+        logger.info(chunk_embedding_cache.summary())
+    metrics.put_metric('ChunkCount', chunk_count, 'Count')
+    metrics.put_metric('EmbeddingCacheHits', cache_hits, 'Count')
+    metrics.put_metric('OpenSearchIndexTime', indexer.bulk_ms)
+    metrics.put_metric('OpenSearchBulkRequests', indexer.requests, 'Count')
+    metrics.put_metric('OpenSearchBulkBytes', indexer.bytes_sent, 'Bytes')
+
+    segment = None
+    if collect_segment and segment_embeddings:
+        segment = (np.concatenate(segment_embeddings), segment_metadata)
+    return chunk_count, segment
+
+def create_extractor():
+    return StructuredExtractor(day_first=STRUCTURED_DATE_DAY_FIRST) if STRUCTURED_EXTRACTION else None
+
+def index_fields(fields, document_id, id_prefix, timestamp, metrics, part_index=None):
+    """
+    Indexes extracted form and table fields into the fields index, one document per field.
+    Raises if any field could not be indexed.
+    """
+    global fields_index_ready
+    if not fields:
+        return
+    client = get_opensearch_client()
+    if not fields_index_ready:
+        ensure_fields_index(client, OPENSEARCH_FIELDS_INDEX_NAME)
+        fields_index_ready = True
+    extra = {} if part_index is None else {'part_index': part_index}
+    with metrics.timer('FieldsIndexTime'):
+        with BulkIndexer(client, OPENSEARCH_FIELDS_INDEX_NAME, max_bytes=BULK_MAX_BYTES,
+                         max_retries=BULK_MAX_RETRIES, manage_refresh=False) as indexer:
+            for n, field in enumerate(fields):
+                indexer.index(f"{id_prefix}-field-{n}", {'document_id': document_id, 'timestamp': timestamp,
+                                                         **extra, **field})
+    metrics.put_metric('FieldCount', len(fields), 'Count')
+    logger.info(f"Indexed {len(fields)} form and table fields of document {document_id}.")
+
+def dynamodb_fields(fields):
+    """
+    Returns the first value of each form field name as a DynamoDB map of typed values,
+    capped at STRUCTURED_DYNAMODB_MAX_FIELDS entries so the item stays well below 400 KB.
+    """
+    entries = {}
+    for field in fields:
+        if field['source'] != 'form' or field['name'] in entries:
+            continue
+        if len(entries) >= STRUCTURED_DYNAMODB_MAX_FIELDS:
+            break
+        if field['value_type'] == 'number':
+            typed = {'N': repr(field['value_number'])}
+        elif field['value_type'] == 'date':
+            typed = {'S': field['value_date']}
+        else:
+            typed = {'S': field['value']}
+        entries[field['name']] = {'M': {'type': {'S': field['value_type']}, 'value': typed}}
+    return {'M': entries}
+
+def process_document(job_id, s3_bucket, s3_object_key, metrics):
+    """
+    Indexes a successful Textract job (see index_document) and its form and
+    table fields, appends it to the vector store if enabled, then records the
+    document in DynamoDB. Raises on any failure.
+    """
+    timestamp = datetime.now(timezone.utc)
+    extractor = create_extractor()
+    chunk_count, segment = index_document(job_id, OPENSEARCH_INDEX_NAME, timestamp, metrics,
+                                          collect_segment=vector_store is not None, extractor=extractor)
+
+    update_expression = 'SET s3_path = :s3_path, #status = :status, chunk_count = :chunk_count, #timestamp = :timestamp'
+    names = {'#status': 'status', '#timestamp': 'timestamp'}
+    values = {
+        ':s3_path': {'S': f"s3://{s3_bucket}/{s3_object_key}"},
+        ':status': {'S': 'EMBEDDINGS_GENERATED'},
+        ':chunk_count': {'N': str(chunk_count)},
+        ':timestamp': {'S': timestamp.isoformat()}
+    }
+    if extractor is not None:
+        with metrics.timer('FieldExtractionTime'):
+            fields = extractor.fields()
+        index_fields(fields, job_id, job_id, timestamp, metrics)
+        update_expression += ', #fields = :fields'
+        names['#fields'] = 'fields'
+        values[':fields'] = dynamodb_fields(fields)
+
+    if segment is not None:
+        with metrics.timer('VectorStoreAppendTime'):
+            append_segment(vector_store, job_id, *segment, VECTOR_STORE_DTYPE)
+
+    # update_item keeps the attributes written by the orchestrator (e.g. content_hash).
+    with metrics.timer('DynamoDBWriteTime'):
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key={'document_id': {'S': job_id}},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    record_index_write()
+
+def process_document_part(job_id, part, metrics):
+    """
+    Indexes one fan-out part of a document as soon as its Textract job succeeds,
+    then records it on the document's metadata item. The document is marked
+    EMBEDDINGS_GENERATED, with the total chunk count, once every part is indexed.
+    Chunks do not span part boundaries. Raises on any failure.
+    """
+    document_id = part['document_id']
+    timestamp = datetime.now(timezone.utc)
+    extractor = create_extractor()
+    chunk_count, segment = index_document(job_id, OPENSEARCH_INDEX_NAME, timestamp, metrics,
+                                          collect_segment=vector_store is not None, part=part, extractor=extractor)
+
+    update_expression = 'SET part_chunks.#part = :chunk_count, #timestamp = :timestamp'
+    values = {
+        ':chunk_count': {'N': str(chunk_count)},
+        ':timestamp': {'S': timestamp.isoformat()}
+    }
+    if extractor is not None:
+        with metrics.timer('FieldExtractionTime'):
+            fields = extractor.fields()
+        for field in fields:
+            field['page'] += part['page_offset']
+        index_fields(fields, document_id, f"{document_id}-{part['index']}", timestamp, metrics, part['index'])
+        update_expression += ', part_fields.#part = :fields'
+        values[':fields'] = dynamodb_fields(fields)
+
+    if segment is not None:
+        with metrics.timer('VectorStoreAppendTime'):
+            append_segment(vector_store, f"{document_id}-{part['index']}", *segment, VECTOR_STORE_DTYPE)
+
+    # part_chunks is keyed by part index, so a redelivered part is not counted twice.
+    with metrics.timer('DynamoDBWriteTime'):
+        item = dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key={'document_id': {'S': document_id}},
+            UpdateExpression=update_expression,
+            ExpressionAttributeNames={'#part': str(part['index']), '#timestamp': 'timestamp'},
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    # The part is searchable now, whether or not the rest of the document is.
+    record_index_write()
+    indexed = item.get('part_chunks', {}).get('M', {})
+    part_count = int(item['part_count']['N'])
+    logger.info(f"Indexed part {part['index']} of document {document_id} ({len(indexed)} of {part_count} parts done).")
+    if len(indexed) < part_count or item.get('status', {}).get('S') == 'EMBEDDINGS_GENERATED':
+        return
+
+    total_chunks = sum(int(value['N']) for value in indexed.values())
+    update_expression = 'SET #status = :status, chunk_count = :chunk_count'
+    names = {'#status': 'status'}
+    values = {
+        ':status': {'S': 'EMBEDDINGS_GENERATED'},
+        ':chunk_count': {'N': str(total_chunks)}
+    }
+    part_fields = item.get('part_fields', {}).get('M', {})
+    if part_fields:
+        # The document's form fields: the first value of each name, in page order.
+        merged = {}
+        for index in sorted(part_fields, key=int):
+            for name, value in part_fields[index]['M'].items():
+                if name not in merged and len(merged) < STRUCTURED_DYNAMODB_MAX_FIELDS:
+                    merged[name] = value
+        update_expression += ', #fields = :fields'
+        names['#fields'] = 'fields'
+        values[':fields'] = {'M': merged}
+    try:
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key={'document_id': {'S': document_id}},
+            UpdateExpression=update_expression,
+            ConditionExpression='#status <> :status',
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except dynamodb_client.exceptions.ConditionalCheckFailedException:
+        return  # the last two parts finished together; the other one already completed the document
+    logger.info(f"All {part_count} parts of document {document_id} indexed ({total_chunks} chunks).")
+    metrics.put_metric('FanoutDocumentChunks', total_chunks, 'Count')
+
+def record_index_write():
+    """
+    Bumps the index generation so the API's cached search results for older
+    generations are no longer served. Logs (does not raise) on failure: the
+    document is indexed, and stale entries still expire with the cache TTL.
+    """
+    try:
+        generation = bump_index_generation(dynamodb_client, DYNAMODB_TABLE_NAME)
+        logger.info(f"Index generation is now {generation}.")
+    except Exception as e:
+        logger.error(f"Failed to bump the index generation: {e}")
+
+def set_document_status(job_id, status):
+    """
+    Updates the status of a document in the metadata table, logging (not raising) on failure.
+    """
+    try:
+        dynamodb_client.update_item(
+            TableName=DYNAMODB_TABLE_NAME,
+            Key={'document_id': {'S': job_id}},
+            UpdateExpression='SET #status = :status, #timestamp = :timestamp',
+            ExpressionAttributeNames={'#status': 'status', '#timestamp': 'timestamp'},
+            ExpressionAttributeValues={
+                ':status': {'S': status},
+                ':timestamp': {'S': datetime.now(timezone.utc).isoformat()}
+            }
+        )
+    except Exception as e:
+        logger.error(f"Failed to set status {status} for JobId {job_id}: {e}")
+
+def parse_notification(record):
+    """
+    Returns the Textract completion notification carried by an SQS record.
+    Raises json.JSONDecodeError or KeyError for a malformed message.
+    """
+    # SQS message body contains the SNS notification
+    message_body = json.loads(record['body'])
+    sns_message = json.loads(message_body['Message']) # This is the actual payload
+    location = sns_message['DocumentLocation']
+    missing = ([key for key in ('Status', 'JobId') if key not in sns_message] +
+               [key for key in ('S3Bucket', 'S3ObjectName') if key not in location])
+    if missing:
+        raise KeyError(missing[0])
+    return sns_message
+
+def process_record(sns_message, metrics):
+    """
+    Processes a single Textract completion notification (see parse_notification).
+    Raises if the record should be redelivered.
+    """
+    job_status = sns_message['Status']
+    job_id = sns_message['JobId']
+    document_location = sns_message['DocumentLocation']
+    s3_bucket = document_location['S3Bucket']
+    s3_object_key = document_location['S3ObjectName']
+    # Parts of a fanned-out document report to the document's metadata item.
+    part = parse_part_tag(sns_message.get('JobTag'))
+    document_id = part['document_id'] if part else job_id
+
+    logger.info(f"Processing Textract JobId: {job_id} for document: s3://{s3_bucket}/{s3_object_key}")
+    metrics.set_property('JobId', job_id)
+
+    if job_status == 'SUCCEEDED':
         try:
-            # SQS message body contains the SNS notification
-            message_body = json.loads(record['body'])
-            sns_message = json.loads(message_body['Message']) # This is the actual payload
-
-
-            job_status = sns_message['Status']
-            job_id = sns_message['JobId']
-            document_location = sns_message['DocumentLocation']
-            s3_bucket = document_location['S3Bucket']
-            s3_object_key = document_location['S3ObjectName']
-
-            logger.info(f"Processing Textract JobId: {job_id} for document: s3://{s3_bucket}/{s3_object_key}")
-
-            if job_status == 'SUCCEEDED':
-                # --- 1. Retrieve Textract Analysis Results ---
-                full_text = ""
-                try:
-                    # Get the initial results
-                    response = textract_client.get_document_analysis(JobId=job_id)
-                    blocks = response['Blocks']
-                    
-                    # Extract text from blocks (simplified for now)
-                    for block in blocks:
-                        if block['BlockType'] == 'LINE':
-                            full_text += block['Text'] + "\n"
-
-                    # Handle pagination for large documents
-                    while 'NextToken' in response:
-                        next_token = response['NextToken']
-                        response = textract_client.get_document_analysis(JobId=job_id, NextToken=next_token)
-                        for block in response['Blocks']:
-                            if block['BlockType'] == 'LINE':
-                                full_text += block['Text'] + "\n"
-                    
-                    logger.info(f"Extracted {len(full_text)} characters from Textract job.")
-
-                except Exception as e:
-                    logger.error(f"Error retrieving or parsing Textract results for JobId {job_id}: {e}")
-                    # In a real scenario, you might update DynamoDB with a FAILED status
-                    continue # Move to next SQS record
-
-                # --- 2. Generate Semantic Embeddings (Call SageMaker Endpoint) ---
-                if not SAGEMAKER_ENDPOINT_NAME:
-                    logger.error("SAGEMAKER_ENDPOINT_NAME environment variable not set. Cannot generate embeddings.")
-                    continue
-
-                # IMPORTANT: For large documents, you MUST chunk the 'full_text'
-                # and send chunks to SageMaker, then combine/average embeddings.
-                # This example sends the full text, which will fail if too long.
-                # We will implement proper chunking later.
-                try:
-                    # Prepare payload for SageMaker endpoint
-                    logger.info("Invoking SageMaker endpoint...")
-                    logger.info(f"Payload size: {len(full_text)} characters.")
-                    sagemaker_payload = {"text": full_text[:500]} # Send only first 500 chars for initial testing
-                    
-                    # Invoke SageMaker endpoint
-                    sagemaker_response = sagemaker_runtime_client.invoke_endpoint(
-                        EndpointName=SAGEMAKER_ENDPOINT_NAME,
-                        ContentType='application/json',
-                        Body=json.dumps(sagemaker_payload)
-                    )
-                    
-                    # Parse SageMaker response
-                    response_body = sagemaker_response['Body'].read().decode('utf-8')
-                    embeddings = json.loads(response_body)['embeddings']
-                    logger.info(f"Successfully generated embeddings (shape: {np.array(embeddings).shape}).")
-
-                    # You would typically store these embeddings, perhaps averaged for the document,
-                    # or individual chunk embeddings, in OpenSearch.
-
-                except Exception as e:
-                    logger.error(f"Error invoking SageMaker endpoint {SAGEMAKER_ENDPOINT_NAME} for JobId {job_id}: {e}")
-                    # Update status in DynamoDB, move to DLQ etc.
-                    continue
-
-               
-                
-                dynamodb_client.put_item(
-                    TableName=DYNAMODB_TABLE_NAME,
-                    Item={
-                        'document_id': {'S': job_id},
-                        's3_path': {'S': f"s3://{s3_bucket}/{s3_object_key}"},
-                        'status': {'S': 'EMBEDDINGS_GENERATED'},
-                        'timestamp': {'S': datetime.now().isoformat()}
-                    }
-                )
-                logger.info("DynamoDB storage placeholder executed.")
-                logger.info("Initializing OpenSearch client...")
-                opensearch_client = OpenSearch(
-                    hosts = [{'host': OPENSEARCH_DOMAIN_ENDPOINT, 'port': 443}],
-                    http_auth = get_awsauth('us-east-1', 'es'), # Needs proper AWS SigV4 auth
-                    use_ssl = True,
-                    verify_certs = True,
-                    connection_class = RequestsHttpConnection
-                )
-                logger.info("OpenSearch client initialized.")
-                logger.info("Indexing into OpenSearch...")
-                response = opensearch_client.index(
-                    index='index',  # or your custom index name
-                    id=job_id,
-                    body={
-                        "document_id": job_id,
-                        "text_content": full_text,
-                        "embedding": embeddings[0],
-                        "timestamp": datetime.now()
-                    }
-                )
-                logger.info("OpenSearch indexing placeholder executed.")
-
-                logger.info(f"Successfully processed Textract JobId: {job_id}")
-
-            elif job_status == 'FAILED':
-                logger.error(f"Textract job {job_id} failed. Reason: {sns_message.get('FailureReason', 'N/A')}")
-                # Update DynamoDB with FAILED status
+            if part:
+                process_document_part(job_id, part, metrics)
             else:
-                logger.warning(f"Textract job {job_id} has unexpected status: {job_status}")
+                process_document(job_id, s3_bucket, s3_object_key, metrics)
+        except Exception:
+            # Keep the orchestrator from reusing a half-indexed document for duplicate uploads.
+            set_document_status(document_id, 'PROCESSING_FAILED')
+            raise
+        logger.info(f"Successfully processed Textract JobId: {job_id}")
+    elif job_status == 'FAILED':
+        # Redelivering will not make the Textract job succeed, so the message is consumed.
+        logger.error(f"Textract job {job_id} failed. Reason: {sns_message.get('FailureReason', 'N/A')}")
+        set_document_status(document_id, 'TEXTRACT_FAILED')
+    else:
+        logger.warning(f"Textract job {job_id} has unexpected status: {job_status}")
+
+def remaining_seconds(context):
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return math.inf
+    return context.get_remaining_time_in_millis() / 1000.0
 
+def worker_count(record_count, context):
+    """
+    Sizes the worker pool so the batch can finish within the remaining time budget,
+    assuming each record takes about RECORD_ESTIMATED_SECONDS.
+    """
+    if record_count <= 1:
+        return 1
+    usable = remaining_seconds(context) - RECORD_MIN_START_SECONDS
+    if usable == math.inf:
+        return min(MAX_WORKERS, record_count)
+    rounds = max(1, int(usable // RECORD_ESTIMATED_SECONDS))
+    return max(1, min(MAX_WORKERS, record_count, math.ceil(record_count / rounds)))
+
+def lambda_handler(event, context):
+    """
+    Lambda handler for processing Textract job completion notifications.
+    It streams Textract results into overlapping chunks, embeds the chunks
+    in batches, indexes each chunk into OpenSearch and stores metadata.
+
+    Records are processed concurrently and failures are reported through
+    batchItemFailures, so only the failed messages are redelivered by SQS.
+    """
+    started = time.perf_counter()
+    invocation_metrics = MetricsLogger('processor')
+    cold_start = consume_cold_start()
+    invocation_metrics.put_metric('ColdStart', int(cold_start), 'Count')
+    if cold_start:
+        invocation_metrics.put_metric('InitTime', INIT_DURATION_MS)
+    log_event(logger, event)
+
+    records = event.get('Records', [])
+
+    def handle(record):
+        message_id = record.get('messageId')
+        # Do not start work that cannot finish before the function times out;
+        # report it as failed so SQS redelivers it to a fresh invocation.
+        if remaining_seconds(context) < RECORD_MIN_START_SECONDS:
+            logger.warning(f"Not enough time left to process SQS message {message_id}; returning it to the queue.")
+            return message_id
+        # A malformed message fails the same way on every delivery, so it is
+        # consumed (not reported) rather than retried until it reaches the DLQ.
+        try:
+            sns_message = parse_notification(record)
         except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON from SQS message: {e}. Message body: {record['body']}")
+            logger.error(f"Error decoding JSON from SQS message: {e}. Message body: {record.get('body')}")
+            return None
         except KeyError as e:
-            logger.error(f"Missing expected key in SQS/SNS message: {e}. Message body: {record['body']}")
+            logger.error(f"Missing expected key in SQS/SNS message: {e}. Message body: {record.get('body')}")
+            return None
+        record_metrics = MetricsLogger('processor')
+        try:
+            with record_metrics.timer('RecordTime'):
+                process_record(sns_message, record_metrics)
+            return None
         except Exception as e:
             logger.error(f"An unexpected error occurred while processing SQS record: {e}", exc_info=True)
+        finally:
+            record_metrics.flush()
+        return message_id
+
+    workers = worker_count(len(records), context)
+    if workers == 1:
+        results = [handle(record) for record in records]
+    else:
+        logger.info(f"Processing {len(records)} records on {workers} workers.")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(handle, records))
+
+    failures = [{'itemIdentifier': message_id} for message_id in results if message_id is not None]
+    if failures:
+        logger.warning(f"{len(failures)} of {len(records)} records failed and will be retried.")
+
+    invocation_metrics.put_metric('RecordCount', len(records), 'Count')
+    invocation_metrics.put_metric('FailedRecords', len(failures), 'Count')
+    invocation_metrics.put_metric('Workers', workers, 'Count')
+    invocation_metrics.put_metric('HandlerTime', (time.perf_counter() - started) * 1000)
+    invocation_metrics.flush()
+    return {'batchItemFailures': failures}
 
-    return {
-        'statusCode': 200,
-        'body': json.dumps('Processor Lambda execution complete')
-    }
\ No newline at end of file
+# Module import and global setup time, reported with the first invocation.
+INIT_DURATION_MS = (time.perf_counter() - INIT_STARTED) * 1000
@@ -0,0 +1,208 @@
+"""
+Structured extraction of Textract FORMS and TABLES results.
+
+Textract returns key-value pairs and tables as a graph: a KEY_VALUE_SET (KEY)
+block points to its VALUE block and both point to their WORD children; a
+TABLE points to its CELLs, which point to their WORDs. StructuredExtractor
+watches the block stream as it goes to chunking, keeps an id -> block index of
+only the block types it needs, and resolves every relationship with a single
+dictionary lookup, so extraction stays linear in the number of blocks.
+
+Relationships never cross pages and Textract returns the blocks page by page,
+so the index only ever holds the current page: when the first block of the
+next page arrives, the page's fields are resolved and its blocks dropped.
+Memory follows the largest page, not the document.
+
+Every key-value pair and every table cell below a header becomes a field:
+
+    name        the normalized key or column header ("total amount")
+    label       the key or header as printed ("Total Amount:")
+    value       the value text as printed
+    value_type  'number', 'date' or 'keyword'
+    value_number / value_date / value_keyword
+                the typed value, for exact and range filters
+    row_label   for table cells, the text of the row's first cell ("Acme Corp")
+"""
+import re
+from datetime import datetime
+
+from docuinsight.field_names import normalize_text, normalize_field_name
+
+# Longest value kept in value_keyword (longer values are still returned as 'value').
+MAX_KEYWORD_LENGTH = 256
+
+_NUMBER_PATTERN = re.compile(
+    r'^(?P<open>\()?\s*(?P<sign>[-+])?\s*(?:[$€£¥]|usd|eur|gbp)?\s*'
+    r'(?P<digits>\d{1,3}(?:,\d{3})+|\d+)(?P<fraction>\.\d+)?\s*(?:%|usd|eur|gbp)?\s*(?P<close>\))?$'
+)
+_DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%B %d, %Y', '%b %d, %Y', '%d %B %Y', '%d %b %Y', '%d.%m.%Y')
+_MONTH_FIRST_FORMATS = ('%m/%d/%Y', '%m/%d/%y', '%m-%d-%Y')
+_DAY_FIRST_FORMATS = ('%d/%m/%Y', '%d/%m/%y', '%d-%m-%Y')
+
+
+def parse_number(text):
+    match = _NUMBER_PATTERN.match(text.strip().lower())
+    if not match or bool(match.group('open')) != bool(match.group('close')):
+        return None
+    number = float(match.group('digits').replace(',', '') + (match.group('fraction') or ''))
+    if match.group('open') or match.group('sign') == '-':
+        number = -number
+    return number
+
+
+def parse_date(text, day_first=False):
+    """
+    Returns the date as YYYY-MM-DD, or None. Numeric dates are read month first unless day_first.
+    """
+    # Every format needs a digit; this keeps plain keywords away from strptime.
+    if len(text) > 40 or not any(c.isdigit() for c in text):
+        return None
+    text = " ".join(text.replace(',', ', ').split()).replace(' ,', ',')
+    formats = _DATE_FORMATS + (_DAY_FIRST_FORMATS if day_first else _MONTH_FIRST_FORMATS)
+    for date_format in formats:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def type_value(text, day_first=False):
+    """
+    Returns the typed value fields for a value text: value_type plus value_number,
+    value_date or value_keyword.
+    """
+    number = parse_number(text)
+    if number is not None:
+        return {'value_type': 'number', 'value_number': number}
+    date = parse_date(text, day_first)
+    if date is not None:
+        return {'value_type': 'date', 'value_date': date}
+    return {'value_type': 'keyword', 'value_keyword': normalize_text(text)[:MAX_KEYWORD_LENGTH]}
+
+
+def _child_ids(block, relationship='CHILD'):
+    for entry in block.get('Relationships') or []:
+        if entry['Type'] == relationship:
+            yield from entry['Ids']
+
+
+class StructuredExtractor:
+    """
+    Collects the FORMS and TABLES blocks of one Textract job and resolves them into fields.
+
+    Usage:
+        extractor = StructuredExtractor()
+        for block in extractor.observe(blocks):
+            ...
+        fields = extractor.fields()
+    """
+
+    def __init__(self, day_first=False):
+        self.day_first = day_first
+        self._fields = []      # fields of the finished pages
+        self._table_count = 0  # tables on the finished pages
+        self._page = None
+        self._reset_page()
+
+    def _reset_page(self):
+        self._words = {}       # WORD / SELECTION_ELEMENT id -> text
+        self._values = {}      # KEY_VALUE_SET (VALUE) id -> block
+        self._keys = []        # KEY_VALUE_SET (KEY) blocks, in document order
+        self._cells = {}       # CELL id -> block
+        self._tables = []      # TABLE blocks, in document order
+
+    def _finish_page(self):
+        self._fields.extend(self._form_fields())
+        self._fields.extend(self._table_fields())
+        self._table_count += len(self._tables)
+        self._reset_page()
+
+    def observe(self, blocks):
+        """
+        Yields the blocks unchanged, indexing the ones needed to resolve forms and
+        tables of the current page and resolving each page when the next one starts.
+        """
+        for block in blocks:
+            page = block.get('Page', 1)
+            if page != self._page:
+                self._finish_page()
+                self._page = page
+            block_type = block['BlockType']
+            if block_type == 'WORD':
+                self._words[block['Id']] = block.get('Text', '')
+            elif block_type == 'SELECTION_ELEMENT':
+                self._words[block['Id']] = 'selected' if block.get('SelectionStatus') == 'SELECTED' else 'not selected'
+            elif block_type == 'KEY_VALUE_SET':
+                if 'KEY' in block.get('EntityTypes', ()):
+                    self._keys.append(block)
+                else:
+                    self._values[block['Id']] = block
+            elif block_type == 'CELL':
+                self._cells[block['Id']] = block
+            elif block_type == 'TABLE':
+                self._tables.append(block)
+            yield block
+
+    def _text(self, block):
+        return " ".join(self._words[i] for i in _child_ids(block) if i in self._words)
+
+    def _field(self, name, label, value, page, confidence, **extra):
+        return {'name': name, 'label': label, 'value': value, 'page': page,
+                'confidence': round(confidence, 2), **type_value(value, self.day_first), **extra}
+
+    def _form_fields(self):
+        fields = []
+        for key in self._keys:
+            label = self._text(key)
+            name = normalize_field_name(label)
+            if not name:
+                continue
+            value_blocks = [self._values[i] for i in _child_ids(key, 'VALUE') if i in self._values]
+            value = " ".join(self._text(block) for block in value_blocks).strip()
+            if not value:
+                continue
+            confidence = min([key.get('Confidence', 0.0)] + [block.get('Confidence', 0.0) for block in value_blocks])
+            fields.append(self._field(name, label, value, key.get('Page', 1), confidence, source='form'))
+        return fields
+
+    def _table_fields(self):
+        fields = []
+        for table_index, table in enumerate(self._tables, start=self._table_count):
+            rows = {}
+            header_rows = set()
+            for cell_id in _child_ids(table):
+                cell = self._cells.get(cell_id)
+                if cell is None:
+                    continue
+                row, column = cell.get('RowIndex', 1), cell.get('ColumnIndex', 1)
+                rows.setdefault(row, {})[column] = (self._text(cell), cell.get('Confidence', 0.0))
+                if 'COLUMN_HEADER' in cell.get('EntityTypes', ()):
+                    header_rows.add(row)
+            if not rows:
+                continue
+            # Without COLUMN_HEADER cells, the first row is taken as the header.
+            header_rows = header_rows or {min(rows)}
+            headers = {}
+            for row in sorted(header_rows):
+                for column, (text, _confidence) in rows[row].items():
+                    headers[column] = f"{headers[column]} {text}" if column in headers else text
+            for row in sorted(set(rows) - header_rows):
+                cells = rows[row]
+                row_label = cells[min(cells)][0]
+                for column, (text, confidence) in sorted(cells.items()):
+                    label = headers.get(column, '')
+                    name = normalize_field_name(label) or f"column {column}"
+                    if not text:
+                        continue
+                    fields.append(self._field(name, label, text, table.get('Page', 1), confidence, source='table',
+                                              table_index=table_index, row_index=row, column_index=column,
+                                              row_label=normalize_text(row_label)[:MAX_KEYWORD_LENGTH]))
+        return fields
+
+    def fields(self):
+        """
+        Returns the fields of every page in page order: a page's form fields, then its table fields.
+        """
+        self._finish_page()
+        return self._fields
@@ -0,0 +1,80 @@
+"""
+Checks that BulkIndexer puts back a usable refresh_interval after a large
+ingest, including after an ingest that was killed with refresh switched off.
+Runs against the benchmark's in-memory OpenSearch (src/benchmark/fakes.py).
+
+    cd src/processor_lambda && python -m pytest -q test_bulk.py
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmark'))
+
+import bulk
+from bulk import BulkIndexer
+from fakes import FakeOpenSearch, Timer
+
+INDEX = 'index'
+
+
+@pytest.fixture(autouse=True)
+def fresh_container():
+    bulk._refresh_state.clear()
+    yield
+    bulk._refresh_state.clear()
+
+
+def make_client(refresh_interval=None):
+    client = FakeOpenSearch(Timer())
+    client.indices.create(INDEX)
+    if refresh_interval is not None:
+        client.indices.put_settings(index=INDEX, body={'index': {'refresh_interval': refresh_interval}})
+    return client
+
+
+def refresh_interval(client):
+    return client.settings.get(INDEX, {}).get('refresh_interval')
+
+
+def large_ingest(indexer, documents=4):
+    # max_bytes is small enough that every document is its own bulk request.
+    for n in range(documents):
+        indexer.index(f"doc-{n}", {'text': f"document {n}"})
+        indexer.flush()
+
+
+def test_restores_the_interval_the_index_had():
+    client = make_client('30s')
+    with BulkIndexer(client, INDEX, max_bytes=64) as indexer:
+        large_ingest(indexer)
+        assert refresh_interval(client) == '-1'
+    assert refresh_interval(client) == '30s'
+
+
+def test_resets_an_unset_interval_to_the_default():
+    client = make_client()
+    with BulkIndexer(client, INDEX, max_bytes=64) as indexer:
+        large_ingest(indexer)
+    assert refresh_interval(client) is None
+
+
+def test_killed_ingest_is_repaired_by_the_next_one():
+    client = make_client('30s')
+    killed = BulkIndexer(client, INDEX, max_bytes=64)
+    large_ingest(killed)
+    assert refresh_interval(client) == '-1'
+
+    # The container died before close(); a new one starts with no refresh state.
+    bulk._refresh_state.clear()
+    with BulkIndexer(client, INDEX, max_bytes=64, refresh_interval='1s') as indexer:
+        large_ingest(indexer)
+    assert refresh_interval(client) == '1s'
+
+
+def test_unmanaged_index_keeps_refresh_off():
+    client = make_client('-1')
+    with BulkIndexer(client, INDEX, max_bytes=64, manage_refresh=False) as indexer:
+        large_ingest(indexer)
+    assert refresh_interval(client) == '-1'
@@ -0,0 +1,80 @@
+import json
+import logging
+
+logger = logging.getLogger()
+
+# Textract writes OutputConfig results to s3://<bucket>/<prefix>/<JobId>/1, 2, 3, ...
+# Each object has the same shape as a GetDocumentAnalysis response page.
+DEFAULT_OUTPUT_PREFIX = 'textract_output'
+
+
+def list_output_keys(s3_client, bucket, prefix, job_id):
+    """
+    Returns the keys of a job's Textract output objects, in part order.
+    Non-numeric objects (such as .s3_access_check) are skipped.
+    """
+    job_prefix = f"{prefix.rstrip('/')}/{job_id}/"
+    parts = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=job_prefix):
+        for obj in page.get('Contents', []):
+            name = obj['Key'][len(job_prefix):]
+            if name.isdigit():
+                parts.append((int(name), obj['Key']))
+    return [key for _, key in sorted(parts)]
+
+
+def iter_blocks_from_s3(s3_client, bucket, keys):
+    """
+    Yields Textract blocks from the output objects one object at a time,
+    so only a single part is ever held in memory.
+    """
+    for key in keys:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+        with response['Body'] as body:
+            part = json.load(body)
+        yield from part.get('Blocks', [])
+
+
+def iter_blocks_from_api(textract_client, job_id):
+    """
+    Yields Textract blocks through paginated GetDocumentAnalysis calls.
+    """
+    kwargs = {'JobId': job_id}
+    while True:
+        response = textract_client.get_document_analysis(**kwargs)
+        yield from response['Blocks']
+        if 'NextToken' not in response:
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+
+def iter_blocks(job_id, s3_client, textract_client, output_bucket=None, output_prefix=DEFAULT_OUTPUT_PREFIX):
+    """
+    Yields all blocks of a Textract analysis job.
+
+    Results are streamed from the job's S3 output objects when an output bucket is
+    configured. If the bucket is not set, the objects cannot be listed, or none exist,
+    it falls back to the GetDocumentAnalysis API.
+    """
+    keys = []
+    if output_bucket:
+        try:
+            keys = list_output_keys(s3_client, output_bucket, output_prefix, job_id)
+        except Exception as e:
+            logger.warning(f"Could not list Textract output for JobId {job_id} in s3://{output_bucket}/{output_prefix}: {e}")
+    if keys:
+        logger.info(f"Reading Textract results for JobId {job_id} from {len(keys)} S3 objects.")
+        yield from iter_blocks_from_s3(s3_client, output_bucket, keys)
+    else:
+        logger.info(f"Reading Textract results for JobId {job_id} from the GetDocumentAnalysis API.")
+        yield from iter_blocks_from_api(textract_client, job_id)
+
+
+def iter_lines(blocks):
+    """
+    Yields (text, page) for every LINE block, in reading order.
+    """
+    for block in blocks:
+        if block['BlockType'] == 'LINE':
+            yield block['Text'], block.get('Page', 1)
@@ -0,0 +1,195 @@
+"""
+Measures recall@k and query latency of kNN index configurations against exact search.
+
+Every build configuration (engine, space type, m, ef_construction, data type)
+gets a temporary index loaded with the same vectors; each ef_search value is
+then applied in place and the query set is run. Recall@k is measured against
+an exact NumPy search over the original float32 vectors, so quantization loss
+(fp16, byte) shows up in the recall.
+
+Vectors come from an existing index (--from-index, needs the embedding in
+_source), a .npy file (--vectors) or are generated (--synthetic, clustered
+unit vectors). Queries are perturbed copies of random corpus vectors.
+
+Usage:
+    python knn_benchmark.py --from-index index --limit 50000 --queries 500 \\
+        --engines faiss lucene --m 16 32 --ef-construction 128 256 --ef-search 64 128 256 \\
+        --data-types float fp16 byte --output knn_results.json
+"""
+import argparse
+import itertools
+import json
+import statistics
+import time
+
+import numpy as np
+from opensearchpy import helpers
+
+from manage_index import connect
+from docuinsight.search_index import (DATA_TYPES, ENGINES, EMBEDDING_DIMENSION, DEFAULT_BYTE_SCALE,
+                                      create_index, encode_vector, set_ef_search)
+
+
+def load_from_index(client, index, limit):
+    vectors = []
+    for hit in helpers.scan(client, index=index, query={"query": {"match_all": {}}}, _source=['embedding']):
+        embedding = hit.get('_source', {}).get('embedding')
+        if embedding is None:
+            raise SystemExit(f"Index '{index}' does not keep embeddings in _source; use --vectors or --synthetic.")
+        vectors.append(embedding)
+        if len(vectors) >= limit:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_vectors(rows, dimension, rng, clusters=100):
+    # Clustered rather than uniform: neighbourhoods of real embeddings are dense.
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(0, clusters, rows)] + 0.5 * rng.normal(size=(rows, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def normalize(vectors):
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def make_queries(vectors, count, noise, rng):
+    picks = vectors[rng.choice(len(vectors), size=count, replace=len(vectors) < count)]
+    return normalize(picks + noise * rng.normal(size=picks.shape).astype(np.float32))
+
+
+def exact_neighbours(vectors, queries, k, space_type):
+    """
+    Returns the ids (row numbers) of the exact k nearest vectors for every query.
+    """
+    if space_type == 'cosinesimil':
+        scores = normalize(queries) @ normalize(vectors).T
+    elif space_type == 'innerproduct':
+        scores = queries @ vectors.T
+    else:
+        # Smallest l2 distance == largest 2<q,v> - |v|^2.
+        scores = 2 * queries @ vectors.T - (vectors ** 2).sum(axis=1)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [set(row.tolist()) for row in top]
+
+
+def load_index(client, name, vectors, config):
+    actions = ({'_index': name, '_id': str(i),
+                '_source': {'embedding': encode_vector(vector, config['data_type'], config['byte_scale'])}}
+               for i, vector in enumerate(vectors))
+    client.indices.put_settings(index=name, body={'index': {'refresh_interval': '-1'}})
+    start = time.perf_counter()
+    helpers.bulk(client, actions, chunk_size=500, request_timeout=300)
+    client.indices.put_settings(index=name, body={'index': {'refresh_interval': '1s'}})
+    client.indices.refresh(index=name)
+    client.indices.forcemerge(index=name, max_num_segments=1, request_timeout=1800)
+    build_seconds = time.perf_counter() - start
+    stats = client.indices.stats(index=name, metric='store')
+    return build_seconds, stats['indices'][name]['total']['store']['size_in_bytes']
+
+
+def run_queries(client, name, queries, truth, k, config, warmup):
+    def body(query):
+        vector = encode_vector(query, config['data_type'], config['byte_scale'])
+        return {"size": k, "_source": False, "query": {"knn": {"embedding": {"vector": vector, "k": config['query_k']}}}}
+
+    for query in queries[:warmup]:
+        client.search(index=name, body=body(query))
+    latencies, took, recalls = [], [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        response = client.search(index=name, body=body(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+        took.append(response['took'])
+        found = {int(hit['_id']) for hit in response['hits']['hits']}
+        recalls.append(len(found & expected) / k)
+    latencies.sort()
+    return {
+        'recall_at_k': round(statistics.mean(recalls), 4),
+        'latency_p50_ms': round(latencies[len(latencies) // 2], 2),
+        'latency_p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        'took_mean_ms': round(statistics.mean(took), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', help="OpenSearch domain endpoint (default: OPENSEARCH_DOMAIN_ENDPOINT).")
+    parser.add_argument('--region')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--from-index', help="Read the corpus vectors from this index.")
+    source.add_argument('--vectors', help="A .npy file of (rows, dimension) vectors.")
+    source.add_argument('--synthetic', type=int, help="Generate this many clustered unit vectors.")
+    parser.add_argument('--limit', type=int, default=50000, help="Vectors to read with --from-index.")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--query-noise', type=float, default=0.05)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=['faiss'])
+    parser.add_argument('--space-types', nargs='+', default=['l2'])
+    parser.add_argument('--m', nargs='+', type=int, default=[16])
+    parser.add_argument('--ef-construction', nargs='+', type=int, default=[128])
+    parser.add_argument('--ef-search', nargs='+', type=int, default=[100],
+                        help="faiss/nmslib: index setting; lucene: the query's k (candidates).")
+    parser.add_argument('--data-types', nargs='+', choices=DATA_TYPES, default=['float'])
+    parser.add_argument('--byte-scale', type=float, default=DEFAULT_BYTE_SCALE)
+    parser.add_argument('--warmup', type=int, default=50, help="Unmeasured queries run first per setting.")
+    parser.add_argument('--index-prefix', default='knn-benchmark')
+    parser.add_argument('--keep', action='store_true', help="Keep the benchmark indices.")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', default='knn_benchmark_results.json')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    client = connect(args.host, args.region)
+    if args.from_index:
+        vectors = load_from_index(client, args.from_index, args.limit)
+    elif args.vectors:
+        vectors = np.load(args.vectors).astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.synthetic, EMBEDDING_DIMENSION, rng)
+    queries = make_queries(vectors, args.queries, args.query_noise, rng)
+    print(f"Corpus: {vectors.shape[0]} x {vectors.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    truth_by_space = {}
+    results = []
+    builds = itertools.product(args.engines, args.space_types, args.m, args.ef_construction, args.data_types)
+    for n, (engine, space_type, m, ef_construction, data_type) in enumerate(builds):
+        config = {'dimension': int(vectors.shape[1]), 'engine': engine, 'space_type': space_type, 'm': m,
+                  'ef_construction': ef_construction, 'data_type': data_type, 'byte_scale': args.byte_scale,
+                  'source_vectors': False, 'replicas': 0}
+        name = f"{args.index_prefix}-{n}"
+        try:
+            create_index(client, name, config)
+        except ValueError as e:
+            print(f"Skipping {engine}/{space_type}/{data_type}: {e}")
+            continue
+        try:
+            if space_type not in truth_by_space:
+                truth_by_space[space_type] = exact_neighbours(vectors, queries, args.k, space_type)
+            build_seconds, size_bytes = load_index(client, name, vectors, config)
+            for ef_search in args.ef_search:
+                query_config = {**config, 'query_k': args.k}
+                if engine == 'lucene':
+                    query_config['query_k'] = max(args.k, ef_search)
+                else:
+                    set_ef_search(client, name, ef_search)
+                measured = run_queries(client, name, queries, truth_by_space[space_type], args.k,
+                                       query_config, args.warmup)
+                results.append({**config, 'ef_search': ef_search, 'build_seconds': round(build_seconds, 1),
+                                'index_bytes': size_bytes, **measured})
+                print(f"{engine:<7}{space_type:<13}{data_type:<6}m={m:<4}efc={ef_construction:<5}"
+                      f"efs={ef_search:<5}recall@{args.k}={measured['recall_at_k']:.4f}  "
+                      f"p50={measured['latency_p50_ms']:.1f}ms  p95={measured['latency_p95_ms']:.1f}ms  "
+                      f"size={size_bytes / 2**20:.1f}MB")
+        finally:
+            if not args.keep:
+                client.indices.delete(index=name)
+
+    with open(args.output, 'w') as f:
+        json.dump({'corpus_rows': int(vectors.shape[0]), 'queries': len(queries), 'k': args.k,
+                   'results': results}, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
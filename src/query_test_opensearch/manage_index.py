@@ -0,0 +1,122 @@
+"""
+Creates chunk indices and moves the alias the Lambdas use between them.
+
+The Lambdas read and write OPENSEARCH_INDEX_NAME (an alias); each index
+configuration lives in its own versioned index:
+
+    # create a new index and make it live (the old index stays until deleted)
+    python manage_index.py create docuinsight-chunks-v2 --engine faiss --m 32 --ef-construction 256
+    python manage_index.py swap index docuinsight-chunks-v2
+
+    # the first swap turns the original concrete 'index' into an alias; this deletes it
+    python manage_index.py swap index docuinsight-chunks-v1 --replace-index
+
+    python manage_index.py describe index
+    python manage_index.py set-ef-search docuinsight-chunks-v2 256
+
+Use knn_benchmark.py to choose the settings, and fill the new index (e.g. with
+the reindex backfill) before swapping.
+"""
+import argparse
+import json
+import os
+import sys
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(SRC_DIR, 'shared_layer', 'python'))  # docuinsight (the shared Lambda layer)
+
+from docuinsight.clients import get_opensearch_client  # noqa: E402
+from docuinsight.search_index import (DEFAULT_INDEX_CONFIG, DATA_TYPES, ENGINES, create_index,  # noqa: E402
+                                      get_index_config, resolve_alias, set_ef_search, swap_alias)
+
+
+def connect(host=None, region=None):
+    """
+    Returns an OpenSearch client for the domain endpoint (OPENSEARCH_DOMAIN_ENDPOINT by default).
+    """
+    host = host or os.environ.get('OPENSEARCH_DOMAIN_ENDPOINT')
+    region = region or os.environ.get('AWS_REGION', 'us-east-1')
+    if not host:
+        raise SystemExit("Set --host or OPENSEARCH_DOMAIN_ENDPOINT.")
+    return get_opensearch_client(host, region, timeout=120)
+
+
+def add_index_config_arguments(parser):
+    """
+    Adds one option per index setting; defaults are those of docuinsight.search_index.
+    """
+    parser.add_argument('--engine', choices=ENGINES, default=DEFAULT_INDEX_CONFIG['engine'])
+    parser.add_argument('--space-type', default=DEFAULT_INDEX_CONFIG['space_type'])
+    parser.add_argument('--m', type=int, default=DEFAULT_INDEX_CONFIG['m'])
+    parser.add_argument('--ef-construction', type=int, default=DEFAULT_INDEX_CONFIG['ef_construction'])
+    parser.add_argument('--ef-search', type=int, default=DEFAULT_INDEX_CONFIG['ef_search'])
+    parser.add_argument('--data-type', choices=DATA_TYPES, default=DEFAULT_INDEX_CONFIG['data_type'])
+    parser.add_argument('--byte-scale', type=float, default=DEFAULT_INDEX_CONFIG['byte_scale'])
+    parser.add_argument('--no-source-vectors', action='store_true',
+                        help="Leave the embedding out of _source (smaller index; vectors cannot be read back).")
+    parser.add_argument('--shards', type=int, default=DEFAULT_INDEX_CONFIG['shards'])
+    parser.add_argument('--replicas', type=int, default=DEFAULT_INDEX_CONFIG['replicas'])
+
+
+def index_config_from_args(args):
+    return {
+        'engine': args.engine,
+        'space_type': args.space_type,
+        'm': args.m,
+        'ef_construction': args.ef_construction,
+        'ef_search': args.ef_search,
+        'data_type': args.data_type,
+        'byte_scale': args.byte_scale,
+        'source_vectors': not args.no_source_vectors,
+        'shards': args.shards,
+        'replicas': args.replicas,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', help="OpenSearch domain endpoint (default: OPENSEARCH_DOMAIN_ENDPOINT).")
+    parser.add_argument('--region', help="AWS region (default: AWS_REGION or us-east-1).")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    create = commands.add_parser('create', help="Create a chunk index.")
+    create.add_argument('name')
+    add_index_config_arguments(create)
+
+    swap = commands.add_parser('swap', help="Point an alias at an index, atomically.")
+    swap.add_argument('alias')
+    swap.add_argument('index')
+    swap.add_argument('--replace-index', action='store_true',
+                      help="Allow deleting a concrete index that has the alias's name.")
+
+    describe = commands.add_parser('describe', help="Show what an alias points to and its index settings.")
+    describe.add_argument('name')
+
+    ef_search = commands.add_parser('set-ef-search', help="Change ef_search of a faiss/nmslib index in place.")
+    ef_search.add_argument('name')
+    ef_search.add_argument('ef_search', type=int)
+
+    args = parser.parse_args()
+    client = connect(args.host, args.region)
+
+    if args.command == 'create':
+        config = create_index(client, args.name, index_config_from_args(args))
+        print(f"Created index '{args.name}':")
+        print(json.dumps(config, indent=2))
+    elif args.command == 'swap':
+        previous = swap_alias(client, args.alias, args.index, replace_index=args.replace_index)
+        print(f"Alias '{args.alias}' -> '{args.index}' (previously: {', '.join(previous) or 'none'})")
+    elif args.command == 'describe':
+        indices = resolve_alias(client, args.name)
+        print(f"'{args.name}' -> {', '.join(indices) or 'nothing'}")
+        for index in indices:
+            count = client.count(index=index)['count']
+            print(f"\n{index}: {count} documents")
+            print(json.dumps(get_index_config(client, index), indent=2))
+    elif args.command == 'set-ef-search':
+        set_ef_search(client, args.name, args.ef_search)
+        print(f"ef_search of '{args.name}' set to {args.ef_search}")
+
+
+if __name__ == '__main__':
+    main()
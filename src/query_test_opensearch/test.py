@@ -1,49 +1,16 @@
-from opensearchpy import OpenSearch
-from datetime import datetime
-import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection
-from requests_aws4auth import AWS4Auth
+import os
 
-def get_awsauth(region, service):
-    """
-    Returns an AWS4Auth object for signing requests to AWS services.
-    """
-    credentials = boto3.Session().get_credentials()
-    return AWS4Auth(credentials.access_key,
-                    credentials.secret_key,
-                    region,
-                    service,
-                    session_token=credentials.token)
+from manage_index import connect
+from docuinsight.search_index import build_index_body
 
-index_name = 'index'  # Replace with your actual index name
+index_name = os.environ.get('OPENSEARCH_INDEX_NAME', 'index')
 
-# Initialize the client (you may already have this in your code)
-opensearch_client = OpenSearch(
-    hosts=[{'host': "search-docuinsight-search-domain-x4n6dwfufcd57gpkxq25dp6qza.us-east-1.es.amazonaws.com", 'port': 443}],
-    http_auth=get_awsauth('us-east-1', 'es'),
-    use_ssl=True,
-    verify_certs=True,
-    connection_class=RequestsHttpConnection
-)
+# Initialize the client (OPENSEARCH_DOMAIN_ENDPOINT / AWS_REGION)
+opensearch_client = connect()
 
-index_mapping = {
-    "settings": {
-        "index": {
-            "knn": True 
-        }
-    },
-    "mappings": {
-        "properties": {
-            "document_id": {"type": "keyword"},
-            "text_content": {"type": "text"},
-            "embedding": {
-                "type": "knn_vector",
-                "dimension": 384
-            },
-            "timestamp": {"type": "date"}
-        }
-    }
-}
+# The mapping (and its kNN method settings) comes from docuinsight.search_index;
+# use manage_index.py for anything beyond the default configuration.
+index_mapping = build_index_body()
 
 # Create the new index
 response = opensearch_client.indices.create(
@@ -52,4 +19,3 @@ response = opensearch_client.indices.create(
 )
 
 print("Index recreated:", response)
-
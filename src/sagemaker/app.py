@@ -1,40 +1,167 @@
 import os
+import gc
 import json
-from flask import Flask, request, jsonify
-from sentence_transformers import SentenceTransformer
-import torch # PyTorch is a dependency of sentence-transformers
+import time
+from flask import Flask, Response, request, jsonify
+from batcher import DynamicBatcher
+from docuinsight.wire_format import SUPPORTED_ACCEPT_TYPES, JSON_CONTENT_TYPE, encode_embeddings
+from docuinsight.metrics import MetricsLogger
 
 # Initialize Flask app
 app = Flask(__name__)
 
+# Inference backend: 'torch' runs the SentenceTransformer at fp32, 'onnx' runs the
+# int8-quantized export from export_onnx.py under ONNX Runtime (torch is not imported).
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'torch').lower()
+ONNX_MODEL_DIR = os.environ.get('ONNX_MODEL_DIR', '/app/onnx-model')
+
+# Model artifacts are looked up in model_dir (SageMaker's /opt/ml/model when the
+# model has model data), then in the copy baked into the image at build time.
+# Only if neither exists is MODEL_NAME downloaded from the Hugging Face hub.
+MODEL_NAME = os.environ.get('MODEL_NAME', 'all-MiniLM-L6-v2')
+BAKED_MODEL_DIR = os.environ.get('BAKED_MODEL_DIR', '/app/model')
+DEFAULT_MODEL_DIR = os.environ.get('SM_MODEL_DIR', '/opt/ml/model')
+
 # Global variable to hold the loaded model.
 # This ensures the model is loaded only once when the container starts (cold start).
 model = None
 
+# Dynamic batching configuration. Concurrent requests are queued for at most
+# BATCH_MAX_WAIT_MS and encoded together, up to BATCH_MAX_SIZE texts per call.
+BATCHING_ENABLED = os.environ.get('BATCHING_ENABLED', 'true').lower() == 'true'
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', '64'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', '5'))
+BATCH_MAX_QUEUE_SIZE = int(os.environ.get('BATCH_MAX_QUEUE_SIZE', '1024'))
+
+# Global batcher sitting in front of model.encode. It owns a background thread,
+# so it is created per worker process (after the fork), not alongside the model.
+batcher = None
+
+# Set once the worker has run a warm-up inference; /ping reports unhealthy until then.
+ready = False
+WARMUP_TEXTS = ["DocuInsight warm-up sentence.", "Invoice total amount due within 30 days."]
+
+def record_batch_metrics(rows, queue_waits_ms, encode_ms):
+    """
+    Emits one EMF record per encode call: how long each request queued and how long encoding took.
+    """
+    metrics = MetricsLogger('model-server')
+    metrics.put_metric('BatchSize', rows, 'Count')
+    metrics.put_metric('RequestsPerBatch', len(queue_waits_ms), 'Count')
+    for wait_ms in queue_waits_ms:
+        metrics.put_metric('QueueTime', wait_ms)
+    metrics.put_metric('EncodeTime', encode_ms)
+    if batcher is not None:
+        metrics.put_metric('QueueDepth', batcher.stats()['queue_depth'], 'Count')
+    metrics.flush()
+
 # --- SageMaker Specific Functions ---
 # SageMaker's serving container will look for these functions
 # when it starts up and when it receives inference requests.
 
 def model_fn(model_dir):
     """
-    Loads the pre-trained SentenceTransformer model.
+    Loads the pre-trained SentenceTransformer model, or its ONNX export when EMBEDDING_BACKEND=onnx.
     This function is called by SageMaker when the container starts.
 
     Args:
-        model_dir (str): The directory where SageMaker expects model artifacts.
-                         For this example, we're downloading the model, so model_dir isn't directly used
-                         to load from a local path, but it's a required argument.
+        model_dir (str): The directory where SageMaker expects model artifacts. A saved
+                         SentenceTransformer there (or an ONNX export in its onnx/
+                         subdirectory) takes precedence over the copy baked into the image.
     Returns:
-        SentenceTransformer: The loaded SentenceTransformer model.
+        SentenceTransformer or OnnxEncoder: The loaded model; both expose encode().
     """
-    print(f"Loading SentenceTransformer model 'all-MiniLM-L6-v2'...")
-    # 'all-MiniLM-L6-v2' is a small, efficient, and effective model for embeddings.
-    # The SentenceTransformer library will download it if not already cached.
     global model
-    model = SentenceTransformer('all-MiniLM-L6-v2')
+    metrics = MetricsLogger('model-server', Backend=EMBEDDING_BACKEND)
+    if EMBEDDING_BACKEND == 'onnx':
+        start = time.perf_counter()
+        from onnx_backend import OnnxEncoder
+        metrics.put_metric('ModelImportTime', (time.perf_counter() - start) * 1000)
+        path = resolve_onnx_model_path(model_dir)
+        print(f"Loading quantized ONNX model from {path}...")
+        with metrics.timer('ModelLoadTime'):
+            model = OnnxEncoder(path)
+        print("Model loaded successfully.")
+        metrics.flush()
+        return model
+
+    start = time.perf_counter()
+    from sentence_transformers import SentenceTransformer
+    metrics.put_metric('ModelImportTime', (time.perf_counter() - start) * 1000)
+    path = resolve_model_path(model_dir)
+    print(f"Loading SentenceTransformer model '{path}'...")
+    # 'all-MiniLM-L6-v2' is a small, efficient, and effective model for embeddings.
+    with metrics.timer('ModelLoadTime'):
+        model = SentenceTransformer(path, device='cpu')
     print("Model loaded successfully.")
+    metrics.flush()
     return model
 
+def resolve_model_path(model_dir):
+    """
+    Returns the local directory to load the SentenceTransformer from, or MODEL_NAME
+    (downloaded from the hub) when no local copy exists.
+    """
+    for candidate in (model_dir, BAKED_MODEL_DIR):
+        if candidate and os.path.isfile(os.path.join(candidate, 'modules.json')):
+            return candidate
+    print(f"No local model artifacts found; downloading '{MODEL_NAME}' from the Hugging Face hub.")
+    return MODEL_NAME
+
+def resolve_onnx_model_path(model_dir):
+    if model_dir and os.path.isdir(os.path.join(model_dir, 'onnx')):
+        return os.path.join(model_dir, 'onnx')
+    return ONNX_MODEL_DIR
+
+def init_worker(num_threads=None):
+    """
+    Prepares a serving process once the model is loaded: sets the inference
+    thread count, starts the batcher thread and runs a warm-up inference.
+    Under gunicorn this runs in every worker after the fork.
+
+    Args:
+        num_threads (int, optional): Intra-op threads for this process. Left unchanged if None.
+    """
+    global batcher, ready
+    if EMBEDDING_BACKEND == 'onnx':
+        # The ONNX Runtime session owns a thread pool, so it is only created after the fork.
+        model.start(num_threads)
+    elif num_threads:
+        import torch
+        torch.set_num_threads(num_threads)
+    if BATCHING_ENABLED and batcher is None:
+        loaded_model = model
+        batcher = DynamicBatcher(
+            lambda texts: loaded_model.encode(texts, convert_to_numpy=True),
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            max_queue_size=BATCH_MAX_QUEUE_SIZE,
+            on_batch=record_batch_metrics
+        )
+        print(f"Dynamic batching enabled (max batch size {BATCH_MAX_SIZE}, max wait {BATCH_MAX_WAIT_MS} ms).")
+    started = time.perf_counter()
+    model.encode(WARMUP_TEXTS, convert_to_numpy=True)
+    ready = True
+    print(f"Warm-up inference done in {(time.perf_counter() - started) * 1000:.0f} ms "
+          f"(pid {os.getpid()}, {EMBEDDING_BACKEND} backend, {num_threads or 'default'} threads).")
+
+def create_app(model_dir=DEFAULT_MODEL_DIR):
+    """
+    Application factory for gunicorn (`app:create_app()` with preload_app).
+    Loads the model once in the master process so that forked workers share
+    its weights copy-on-write.
+    """
+    if model is None:
+        if EMBEDDING_BACKEND != 'onnx':
+            # A single thread keeps torch from starting its OpenMP pool before the fork.
+            import torch
+            torch.set_num_threads(1)
+        model_fn(model_dir)
+        # Move the loaded objects out of the garbage collector's generations so
+        # collections in the workers do not touch (and copy) their pages.
+        gc.freeze()
+    return app
+
 def predict_fn(input_data, model):
     """
     Performs inference (embedding generation) on the input data using the loaded model.
@@ -42,23 +169,46 @@ def predict_fn(input_data, model):
 
     Args:
         input_data (str or list[str]): The text string(s) to be embedded.
-        model (SentenceTransformer): The loaded SentenceTransformer model.
+        model (SentenceTransformer or OnnxEncoder): The loaded model.
 
     Returns:
-        list[list[float]]: A list of embedding vectors (each vector is a list of floats).
+        numpy.ndarray: A (len(input_data), 384) float32 array of embedding vectors.
     """
-    print(f"Received input data for prediction: {input_data[:100]}...") # Log first 100 chars
-    
     # Ensure input_data is a list of strings, as the model expects
     if isinstance(input_data, str):
         input_data = [input_data]
     elif not isinstance(input_data, list) or not all(isinstance(item, str) for item in input_data):
         raise ValueError("Input data must be a string or a list of strings.")
 
-    # Generate embeddings. convert_to_tensor=True returns PyTorch tensors.
-    # We then convert them to a list of lists for JSON serialization.
-    embeddings = model.encode(input_data, convert_to_tensor=True)
-    return embeddings.tolist()
+    # Generate embeddings. convert_to_numpy=True returns a float32 NumPy array,
+    # which output_fn serializes to JSON or to a compact binary format.
+    # When batching is enabled, the request is merged with other concurrent
+    # requests and only this request's rows are returned.
+    if batcher is not None:
+        return batcher.submit(input_data)
+    started = time.perf_counter()
+    embeddings = model.encode(input_data, convert_to_numpy=True)
+    record_batch_metrics(len(input_data), [0.0], (time.perf_counter() - started) * 1000)
+    return embeddings
+
+def output_fn(prediction, accept):
+    """
+    Serializes the embeddings for the response.
+    This function is called by SageMaker after predict_fn.
+
+    Args:
+        prediction (numpy.ndarray): The embeddings returned by predict_fn.
+        accept (str): The requested content type. Binary formats avoid writing
+                      384 decimal floats per row:
+                      - application/x-embeddings-f32: 16 byte shape header + raw little-endian float32
+                      - application/x-embeddings-f16: 16 byte shape header + raw little-endian float16
+                      - application/x-npy: a NumPy .npy file
+                      Anything else falls back to {"embeddings": [[...]]} JSON.
+
+    Returns:
+        tuple[bytes or str, str]: The response body and its content type.
+    """
+    return encode_embeddings(prediction, accept)
 
 # --- Flask Endpoints for Serving ---
 # These endpoints define the API for your Docker container.
@@ -70,18 +220,28 @@ def ping():
     Health check endpoint.
     SageMaker calls this endpoint to check if the container is healthy and ready to serve requests.
     """
-    print("Ping received. Responding with OK.")
+    if not ready:
+        return jsonify(status='WARMING_UP'), 503
     return jsonify(status='OK'), 200
 
+@app.route('/stats', methods=['GET'])
+def stats():
+    """
+    Batching statistics endpoint.
+    Reports queue depth and batch sizes so BATCH_MAX_SIZE and BATCH_MAX_WAIT_MS can be tuned.
+    """
+    if batcher is None:
+        return jsonify(batching_enabled=False), 200
+    return jsonify(batching_enabled=True, **batcher.stats()), 200
+
 @app.route('/invocations', methods=['POST'])
 def invocations():
     """
     Inference endpoint.
     SageMaker sends actual inference requests to this endpoint.
     It expects a JSON payload with a 'text' key or plain text.
+    The response format is negotiated through the Accept header (see output_fn).
     """
-    print(f"Invocations request received. Content-Type: {request.content_type}")
-
     input_data = None
     if request.content_type == 'application/json':
         try:
@@ -98,21 +258,20 @@ def invocations():
         # Return a 415 Unsupported Media Type if the content type is not supported
         return jsonify(error=f'Unsupported content type: {request.content_type}'), 415
 
-    # Ensure the model is loaded before prediction (important for local testing)
-    # In SageMaker, model_fn is called automatically on container startup.
-    global model
-    if model is None:
-        try:
-            model = model_fn(None) # Load the model if not already loaded
-        except Exception as e:
-            print(f"Error loading model during invocation: {e}")
-            return jsonify(error=f"Model loading failed: {str(e)}"), 500
+    # The model is loaded and warmed up before the worker accepts traffic
+    # (create_app/init_worker); never load it on the request path.
+    if model is None or not ready:
+        return jsonify(error='Model is not loaded yet'), 503
+
+    # Pick the response format from the Accept header (JSON unless a binary format is asked for)
+    accept = request.accept_mimetypes.best_match(SUPPORTED_ACCEPT_TYPES, default=JSON_CONTENT_TYPE)
 
     try:
         # Call the predict_fn with the input data and loaded model
         predictions = predict_fn(input_data, model)
-        # Return the embeddings as a JSON response
-        return jsonify(embeddings=predictions), 200
+        # Return the embeddings in the requested format
+        body, content_type = output_fn(predictions, accept)
+        return Response(body, status=200, mimetype=content_type)
     except ValueError as ve:
         print(f"Validation error in prediction: {ve}")
         return jsonify(error=str(ve)), 400
@@ -122,10 +281,12 @@ def invocations():
 
 # --- Main execution for local testing ---
 if __name__ == '__main__':
-    # When running locally, load the model when the Flask app starts.
-    # SageMaker handles this via model_fn on container startup.
-    model_fn(None) # Call model_fn to load the model
-    
+    # Single-process development server for local testing. The container runs
+    # gunicorn instead (see serve and gunicorn.conf.py).
+    model_fn(DEFAULT_MODEL_DIR) # Call model_fn to load the model
+    init_worker()
+
     # Run the Flask app on port 8080, which SageMaker expects.
     print("Starting Flask app for local testing on http://0.0.0.0:8080")
-    app.run(host='0.0.0.0', port=8080)
+    # threaded=True lets concurrent requests reach the batcher at the same time.
+    app.run(host='0.0.0.0', port=8080, threaded=True)
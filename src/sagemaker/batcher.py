@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+
+class DynamicBatcher:
+    """
+    Coalesces concurrent inference requests into a single model call.
+
+    Callers hand their texts to submit() and block until their own rows are
+    ready. A single background thread drains the request queue: it takes
+    everything that is already waiting, then keeps collecting for at most
+    max_wait_ms (or until max_batch_size rows are gathered) before running
+    one encode call over the whole batch and handing each caller its slice.
+
+    When traffic is low the queue is usually empty, so a request only ever
+    waits max_wait_ms on top of its own encode time. Under load requests pile
+    up while the previous batch is encoding and are served together.
+    """
+
+    def __init__(self, encode_fn, max_batch_size=64, max_wait_ms=5.0, max_queue_size=1024, on_batch=None):
+        """
+        Args:
+            encode_fn (callable): Takes a list[str] and returns a row-indexable
+                                  sequence of embeddings (tensor, array or list).
+            max_batch_size (int): Maximum number of texts encoded in one call. A single
+                                  request larger than this is encoded on its own.
+            max_wait_ms (float): Maximum time to wait for more requests once one is queued.
+            max_queue_size (int): Maximum number of requests waiting to be batched.
+            on_batch (callable, optional): Called after every batch with the number of rows,
+                                           the queue wait of each request (ms) and the encode time (ms).
+        """
+        if max_batch_size <= 0:
+            raise ValueError("max_batch_size must be positive.")
+        self.encode_fn = encode_fn
+        self.on_batch = on_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._carry = deque()  # requests that did not fit into the previous batch
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'batches': 0,
+            'rows': 0,
+            'last_batch_size': 0,
+            'max_batch_size_seen': 0,
+            'queue_wait_ms_total': 0.0,
+            'encode_ms_total': 0.0,
+        }
+        self._thread = threading.Thread(target=self._run, name='dynamic-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts, timeout=None):
+        """
+        Queues texts for the next batch and blocks until their embeddings are ready.
+
+        Args:
+            texts (list[str]): The texts to embed.
+            timeout (float, optional): Seconds to wait for a queue slot and for the result.
+
+        Returns:
+            The rows of encode_fn's output that belong to texts, in input order.
+        """
+        future = Future()
+        self._queue.put((texts, future, time.monotonic()), timeout=timeout)
+        return future.result(timeout=timeout)
+
+    def stats(self):
+        """
+        Returns a snapshot of the batching counters, including the current queue depth.
+        """
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        batches = snapshot['batches'] or 1
+        requests = snapshot['requests'] or 1
+        snapshot['queue_depth'] = self._queue.qsize() + len(self._carry)
+        snapshot['avg_batch_size'] = snapshot['rows'] / batches
+        snapshot['avg_queue_wait_ms'] = snapshot['queue_wait_ms_total'] / requests
+        snapshot['avg_encode_ms'] = snapshot['encode_ms_total'] / batches
+        snapshot['max_batch_size'] = self.max_batch_size
+        snapshot['max_wait_ms'] = self.max_wait * 1000.0
+        return snapshot
+
+    def _next_request(self, timeout):
+        if self._carry:
+            return self._carry.popleft()
+        if timeout is None:
+            return self._queue.get()
+        if timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        first = self._next_request(None)
+        batch = [first]
+        rows = len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while rows < self.max_batch_size:
+            try:
+                item = self._next_request(deadline - time.monotonic())
+            except queue.Empty:
+                break
+            if rows + len(item[0]) > self.max_batch_size:
+                self._carry.append(item)
+                break
+            batch.append(item)
+            rows += len(item[0])
+        return batch, rows
+
+    def _run(self):
+        while True:
+            batch, rows = self._collect()
+            started = time.monotonic()
+            texts = [text for item in batch for text in item[0]]
+            try:
+                embeddings = self.encode_fn(texts)
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.monotonic()
+
+            offset = 0
+            for item_texts, future, _ in batch:
+                future.set_result(embeddings[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+            queue_waits_ms = [(started - enqueued) * 1000.0 for _, _, enqueued in batch]
+            encode_ms = (finished - started) * 1000.0
+            with self._stats_lock:
+                self._stats['requests'] += len(batch)
+                self._stats['batches'] += 1
+                self._stats['rows'] += rows
+                self._stats['last_batch_size'] = rows
+                self._stats['max_batch_size_seen'] = max(self._stats['max_batch_size_seen'], rows)
+                self._stats['queue_wait_ms_total'] += sum(queue_waits_ms)
+                self._stats['encode_ms_total'] += encode_ms
+
+            if self.on_batch is not None:
+                try:
+                    self.on_batch(rows, queue_waits_ms, encode_ms)
+                except Exception:
+                    # Metrics must never take the batching thread down.
+                    pass
@@ -0,0 +1,73 @@
+"""
+Accuracy and latency parity check between the PyTorch and ONNX Runtime backends.
+
+Embeds the same sentences with SentenceTransformer and OnnxEncoder and fails
+(exit code 1) if any pair of embeddings has a cosine similarity below
+--min-cosine, or if the top-1 neighbour of any query changes. Run after
+export_onnx.py (the Dockerfile does this, so a bad export fails the build):
+    python check_onnx_parity.py --onnx-dir /app/onnx-model
+"""
+import argparse
+import sys
+import time
+import numpy as np
+from onnx_backend import OnnxEncoder
+
+SENTENCES = [
+    "What is the total amount due on the invoice?",
+    "Payment is due within 30 days of the invoice date.",
+    "The contract renews automatically unless either party gives notice.",
+    "Termination requires ninety days written notice to the supplier.",
+    "Shipping address: 100 Main Street, Springfield.",
+    "All amounts are stated in US dollars unless otherwise noted.",
+    "The vendor warrants that the services will be performed in a professional manner.",
+    "Quarterly revenue grew by 12 percent compared to the previous year.",
+    "Please sign and return the approved purchase order.",
+    "Confidential information must not be disclosed to third parties.",
+    "hello",
+    "Liability is limited to the fees paid in the twelve months preceding the claim. " * 20,
+]
+
+
+def timed_encode(encode, texts, repeats):
+    encode(texts)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        embeddings = encode(texts)
+    return np.asarray(embeddings, dtype=np.float32), (time.perf_counter() - start) * 1000 / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help="SentenceTransformer name or local path.")
+    parser.add_argument('--onnx-dir', required=True, help="Directory written by export_onnx.py.")
+    parser.add_argument('--min-cosine', type=float, default=0.98, help="Lowest acceptable per-sentence cosine similarity.")
+    parser.add_argument('--repeats', type=int, default=5, help="Timed repetitions per backend.")
+    args = parser.parse_args()
+
+    from sentence_transformers import SentenceTransformer
+    reference_model = SentenceTransformer(args.model, device='cpu')
+    onnx_model = OnnxEncoder(args.onnx_dir)
+
+    reference, torch_ms = timed_encode(lambda t: reference_model.encode(t, convert_to_numpy=True), SENTENCES, args.repeats)
+    candidate, onnx_ms = timed_encode(lambda t: onnx_model.encode(t), SENTENCES, args.repeats)
+
+    cosine = np.sum(reference * candidate, axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+    top1_reference = np.argsort(-(reference @ reference.T), axis=1)[:, 1]
+    top1_candidate = np.argsort(-(candidate @ candidate.T), axis=1)[:, 1]
+    top1_agreement = float(np.mean(top1_reference == top1_candidate))
+
+    print(f"cosine similarity: min {cosine.min():.5f}, mean {cosine.mean():.5f}")
+    print(f"top-1 neighbour agreement: {top1_agreement:.0%}")
+    print(f"latency for {len(SENTENCES)} sentences: torch {torch_ms:.1f} ms, onnx {onnx_ms:.1f} ms "
+          f"({torch_ms / onnx_ms:.2f}x)")
+
+    if cosine.min() < args.min_cosine or top1_agreement < 1.0:
+        print("FAILED: ONNX embeddings diverge from the PyTorch model.")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""
+Exports all-MiniLM-L6-v2 to an int8-quantized ONNX model for EMBEDDING_BACKEND=onnx.
+
+Run at image build time (see Dockerfile):
+    python export_onnx.py --output /app/onnx-model
+"""
+import argparse
+from onnx_backend import export_onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='all-MiniLM-L6-v2', help="SentenceTransformer name or local path.")
+    parser.add_argument('--output', required=True, help="Directory to write the ONNX model and tokenizer to.")
+    parser.add_argument('--no-quantize', action='store_true', help="Keep the fp32 graph instead of quantizing to int8.")
+    parser.add_argument('--keep-fp32', action='store_true', help="Also keep the fp32 graph next to the int8 one.")
+    args = parser.parse_args()
+
+    path = export_onnx(args.model, args.output, quantize=not args.no_quantize, keep_fp32=args.keep_fp32)
+    print(f"Exported {args.model} to {path}")
+
+
+if __name__ == '__main__':
+    main()
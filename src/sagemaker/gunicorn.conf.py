@@ -0,0 +1,88 @@
+"""
+gunicorn settings for the model server (see serve).
+
+The model is loaded once in the master (preload_app + app:create_app()) and
+shared copy-on-write by the forked workers. Worker, thread and torch thread
+counts are derived from the container's CPU and memory limits unless set
+explicitly through the environment.
+"""
+import os
+
+# Memory budget: the shared model is paid once, every worker adds its own
+# interpreter, torch runtime and activation buffers on top.
+MODEL_MEMORY_MB = int(os.environ.get('MODEL_MEMORY_MB', '400'))
+WORKER_MEMORY_MB = int(os.environ.get('WORKER_MEMORY_MB', '350'))
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit():
+    """
+    Returns the number of CPUs available to the container, honouring cgroup quotas.
+    """
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = None
+    cpu_max = _read_first_line('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>"
+    if cpu_max and not cpu_max.startswith('max'):
+        limit, period = cpu_max.split()
+        quota = int(limit) / int(period)
+    else:
+        limit = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')  # cgroup v1
+        period = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if limit and period and int(limit) > 0:
+            quota = int(limit) / int(period)
+    if quota:
+        cpus = min(cpus, max(1, int(quota)))
+    return max(1, cpus)
+
+
+def memory_limit_mb():
+    """
+    Returns the memory available to the container in MB, honouring cgroup limits.
+    """
+    total = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read_first_line(path)
+        if value and value.isdigit():
+            total = min(total, int(value))
+    return total // (1024 * 1024)
+
+
+CPUS = cpu_limit()
+MEMORY_MB = memory_limit_mb()
+
+_workers_by_memory = max(1, (MEMORY_MB - MODEL_MEMORY_MB) // WORKER_MEMORY_MB)
+workers = int(os.environ.get('MODEL_SERVER_WORKERS', min(CPUS, _workers_by_memory)))
+
+# Extra threads per worker only feed the dynamic batcher; encoding itself
+# runs on the intra-op threads below (torch or ONNX Runtime), split evenly
+# between workers.
+worker_class = 'gthread'
+threads = int(os.environ.get('MODEL_SERVER_THREADS', '8'))
+TORCH_NUM_THREADS = int(os.environ.get('TORCH_NUM_THREADS', max(1, CPUS // workers)))
+
+bind = f"0.0.0.0:{os.environ.get('SAGEMAKER_BIND_TO_PORT', '8080')}"
+preload_app = True
+timeout = int(os.environ.get('MODEL_SERVER_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+accesslog = None
+errorlog = '-'
+
+
+def when_ready(server):
+    server.log.info(f"Model server: {workers} workers x {threads} threads, {TORCH_NUM_THREADS} inference "
+                    f"threads per worker ({CPUS} CPUs, {MEMORY_MB} MB).")
+
+
+def post_worker_init(worker):
+    # Runs in each worker after the fork and before it accepts requests:
+    # threads (the batcher) and the inference thread pools must not be created in the master.
+    import app as model_server
+    model_server.init_worker(TORCH_NUM_THREADS)
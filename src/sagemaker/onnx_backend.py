@@ -0,0 +1,149 @@
+"""
+ONNX Runtime backend for the embedding model.
+
+export_onnx() converts the SentenceTransformer's transformer to ONNX and applies
+int8 dynamic quantization; OnnxEncoder runs the result on CPU and reproduces the
+SentenceTransformer post-processing (mean pooling over the attention mask, then
+L2 normalization), so both backends return the same (n, 384) float32 arrays.
+"""
+import json
+import os
+import numpy as np
+
+ONNX_MODEL_FILE = 'model.int8.onnx'
+ONNX_FP32_MODEL_FILE = 'model.onnx'
+ONNX_CONFIG_FILE = 'encoder_config.json'
+
+
+def export_onnx(model_name_or_path, output_dir, quantize=True, keep_fp32=False, opset_version=14):
+    """
+    Exports a SentenceTransformer model to output_dir (needs torch, onnx and onnxruntime).
+
+    Writes the (quantized) ONNX graph, the tokenizer files and the pooling settings
+    OnnxEncoder needs. Returns the path of the model OnnxEncoder will load.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(output_dir, exist_ok=True)
+    sentence_model = SentenceTransformer(model_name_or_path, device='cpu')
+    transformer = sentence_model[0].auto_model.eval()
+    tokenizer = sentence_model.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["An example sentence to trace the graph."], return_tensors='pt')
+    input_names = [name for name in ('input_ids', 'attention_mask', 'token_type_ids') if name in sample]
+    dynamic_axes = {name: {0: 'batch', 1: 'sequence'} for name in input_names}
+    dynamic_axes['last_hidden_state'] = {0: 'batch', 1: 'sequence'}
+    fp32_path = os.path.join(output_dir, ONNX_FP32_MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in input_names),
+            fp32_path,
+            input_names=input_names,
+            output_names=['last_hidden_state'],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset_version,
+            do_constant_folding=True,
+        )
+
+    model_path = fp32_path
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        model_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+        quantize_dynamic(fp32_path, model_path, weight_type=QuantType.QInt8)
+        if not keep_fp32:
+            os.remove(fp32_path)
+
+    normalize = any(type(module).__name__ == 'Normalize' for module in sentence_model)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), 'w') as f:
+        json.dump({
+            'model_file': os.path.basename(model_path),
+            'max_seq_length': sentence_model.max_seq_length,
+            'dimension': sentence_model.get_sentence_embedding_dimension(),
+            'normalize': normalize,
+        }, f, indent=2)
+    return model_path
+
+
+class OnnxEncoder:
+    """
+    Drop-in replacement for SentenceTransformer.encode backed by ONNX Runtime.
+
+    The model file is read when the encoder is created, but the inference session
+    (and its thread pool) is only created by start() or the first encode() call,
+    so a pre-fork server can load the encoder in the master and start it per worker.
+    """
+
+    def __init__(self, model_dir, batch_size=32):
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        with open(os.path.join(model_dir, self.config['model_file']), 'rb') as f:
+            self._model_bytes = f.read()
+        self.max_seq_length = self.config['max_seq_length']
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, 'tokenizer.json'))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.no_padding()
+        self.session = None
+        self._input_names = None
+
+    def start(self, intra_op_threads=None):
+        """
+        Creates the ONNX Runtime session, optionally pinning its intra-op thread count.
+        """
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.inter_op_num_threads = 1
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.session = ort.InferenceSession(self._model_bytes, options, providers=['CPUExecutionProvider'])
+        self._input_names = {node.name for node in self.session.get_inputs()}
+        return self
+
+    def get_sentence_embedding_dimension(self):
+        return self.config['dimension']
+
+    def encode(self, sentences, convert_to_numpy=True, batch_size=None, **kwargs):
+        """
+        Returns a (len(sentences), dimension) float32 array (a 1-D vector for a single string).
+        """
+        if self.session is None:
+            self.start()
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batch_size = batch_size or self.batch_size
+        encodings = self.tokenizer.encode_batch(texts)
+
+        # Batch texts of similar length together to keep padding small.
+        order = sorted(range(len(texts)), key=lambda i: len(encodings[i].ids))
+        output = np.empty((len(texts), self.config['dimension']), dtype=np.float32)
+        for start in range(0, len(order), batch_size):
+            indices = order[start:start + batch_size]
+            output[indices] = self._encode_batch([encodings[i] for i in indices])
+        return output[0] if single else output
+
+    def _encode_batch(self, encodings):
+        length = max(len(encoding.ids) for encoding in encodings)
+        input_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+        token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+        for row, encoding in enumerate(encodings):
+            n = len(encoding.ids)
+            input_ids[row, :n] = encoding.ids
+            attention_mask[row, :n] = encoding.attention_mask
+            token_type_ids[row, :n] = encoding.type_ids
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': token_type_ids}
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self._input_names})[0]
+
+        # Mean pooling over real tokens, as in SentenceTransformer's Pooling module.
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config.get('normalize', True):
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32, copy=False)
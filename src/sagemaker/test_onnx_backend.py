@@ -0,0 +1,93 @@
+"""
+Checks OnnxEncoder's pooling and normalization against a NumPy reference on
+fixed hidden states, with the ONNX session and tokenizer stubbed out. The
+full-model comparison with SentenceTransformer is check_onnx_parity.py.
+
+    cd src/sagemaker && python -m pytest -q test_onnx_backend.py
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+from onnx_backend import OnnxEncoder
+
+DIMENSION = 8
+
+
+class FixedSession:
+    """
+    Stands in for the ONNX Runtime session: returns the given hidden states
+    (cut to the padded batch length) and records the feeds it was run with.
+    """
+
+    def __init__(self, hidden):
+        self.hidden = hidden
+        self.feeds = None
+
+    def run(self, output_names, feeds):
+        self.feeds = feeds
+        return [self.hidden[:, :feeds['input_ids'].shape[1]]]
+
+
+def make_encoder(hidden, normalize=True, input_names=('input_ids', 'attention_mask', 'token_type_ids')):
+    encoder = OnnxEncoder.__new__(OnnxEncoder)
+    encoder.config = {'dimension': DIMENSION, 'normalize': normalize}
+    encoder.session = FixedSession(hidden)
+    encoder._input_names = set(input_names)
+    return encoder
+
+
+def make_encodings(lengths):
+    return [SimpleNamespace(ids=list(range(100, 100 + n)), attention_mask=[1] * n, type_ids=[0] * n)
+            for n in lengths]
+
+
+def reference_embeddings(hidden, lengths, normalize=True):
+    rows = []
+    for row, n in enumerate(lengths):
+        pooled = hidden[row, :n].astype(np.float64).mean(axis=0)
+        if normalize:
+            pooled = pooled / np.linalg.norm(pooled)
+        rows.append(pooled)
+    return np.asarray(rows)
+
+
+def test_mean_pooling_ignores_padding_and_normalizes():
+    lengths = [5, 2, 7]
+    hidden = np.random.default_rng(0).standard_normal((len(lengths), max(lengths), DIMENSION)).astype(np.float32)
+    # Padding positions must not leak into the mean, whatever the model returns there.
+    for row, n in enumerate(lengths):
+        hidden[row, n:] = 1e6
+    encoder = make_encoder(hidden)
+
+    embeddings = encoder._encode_batch(make_encodings(lengths))
+
+    assert embeddings.dtype == np.float32
+    assert embeddings.shape == (len(lengths), DIMENSION)
+    np.testing.assert_allclose(embeddings, reference_embeddings(hidden, lengths), rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(np.linalg.norm(embeddings, axis=1), 1.0, rtol=1e-5)
+
+
+def test_pooling_without_normalization():
+    lengths = [3, 4]
+    hidden = np.random.default_rng(1).standard_normal((len(lengths), max(lengths), DIMENSION)).astype(np.float32)
+    encoder = make_encoder(hidden, normalize=False)
+
+    embeddings = encoder._encode_batch(make_encodings(lengths))
+
+    np.testing.assert_allclose(embeddings, reference_embeddings(hidden, lengths, normalize=False),
+                               rtol=1e-5, atol=1e-6)
+
+
+def test_feeds_are_padded_and_limited_to_model_inputs():
+    lengths = [1, 3]
+    hidden = np.ones((len(lengths), max(lengths), DIMENSION), dtype=np.float32)
+    encoder = make_encoder(hidden, input_names=('input_ids', 'attention_mask'))
+
+    encoder._encode_batch(make_encodings(lengths))
+
+    feeds = encoder.session.feeds
+    assert set(feeds) == {'input_ids', 'attention_mask'}
+    np.testing.assert_array_equal(feeds['attention_mask'], [[1, 0, 0], [1, 1, 1]])
+    np.testing.assert_array_equal(feeds['input_ids'], [[100, 0, 0], [100, 101, 102]])
+    assert feeds['input_ids'].dtype == np.int64
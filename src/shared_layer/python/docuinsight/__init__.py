@@ -0,0 +1,3 @@
+"""
+Modules shared by the DocuInsight Lambdas (shipped as a Lambda layer) and the model server.
+"""
@@ -0,0 +1,121 @@
+"""
+AWS and OpenSearch clients shared by every module of a Lambda container.
+
+Each client is created once per container and reused by all invocations and
+worker threads (boto3 clients and the OpenSearch connection pool are
+thread-safe once created), so a warm handler neither repeats the TLS
+handshake nor looks up credentials on its hot path:
+
+    get_client('s3')                        pooled boto3 client, adaptive retries, TCP keep-alive
+    get_awsauth(region, 'es')               SigV4 auth that follows credential refreshes
+    get_opensearch_client(host, region)     pooled OpenSearch client for a domain endpoint
+
+opensearch-py and requests-aws4auth are imported on first use, so Lambdas that
+only need boto3 (the orchestrator) do not have to package them.
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+# boto3 connection pool per client. botocore's default of 10 is below what the
+# processor's worker threads and embedding batches use at once.
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+# Same variables botocore reads, with adaptive retries (client-side rate limiting
+# on throttling errors) as the default instead of 'legacy'.
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'adaptive')
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '5'))
+
+# OpenSearch connection pool; one connection per concurrent request.
+OPENSEARCH_POOL_MAXSIZE = int(os.environ.get('OPENSEARCH_POOL_MAXSIZE', '10'))
+OPENSEARCH_TIMEOUT_SECONDS = int(os.environ.get('OPENSEARCH_TIMEOUT_SECONDS', '30'))
+
+_lock = threading.Lock()
+_clients = {}
+_auths = {}
+_opensearch_clients = {}
+
+
+def client_config(**overrides):
+    """
+    Returns the botocore Config every shared client is created with.
+    """
+    options = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'retries': {'mode': AWS_RETRY_MODE, 'total_max_attempts': AWS_MAX_ATTEMPTS},
+        'tcp_keepalive': True,
+    }
+    options.update(overrides)
+    return Config(**options)
+
+
+def get_client(service_name, region_name=None):
+    """
+    Returns the container-wide boto3 client for a service (and region), creating it on first use.
+    """
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is None:
+        # boto3's default session is not thread-safe while it creates clients.
+        with _lock:
+            client = _clients.get(key)
+            if client is None:
+                client = boto3.client(service_name, region_name=region_name, config=client_config())
+                _clients[key] = client
+    return client
+
+
+def get_awsauth(region, service):
+    """
+    Returns the container-wide AWS4Auth for a region and service.
+
+    The auth holds the session's refreshable credentials rather than a copy of
+    the keys, so requests are still signed correctly after the temporary
+    credentials rotate.
+    """
+    key = (region, service)
+    auth = _auths.get(key)
+    if auth is None:
+        from requests_aws4auth import AWS4Auth
+        with _lock:
+            auth = _auths.get(key)
+            if auth is None:
+                auth = AWS4Auth(refreshable_credentials=boto3.Session().get_credentials(),
+                                region=region, service=service)
+                _auths[key] = auth
+    return auth
+
+
+def get_opensearch_client(host, region, pool_maxsize=None, timeout=None):
+    """
+    Returns the container-wide OpenSearch client for a domain endpoint (host name
+    without scheme), creating it on first use. Its connection pool keeps TLS
+    connections open between requests and invocations.
+
+    pool_maxsize and timeout default to OPENSEARCH_POOL_MAXSIZE and
+    OPENSEARCH_TIMEOUT_SECONDS. Clients are cached per host, region, pool size
+    and timeout, so a caller asking for different settings never gets a client
+    created with someone else's.
+    """
+    pool_maxsize = pool_maxsize or OPENSEARCH_POOL_MAXSIZE
+    timeout = timeout or OPENSEARCH_TIMEOUT_SECONDS
+    key = (host, region, pool_maxsize, timeout)
+    client = _opensearch_clients.get(key)
+    if client is None:
+        from opensearchpy import OpenSearch, RequestsHttpConnection
+        auth = get_awsauth(region, 'es')
+        with _lock:
+            client = _opensearch_clients.get(key)
+            if client is None:
+                client = OpenSearch(
+                    hosts=[{'host': host, 'port': 443}],
+                    http_auth=auth,
+                    use_ssl=True,
+                    verify_certs=True,
+                    connection_class=RequestsHttpConnection,
+                    pool_maxsize=pool_maxsize,
+                    timeout=timeout
+                )
+                _opensearch_clients[key] = client
+    return client
@@ -0,0 +1,34 @@
+"""
+Job tags of the page-range Textract fan-out.
+
+The orchestrator splits a large PDF into parts and starts one Textract job per
+part. Each job is tagged with the document it belongs to, the part index and
+the number of pages before the part; Textract echoes the tag in its completion
+notification, which is how the processor indexes a part as soon as it lands.
+"""
+
+JOB_TAG_PREFIX = 'fanout'
+# Textract job tags are limited to 64 characters ([a-zA-Z0-9_.\-:]+).
+MAX_JOB_TAG_LENGTH = 64
+
+
+def format_part_tag(document_id, part_index, page_offset):
+    tag = f"{JOB_TAG_PREFIX}:{document_id}:{part_index}:{page_offset}"
+    if len(tag) > MAX_JOB_TAG_LENGTH:
+        raise ValueError(f"Job tag '{tag}' is longer than {MAX_JOB_TAG_LENGTH} characters.")
+    return tag
+
+
+def parse_part_tag(tag):
+    """
+    Returns {'document_id', 'index', 'page_offset'} for a fan-out part's job tag, or None for any other tag.
+    """
+    if not tag:
+        return None
+    fields = tag.split(':')
+    if len(fields) != 4 or fields[0] != JOB_TAG_PREFIX:
+        return None
+    try:
+        return {'document_id': fields[1], 'index': int(fields[2]), 'page_offset': int(fields[3])}
+    except ValueError:
+        return None
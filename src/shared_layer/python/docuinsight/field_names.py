@@ -0,0 +1,22 @@
+"""
+Normalization of extracted form/table field names and values.
+
+The processor applies it to the keys, headers and values it indexes (see
+processor_lambda/structured.py) and the API handler to the names and values
+of /fields/ lookups, so both ends compare the same strings.
+"""
+import re
+
+
+def normalize_text(text):
+    """
+    Lowercases the text and collapses whitespace.
+    """
+    return " ".join(text.lower().split())
+
+
+def normalize_field_name(text):
+    """
+    Lowercases a key or header and drops the punctuation it is usually printed with ("Total Amount:" -> "total amount").
+    """
+    return normalize_text(re.sub(r'[:#*]+', ' ', text)).strip(' .')
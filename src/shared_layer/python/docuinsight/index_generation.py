@@ -0,0 +1,49 @@
+"""
+Index generation counter, used to version cached search results.
+
+The counter is a single item in the document metadata table. The processor
+bumps it after every successful index write (and the backfill after an alias
+swap); the API handler includes the current generation in its result cache
+keys, so a new ingest makes every older entry unreachable instead of waiting
+for a TTL.
+
+Writes are not searchable the moment the bulk request returns (OpenSearch
+refreshes every refresh_interval, the local vector store reloads every
+VECTOR_STORE_REFRESH_SECONDS), so updated_at records when the generation
+changed and readers hold off caching until it has settled.
+"""
+import time
+
+# Partition key of the counter item. It has no status or content_hash, so the
+# backfill scan and the orchestrator's content hash lookups never see it.
+INDEX_GENERATION_KEY = '__index_generation__'
+
+
+def bump_index_generation(client, table_name):
+    """
+    Increments the generation. Returns the new value.
+    """
+    response = client.update_item(
+        TableName=table_name,
+        Key={'document_id': {'S': INDEX_GENERATION_KEY}},
+        UpdateExpression='ADD generation :one SET updated_at = :now',
+        ExpressionAttributeValues={':one': {'N': '1'}, ':now': {'N': str(time.time())}},
+        ReturnValues='UPDATED_NEW'
+    )
+    return int(response['Attributes']['generation']['N'])
+
+
+def get_index_generation(client, table_name):
+    """
+    Returns (generation, updated_at epoch seconds); (0, 0.0) before the first bump.
+    """
+    response = client.get_item(
+        TableName=table_name,
+        Key={'document_id': {'S': INDEX_GENERATION_KEY}},
+        ProjectionExpression='generation, updated_at',
+        ConsistentRead=True
+    )
+    item = response.get('Item')
+    if not item:
+        return 0, 0.0
+    return int(item['generation']['N']), float(item.get('updated_at', {}).get('N', '0'))
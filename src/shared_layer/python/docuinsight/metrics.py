@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# CloudWatch Embedded Metric Format (EMF): one JSON log line per flush. Lambda
+# forwards stdout to CloudWatch Logs, which extracts the metrics automatically.
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'DocuInsight')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+EVENT_LOG_SAMPLE_RATE = float(os.environ.get('EVENT_LOG_SAMPLE_RATE', '0.01'))
+
+_cold_start = True
+_cold_start_lock = threading.Lock()
+
+
+def consume_cold_start():
+    """
+    Returns True the first time it is called in this process (the cold start), False afterwards.
+    """
+    global _cold_start
+    with _cold_start_lock:
+        cold, _cold_start = _cold_start, False
+    return cold
+
+
+class MetricsLogger:
+    """
+    Collects metrics for one unit of work (an invocation, a record, a batch)
+    and writes them as a single EMF record on flush().
+
+    Recording the same metric more than once keeps every value, which
+    CloudWatch aggregates into the same datapoint.
+    """
+
+    def __init__(self, service, namespace=None, stream=None, **dimensions):
+        self.namespace = namespace or METRICS_NAMESPACE
+        self.dimensions = {'Service': service, **dimensions}
+        self.stream = stream
+        self._metrics = {}
+        self._properties = {}
+        self._lock = threading.Lock()
+
+    def put_metric(self, name, value, unit='Milliseconds'):
+        with self._lock:
+            entry = self._metrics.setdefault(name, {'unit': unit, 'values': []})
+            entry['values'].append(value)
+
+    def set_property(self, name, value):
+        """
+        Adds a searchable, non-metric field (e.g. a job id) to the record.
+        """
+        with self._lock:
+            self._properties[name] = value
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Records the duration of the with block in milliseconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.put_metric(name, (time.perf_counter() - start) * 1000)
+
+    def timed_iter(self, name, iterable):
+        """
+        Yields from iterable, recording the total time spent producing items as one value.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield item
+        finally:
+            self.put_metric(name, elapsed * 1000)
+
+    def to_record(self):
+        with self._lock:
+            metrics = {name: dict(entry, values=list(entry['values'])) for name, entry in self._metrics.items()}
+            properties = dict(self._properties)
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [list(self.dimensions)],
+                    'Metrics': [{'Name': name, 'Unit': entry['unit']} for name, entry in metrics.items()],
+                }],
+            },
+            **self.dimensions,
+            **properties,
+        }
+        for name, entry in metrics.items():
+            values = entry['values']
+            record[name] = values[0] if len(values) == 1 else values
+        return record
+
+    def flush(self):
+        """
+        Writes the collected metrics as one EMF line and resets them.
+        """
+        if not METRICS_ENABLED or not self._metrics:
+            return
+        line = json.dumps(self.to_record(), default=str)
+        with self._lock:
+            self._metrics.clear()
+            self._properties.clear()
+        stream = self.stream or sys.stdout
+        stream.write(line + "\n")
+        stream.flush()
+
+
+def log_event(logger, event, message="Received event"):
+    """
+    Logs the full incoming event at DEBUG level for a sample of invocations.
+    The event is only serialized when DEBUG is enabled and the invocation is sampled.
+    """
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < EVENT_LOG_SAMPLE_RATE:
+        logger.debug("%s: %s", message, json.dumps(event, default=str))
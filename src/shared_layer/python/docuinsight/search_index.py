@@ -0,0 +1,257 @@
+"""
+OpenSearch chunk index definition and management.
+
+The Lambdas read and write OPENSEARCH_INDEX_NAME, which is normally an alias
+pointing at a versioned index (e.g. docuinsight-chunks-v3). A new index is
+built with create_index() and put live with swap_alias(), which moves the
+alias in a single atomic _aliases request.
+
+Vector settings (build_index_body):
+    engine          'faiss', 'nmslib' or 'lucene'; the search filters are applied
+                    inside the knn query, which needs faiss or lucene
+    space_type      'l2', 'innerproduct' or 'cosinesimil' (engine permitting)
+    m, ef_construction, ef_search
+                    HNSW graph degree, build-time and query-time candidate lists
+    data_type       'float' (default), 'fp16' (faiss scalar quantization, done by
+                    the engine) or 'byte' (int8 vectors sent by the client, see
+                    encode_vector)
+    source_vectors  keep the embedding in _source; turning it off makes the
+                    index smaller but vectors can no longer be read back
+
+The settings are also stored in the mapping's _meta so tools (and the byte
+encoding in the Lambdas) can read them back with get_index_config().
+
+Form key-value pairs and table cells extracted by the processor go to a
+separate, unaliased fields index (build_fields_index_body), one document per
+field, so field lookups are filtered term/range queries rather than kNN.
+"""
+import logging
+
+logger = logging.getLogger()
+
+EMBEDDING_DIMENSION = 384
+ENGINES = ('faiss', 'nmslib', 'lucene')
+SPACE_TYPES = {
+    'faiss': ('l2', 'innerproduct'),
+    'nmslib': ('l2', 'innerproduct', 'cosinesimil'),
+    'lucene': ('l2', 'innerproduct', 'cosinesimil'),
+}
+DATA_TYPES = ('float', 'fp16', 'byte')
+
+# Embedding components of unit vectors are small, so a byte encoding scales
+# them before rounding. 127 keeps every possible component in range.
+DEFAULT_BYTE_SCALE = 127.0
+
+DEFAULT_INDEX_CONFIG = {
+    'dimension': EMBEDDING_DIMENSION,
+    'engine': 'faiss',
+    'space_type': 'l2',
+    'm': 16,
+    'ef_construction': 128,
+    'ef_search': 100,
+    'data_type': 'float',
+    'byte_scale': DEFAULT_BYTE_SCALE,
+    'source_vectors': True,
+    'shards': 1,
+    'replicas': 1,
+}
+
+
+def validate_config(config):
+    """
+    Returns the complete index configuration (defaults filled in), raising ValueError for unsupported combinations.
+    """
+    unknown = set(config) - set(DEFAULT_INDEX_CONFIG)
+    if unknown:
+        raise ValueError(f"Unknown index settings: {', '.join(sorted(unknown))}")
+    config = {**DEFAULT_INDEX_CONFIG, **config}
+    engine = config['engine']
+    if engine not in ENGINES:
+        raise ValueError(f"engine must be one of: {', '.join(ENGINES)}")
+    if config['space_type'] not in SPACE_TYPES[engine]:
+        raise ValueError(f"space_type '{config['space_type']}' is not supported by {engine} "
+                         f"(supported: {', '.join(SPACE_TYPES[engine])})")
+    if config['data_type'] not in DATA_TYPES:
+        raise ValueError(f"data_type must be one of: {', '.join(DATA_TYPES)}")
+    if config['data_type'] == 'fp16' and engine != 'faiss':
+        raise ValueError("data_type 'fp16' needs the faiss engine")
+    if config['data_type'] == 'byte' and engine == 'nmslib':
+        raise ValueError("data_type 'byte' needs the faiss or lucene engine")
+    for name in ('dimension', 'm', 'ef_construction', 'ef_search', 'shards'):
+        if int(config[name]) < 1:
+            raise ValueError(f"{name} must be positive")
+    return config
+
+
+def build_index_body(config=None):
+    """
+    Returns the settings and mappings for a chunk index with the given vector configuration.
+    """
+    config = validate_config(config or {})
+    parameters = {'m': config['m'], 'ef_construction': config['ef_construction']}
+    if config['data_type'] == 'fp16':
+        parameters['encoder'] = {'name': 'sq', 'parameters': {'type': 'fp16'}}
+    embedding = {
+        'type': 'knn_vector',
+        'dimension': config['dimension'],
+        'method': {
+            'name': 'hnsw',
+            'engine': config['engine'],
+            'space_type': config['space_type'],
+            'parameters': parameters,
+        },
+    }
+    if config['data_type'] == 'byte':
+        embedding['data_type'] = 'byte'
+
+    index_settings = {
+        'knn': True,
+        'number_of_shards': config['shards'],
+        'number_of_replicas': config['replicas'],
+    }
+    # Lucene takes its candidate list size from the query's k instead.
+    if config['engine'] != 'lucene':
+        index_settings['knn.algo_param.ef_search'] = config['ef_search']
+
+    mappings = {
+        '_meta': {'docuinsight_index_config': config},
+        'properties': {
+            'document_id': {'type': 'keyword'},
+            'chunk_index': {'type': 'integer'},
+            'part_index': {'type': 'integer'},
+            'page_start': {'type': 'integer'},
+            'page_end': {'type': 'integer'},
+            'text_content': {'type': 'text'},
+            'embedding': embedding,
+            'timestamp': {'type': 'date'},
+        },
+    }
+    if not config['source_vectors']:
+        mappings['_source'] = {'excludes': ['embedding']}
+    return {'settings': {'index': index_settings}, 'mappings': mappings}
+
+
+def build_fields_index_body(shards=1, replicas=1):
+    """
+    Returns the body for the structured fields index: one document per form
+    key-value pair or table cell, with the value typed for exact and range filters.
+    """
+    return {
+        'settings': {'index': {'number_of_shards': shards, 'number_of_replicas': replicas}},
+        'mappings': {
+            'properties': {
+                'document_id': {'type': 'keyword'},
+                'part_index': {'type': 'integer'},
+                'source': {'type': 'keyword'},
+                'name': {'type': 'keyword'},
+                'label': {'type': 'text'},
+                'value': {'type': 'text'},
+                'value_type': {'type': 'keyword'},
+                'value_keyword': {'type': 'keyword'},
+                'value_number': {'type': 'double'},
+                'value_date': {'type': 'date', 'format': 'strict_date'},
+                'row_label': {'type': 'keyword'},
+                'table_index': {'type': 'integer'},
+                'row_index': {'type': 'integer'},
+                'column_index': {'type': 'integer'},
+                'page': {'type': 'integer'},
+                'confidence': {'type': 'float'},
+                'timestamp': {'type': 'date'},
+            },
+        },
+    }
+
+
+def encode_vector(vector, data_type='float', byte_scale=DEFAULT_BYTE_SCALE):
+    """
+    Converts an embedding (NumPy array or sequence) to the list sent to OpenSearch.
+    'byte' indices take integers in [-128, 127]; every other type takes floats.
+    """
+    values = vector.tolist() if hasattr(vector, 'tolist') else list(vector)
+    if data_type == 'byte':
+        return [max(-128, min(127, round(value * byte_scale))) for value in values]
+    return values
+
+
+def create_index(client, name, config=None):
+    """
+    Creates an index with build_index_body(config). Returns the complete configuration used.
+    """
+    config = validate_config(config or {})
+    client.indices.create(index=name, body=build_index_body(config))
+    logger.info(f"Created index '{name}' with {config}.")
+    return config
+
+
+def ensure_fields_index(client, name, shards=1, replicas=1):
+    """
+    Creates the structured fields index if it does not exist yet. Returns True if it was created.
+    """
+    if client.indices.exists(index=name):
+        return False
+    try:
+        client.indices.create(index=name, body=build_fields_index_body(shards, replicas))
+    except Exception as e:
+        # Another container created it first.
+        if 'resource_already_exists_exception' not in str(e):
+            raise
+        return False
+    logger.info(f"Created fields index '{name}'.")
+    return True
+
+
+def get_index_config(client, name):
+    """
+    Returns the configuration stored in the _meta of an index (or the index an alias points to),
+    or None for an index created without one.
+    """
+    mappings = client.indices.get_mapping(index=name)
+    for index_mappings in mappings.values():
+        meta = index_mappings.get('mappings', {}).get('_meta', {})
+        if 'docuinsight_index_config' in meta:
+            return meta['docuinsight_index_config']
+    return None
+
+
+def set_ef_search(client, name, ef_search):
+    """
+    Changes ef_search of a faiss or nmslib index in place; no reindex is needed.
+    """
+    client.indices.put_settings(index=name, body={'index': {'knn.algo_param.ef_search': ef_search}})
+
+
+def resolve_alias(client, alias):
+    """
+    Returns the indices an alias points to ([] if it does not exist; [alias] if it is a concrete index).
+    """
+    if client.indices.exists_alias(name=alias):
+        return sorted(client.indices.get_alias(name=alias))
+    if client.indices.exists(index=alias):
+        return [alias]
+    return []
+
+
+def swap_alias(client, alias, new_index, replace_index=False):
+    """
+    Points alias at new_index and away from every index it pointed to before, in one atomic request.
+
+    If alias is still a concrete index (e.g. the original 'index'), it can only be turned into an
+    alias by deleting that index in the same request; this requires replace_index=True.
+    Returns the indices the alias pointed to before.
+    """
+    actions = []
+    if client.indices.exists_alias(name=alias):
+        previous = sorted(client.indices.get_alias(name=alias))
+        actions.extend({'remove': {'index': index, 'alias': alias}} for index in previous if index != new_index)
+    elif client.indices.exists(index=alias):
+        if not replace_index:
+            raise ValueError(f"'{alias}' is a concrete index; pass replace_index=True to delete it "
+                             f"and replace it with an alias to '{new_index}'")
+        previous = [alias]
+        actions.append({'remove_index': {'index': alias}})
+    else:
+        previous = []
+    actions.append({'add': {'index': new_index, 'alias': alias}})
+    client.indices.update_aliases(body={'actions': actions})
+    logger.info(f"Alias '{alias}' now points to '{new_index}' (previously: {previous or 'none'}).")
+    return previous
@@ -0,0 +1,485 @@
+"""
+A small on-disk vector index for chunk embeddings, stored in S3 (or a local
+directory) and searched in-process with NumPy.
+
+Layout under the store prefix:
+
+    manifest.json                 current base generation and its settings
+    base-<generation>.npy         (rows, dimension) float16/float32 matrix
+    base-<generation>.meta.json   per-row metadata columns (id, document_id, ...)
+    base-<generation>.ivf.npz     optional IVF index: centroids and list offsets
+    segments/<job_id>.npz         one segment per processed document
+
+The processor appends a segment for every document (append_segment). Readers
+memory-map the base matrix and keep the (small) segments in memory, fetching
+only segments that are new or rewritten since their last refresh. compact()
+folds the segments into a new base generation and, above a size threshold,
+builds an IVF index whose lists are stored contiguously in the base matrix; the
+scheduled compaction Lambda (processor_lambda/compaction.py) runs it once
+enough segments have accumulated.
+
+Embeddings are unit-normalized, so the inner product is the cosine similarity.
+Scores are reported on OpenSearch's l2 scale, 1 / (1 + squared distance), so
+both search backends rank and score hits alike.
+"""
+import io
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+logger = logging.getLogger()
+
+MANIFEST_KEY = 'manifest.json'
+SEGMENTS_DIR = 'segments'
+METADATA_FIELDS = ('id', 'document_id', 'chunk_index', 'page_start', 'page_end', 'timestamp', 'preview')
+
+# Rows scored per matrix product; bounds the float32 copy made of float16 rows.
+SCORE_BLOCK_ROWS = 65536
+
+
+def utc_isoformat(value):
+    """
+    Returns an ISO 8601 date string as a UTC isoformat() string; dates without an
+    offset are taken as UTC, as OpenSearch does.
+    """
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc).isoformat()
+    return parsed.astimezone(timezone.utc).isoformat()
+
+
+class S3Storage:
+    """
+    Reads and writes store files as S3 objects under <bucket>/<prefix>/.
+    """
+
+    def __init__(self, bucket, prefix='vector-store', client=None):
+        if client is None:
+            from docuinsight.clients import get_client
+            client = get_client('s3')
+        self.bucket = bucket
+        self.prefix = prefix.strip('/')
+        self.client = client
+
+    def _key(self, name):
+        return f"{self.prefix}/{name}"
+
+    def list(self, directory):
+        names = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(directory) + '/'):
+            names.extend(obj['Key'][len(self.prefix) + 1:] for obj in page.get('Contents', []))
+        return names
+
+    def list_versions(self, directory):
+        """
+        Returns {name: version} for the files under directory; a rewritten file gets a new version.
+        """
+        versions = {}
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(directory) + '/'):
+            versions.update((obj['Key'][len(self.prefix) + 1:], obj['ETag']) for obj in page.get('Contents', []))
+        return versions
+
+    def get(self, name):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(name))['Body'].read()
+        except self.client.exceptions.NoSuchKey:
+            return None
+
+    def put(self, name, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(name), Body=data)
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def download(self, name, path):
+        self.client.download_file(self.bucket, self._key(name), path)
+
+
+class LocalStorage:
+    """
+    Keeps store files in a local directory (local runs and tests).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, name):
+        return os.path.join(self.directory, *name.split('/'))
+
+    def list(self, directory):
+        path = self._path(directory)
+        if not os.path.isdir(path):
+            return []
+        return [f"{directory}/{name}" for name in sorted(os.listdir(path))]
+
+    def list_versions(self, directory):
+        versions = {}
+        for name in self.list(directory):
+            try:
+                stat = os.stat(self._path(name))
+            except FileNotFoundError:
+                continue
+            versions[name] = f"{stat.st_mtime_ns}-{stat.st_size}"
+        return versions
+
+    def get(self, name):
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def delete(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+
+    def download(self, name, path):
+        with open(path, 'wb') as f:
+            f.write(self.get(name))
+
+
+def _segment_name(job_id):
+    return f"{SEGMENTS_DIR}/{job_id}.npz"
+
+
+def _encode_segment(embeddings, metadata):
+    buffer = io.BytesIO()
+    np.savez(buffer, embeddings=embeddings,
+             metadata=np.frombuffer(json.dumps(metadata).encode('utf-8'), dtype=np.uint8))
+    return buffer.getvalue()
+
+
+def _decode_segment(data):
+    with np.load(io.BytesIO(data), allow_pickle=False) as archive:
+        embeddings = archive['embeddings']
+        metadata = json.loads(archive['metadata'].tobytes().decode('utf-8'))
+    return embeddings, metadata
+
+
+def append_segment(storage, job_id, embeddings, metadata, dtype='float16'):
+    """
+    Writes the embeddings and metadata of one document as a segment.
+    Rewriting the same job id replaces its segment, so redelivered jobs do not duplicate rows.
+
+    Args:
+        embeddings (numpy.ndarray): (rows, dimension) unit-normalized embeddings.
+        metadata (dict[str, list]): One list per METADATA_FIELDS entry, rows long.
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.dtype(dtype).newbyteorder('<'))
+    missing = [field for field in METADATA_FIELDS if len(metadata.get(field, ())) != embeddings.shape[0]]
+    if missing:
+        raise ValueError(f"Metadata columns missing or of the wrong length: {', '.join(missing)}")
+    storage.put(_segment_name(job_id), _encode_segment(embeddings, {field: metadata[field] for field in METADATA_FIELDS}))
+
+
+def l2_scores(inner_products):
+    # For unit vectors the squared l2 distance is 2 - 2 * cosine.
+    return 1.0 / (3.0 - 2.0 * inner_products)
+
+
+def build_ivf(matrix, n_lists, iterations=10, sample_size=65536, seed=0):
+    """
+    Clusters the rows with k-means (on a sample) and assigns every row to its nearest centroid.
+    Returns (centroids, assignments).
+    """
+    rng = np.random.default_rng(seed)
+    rows = matrix.shape[0]
+    sample = matrix[rng.choice(rows, size=min(rows, sample_size), replace=False)].astype(np.float32)
+    centroids = sample[rng.choice(sample.shape[0], size=n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for j in range(n_lists):
+            members = sample[assignments == j]
+            if len(members):
+                centroid = members.mean(axis=0)
+                centroids[j] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    assignments = np.concatenate([
+        np.argmax(matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32) @ centroids.T, axis=1)
+        for start in range(0, rows, SCORE_BLOCK_ROWS)
+    ])
+    return centroids, assignments
+
+
+def compact(storage, dtype='float16', ivf_min_rows=50000, ivf_lists=None):
+    """
+    Merges the current base and all segments into a new base generation.
+
+    Later copies of a row id replace earlier ones. With at least ivf_min_rows
+    rows an IVF index is built and the rows are stored grouped by list.
+    Returns the new manifest.
+    """
+    manifest = json.loads(storage.get(MANIFEST_KEY) or b'{"generation": 0, "base": null}')
+    matrices, columns = [], {field: [] for field in METADATA_FIELDS}
+    if manifest.get('base'):
+        base = manifest['base']
+        matrices.append(np.load(io.BytesIO(storage.get(f"{base}.npy"))))
+        base_metadata = json.loads(storage.get(f"{base}.meta.json"))
+        for field in METADATA_FIELDS:
+            columns[field].extend(base_metadata[field])
+
+    segment_names = storage.list(SEGMENTS_DIR)
+    for name in segment_names:
+        data = storage.get(name)
+        if data is None:
+            continue
+        embeddings, metadata = _decode_segment(data)
+        matrices.append(embeddings)
+        for field in METADATA_FIELDS:
+            columns[field].extend(metadata[field])
+    if not matrices:
+        return manifest
+
+    matrix = np.concatenate([m.astype(dtype) for m in matrices]) if len(matrices) > 1 else matrices[0].astype(dtype)
+    # Keep the last occurrence of every id.
+    last_row = {row_id: i for i, row_id in enumerate(columns['id'])}
+    keep = np.asarray(sorted(last_row.values()), dtype=np.int64)
+    matrix = matrix[keep]
+    columns = {field: [values[i] for i in keep] for field, values in columns.items()}
+
+    generation = manifest.get('generation', 0) + 1
+    base = f"base-{generation:06d}"
+    ivf = None
+    if matrix.shape[0] >= ivf_min_rows:
+        n_lists = ivf_lists or max(1, int(4 * np.sqrt(matrix.shape[0])))
+        centroids, assignments = build_ivf(matrix, n_lists)
+        order = np.argsort(assignments, kind='stable')
+        matrix = matrix[order]
+        columns = {field: [values[i] for i in order] for field, values in columns.items()}
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=n_lists))])
+        buffer = io.BytesIO()
+        np.savez(buffer, centroids=centroids, offsets=offsets)
+        storage.put(f"{base}.ivf.npz", buffer.getvalue())
+        ivf = {'lists': n_lists}
+
+    buffer = io.BytesIO()
+    np.save(buffer, np.ascontiguousarray(matrix))
+    storage.put(f"{base}.npy", buffer.getvalue())
+    storage.put(f"{base}.meta.json", json.dumps(columns).encode('utf-8'))
+    manifest = {
+        'generation': generation,
+        'base': base,
+        'rows': int(matrix.shape[0]),
+        'dimension': int(matrix.shape[1]),
+        'dtype': str(matrix.dtype),
+        'ivf': ivf,
+        'merged_segments': len(segment_names),
+        'created_at': time.time(),
+    }
+    storage.put(MANIFEST_KEY, json.dumps(manifest).encode('utf-8'))
+    # Segments are removed only after the manifest that covers them is published.
+    for name in segment_names:
+        storage.delete(name)
+    logger.info(f"Compacted {len(segment_names)} segments into {base} ({matrix.shape[0]} rows, ivf={ivf}).")
+    return manifest
+
+
+class _Block:
+    """
+    One searchable block of rows (the base or the in-memory segments) with its metadata columns.
+    """
+
+    def __init__(self, matrix, metadata, ivf=None):
+        self.matrix = matrix
+        self.metadata = metadata
+        self.ids = metadata['id']
+        self.document_ids = np.asarray(metadata['document_id'], dtype=object)
+        self.timestamps = np.asarray([str(value) for value in metadata['timestamp']])
+        self.active = np.ones(matrix.shape[0], dtype=bool)
+        self.centroids, self.offsets = ivf if ivf is not None else (None, None)
+
+    def filter_mask(self, rows, filters):
+        mask = self.active[rows].copy()
+        if filters.get('document_id'):
+            mask &= np.isin(self.document_ids[rows], filters['document_id'])
+        # Timestamps are stored as UTC isoformat() strings, which order like the datetimes
+        # they encode once the bounds are in UTC too.
+        if filters.get('date_from'):
+            mask &= self.timestamps[rows] >= utc_isoformat(filters['date_from'])
+        if filters.get('date_to'):
+            mask &= self.timestamps[rows] <= utc_isoformat(filters['date_to'])
+        return mask
+
+    def candidate_rows(self, vector, n_probe):
+        if self.centroids is None:
+            return None
+        lists = np.argsort(-(self.centroids @ vector))[:n_probe]
+        return np.concatenate([np.arange(self.offsets[j], self.offsets[j + 1]) for j in lists])
+
+    def top_k(self, vector, k, filters, n_probe):
+        """
+        Returns (row indices, inner products) of the best k rows that pass the filters.
+        """
+        rows = self.candidate_rows(vector, n_probe)
+        if rows is None:
+            scores = np.concatenate([
+                self.matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32, copy=False) @ vector
+                for start in range(0, self.matrix.shape[0], SCORE_BLOCK_ROWS)
+            ]) if self.matrix.shape[0] else np.empty(0, dtype=np.float32)
+            rows = np.arange(self.matrix.shape[0])
+        else:
+            scores = self.matrix[rows].astype(np.float32, copy=False) @ vector
+        mask = self.filter_mask(rows, filters)
+        rows, scores = rows[mask], scores[mask]
+        if len(rows) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[best], scores[best]
+        return rows, scores
+
+
+class VectorStoreReader:
+    """
+    Loads the store for searching: the base matrix is memory-mapped from a
+    local copy, segments are held in memory. refresh() picks up new segments
+    and base generations at most every refresh_seconds.
+    """
+
+    def __init__(self, storage, cache_dir='/tmp/vector-store', refresh_seconds=60, n_probe=8):
+        self.storage = storage
+        self.cache_dir = cache_dir
+        self.refresh_seconds = refresh_seconds
+        self.n_probe = n_probe
+        self.generation = None
+        self.base = None
+        self.segments = None
+        self.segment_versions = {}
+        # Decoded segments by name: (version, float32 embeddings, metadata).
+        self._segment_cache = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load_base(self, manifest):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        name = manifest['base']
+        path = os.path.join(self.cache_dir, f"{name}.npy")
+        matrix = np.load(path, mmap_mode='r') if os.path.exists(path) else None
+        # A copy left by an earlier store with the same generation name is replaced.
+        if matrix is None or matrix.shape != (manifest['rows'], manifest['dimension']):
+            self.storage.download(f"{name}.npy", path + '.tmp')
+            os.replace(path + '.tmp', path)
+            matrix = np.load(path, mmap_mode='r')
+        metadata = json.loads(self.storage.get(f"{name}.meta.json"))
+        ivf = None
+        if manifest.get('ivf'):
+            with np.load(io.BytesIO(self.storage.get(f"{name}.ivf.npz"))) as archive:
+                ivf = (archive['centroids'].astype(np.float32), archive['offsets'])
+        return _Block(matrix, metadata, ivf)
+
+    def _load_segments(self, versions):
+        """
+        Returns the block of all listed segments. Only segments that are not
+        cached with the same version are downloaded; the cache drops the rest.
+        """
+        cache = {}
+        fetched = 0
+        for name in sorted(versions):
+            cached = self._segment_cache.get(name)
+            if cached is None or cached[0] != versions[name]:
+                data = self.storage.get(name)
+                if data is None:
+                    continue
+                embeddings, metadata = _decode_segment(data)
+                cached = (versions[name], embeddings.astype(np.float32), metadata)
+                fetched += 1
+            cache[name] = cached
+        self._segment_cache = cache
+        if fetched:
+            logger.info(f"Fetched {fetched} of {len(cache)} vector store segments.")
+        if not cache:
+            return None
+        columns = {field: [value for _, _, metadata in cache.values() for value in metadata[field]]
+                   for field in METADATA_FIELDS}
+        return _Block(np.concatenate([embeddings for _, embeddings, _ in cache.values()]), columns)
+
+    def refresh(self, force=False):
+        """
+        Reloads the manifest and segment list if refresh_seconds have passed.
+        Returns True if the searchable data changed.
+        """
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.refresh_seconds:
+            return False
+        with self._lock:
+            if not force and now - self._checked_at < self.refresh_seconds:
+                return False
+            self._checked_at = now
+            manifest = json.loads(self.storage.get(MANIFEST_KEY) or b'{"generation": 0, "base": null}')
+            # A segment listed here that compact() has already merged is harmless:
+            # its rows replace the identical base rows.
+            versions = self.storage.list_versions(SEGMENTS_DIR)
+            if manifest.get('generation') == self.generation and versions == self.segment_versions:
+                return False
+
+            base = self.base
+            if manifest.get('generation') != self.generation:
+                base = self._load_base(manifest) if manifest.get('base') else None
+            segments = self._load_segments(versions)
+            if base is not None:
+                # Rows re-written by a newer segment are served from the segment. The
+                # mask is built anew and swapped in: concurrent searches may be reading
+                # the current one.
+                if segments is not None:
+                    replaced = set(segments.ids)
+                    base.active = np.asarray([row_id not in replaced for row_id in base.ids], dtype=bool)
+                else:
+                    base.active = np.ones(base.matrix.shape[0], dtype=bool)
+            self.base, self.segments = base, segments
+            self.generation, self.segment_versions = manifest.get('generation'), versions
+            logger.info(f"Vector store loaded: generation {self.generation}, {len(versions)} segments, "
+                        f"{self.row_count()} rows.")
+            return True
+
+    def row_count(self):
+        return sum(block.matrix.shape[0] for block in (self.base, self.segments) if block is not None)
+
+    def search(self, vector, k, filters=None):
+        """
+        Returns up to k hits, best first, as dicts with the metadata fields and an l2-scale 'score'.
+        """
+        self.refresh()
+        vector = np.asarray(vector, dtype=np.float32)
+        filters = filters or {}
+        candidates = []
+        for block in (self.base, self.segments):
+            if block is None:
+                continue
+            rows, scores = block.top_k(vector, k, filters, self.n_probe)
+            candidates.extend((float(score), block, int(row)) for row, score in zip(rows, scores))
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        hits = []
+        for inner_product, block, row in candidates[:k]:
+            hit = {field: block.metadata[field][row] for field in METADATA_FIELDS}
+            hit['score'] = float(l2_scores(inner_product))
+            hits.append(hit)
+        return hits
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compact the vector store's segments into a new base generation.")
+    parser.add_argument('command', choices=['compact'])
+    parser.add_argument('--bucket', help="S3 bucket of the store (omit to use --directory).")
+    parser.add_argument('--prefix', default='vector-store')
+    parser.add_argument('--directory', help="Local store directory.")
+    parser.add_argument('--dtype', choices=['float16', 'float32'], default='float16')
+    parser.add_argument('--ivf-min-rows', type=int, default=50000)
+    parser.add_argument('--ivf-lists', type=int)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    store = S3Storage(args.bucket, args.prefix) if args.bucket else LocalStorage(args.directory)
+    print(json.dumps(compact(store, args.dtype, args.ivf_min_rows, args.ivf_lists), indent=2))
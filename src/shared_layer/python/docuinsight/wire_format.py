@@ -0,0 +1,80 @@
+"""
+Embedding wire formats of the model server's /invocations responses.
+
+The model server encodes with encode_embeddings(); the processor and API
+handler Lambdas decode with decode_embeddings(), so both ends of the
+protocol are defined here.
+"""
+import io
+import json
+import struct
+import numpy as np
+
+# Content types understood by /invocations (selected through the Accept header).
+JSON_CONTENT_TYPE = 'application/json'
+FLOAT32_CONTENT_TYPE = 'application/x-embeddings-f32'
+FLOAT16_CONTENT_TYPE = 'application/x-embeddings-f16'
+NPY_CONTENT_TYPE = 'application/x-npy'
+
+# JSON is listed first so that "*/*" and missing Accept headers keep the old behaviour.
+SUPPORTED_ACCEPT_TYPES = [JSON_CONTENT_TYPE, FLOAT32_CONTENT_TYPE, FLOAT16_CONTENT_TYPE, NPY_CONTENT_TYPE]
+
+# Raw formats start with a 16 byte little-endian header:
+#   magic (4s) | version (uint16) | bytes per value (uint16) | rows (uint32) | dimension (uint32)
+# followed by rows * dimension little-endian floats. 16 bytes keeps the payload aligned.
+HEADER_FORMAT = '<4sHHII'
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+MAGIC = b'EMBD'
+VERSION = 1
+
+
+def encode_embeddings(embeddings, accept):
+    """
+    Serializes an embedding matrix for the given Accept content type.
+
+    Args:
+        embeddings (numpy.ndarray): A (rows, dimension) float array.
+        accept (str): One of SUPPORTED_ACCEPT_TYPES.
+
+    Returns:
+        tuple[bytes, str]: The response body and its content type.
+    """
+    embeddings = np.asarray(embeddings)
+    if embeddings.ndim == 1:
+        embeddings = embeddings.reshape(1, -1)
+
+    if accept in (FLOAT32_CONTENT_TYPE, FLOAT16_CONTENT_TYPE):
+        dtype = np.dtype('<f2') if accept == FLOAT16_CONTENT_TYPE else np.dtype('<f4')
+        rows, dimension = embeddings.shape
+        header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, dtype.itemsize, rows, dimension)
+        return header + np.ascontiguousarray(embeddings, dtype=dtype).tobytes(), accept
+
+    if accept == NPY_CONTENT_TYPE:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(embeddings, dtype='<f4'), allow_pickle=False)
+        return buffer.getvalue(), accept
+
+    return json.dumps({'embeddings': embeddings.tolist()}), JSON_CONTENT_TYPE
+
+
+def decode_embeddings(body, content_type):
+    """
+    Decodes an /invocations response into a (rows, dimension) NumPy array.
+    Binary formats are wrapped with np.frombuffer, so no copy of the payload is made.
+    """
+    content_type = (content_type or '').split(';')[0].strip()
+    if content_type in (FLOAT32_CONTENT_TYPE, FLOAT16_CONTENT_TYPE):
+        magic, _version, itemsize, rows, dimension = struct.unpack_from(HEADER_FORMAT, body)
+        if magic != MAGIC:
+            raise ValueError("Invalid embeddings payload header")
+        dtype = '<f2' if itemsize == 2 else '<f4'
+        return np.frombuffer(body, dtype=dtype, count=rows * dimension, offset=HEADER_SIZE).reshape(rows, dimension)
+    if content_type == NPY_CONTENT_TYPE:
+        stream = io.BytesIO(body)
+        if np.lib.format.read_magic(stream) == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        array = np.frombuffer(body, dtype=dtype, count=int(np.prod(shape)), offset=stream.tell())
+        return array.reshape(shape, order='F' if fortran_order else 'C')
+    return np.asarray(json.loads(body)['embeddings'], dtype=np.float32)